@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class CarrinhoConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'carrinho'
+
+    def ready(self):
+        from carrinho import armazenamento
+        armazenamento.conectar_sinais()
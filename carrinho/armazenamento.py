@@ -0,0 +1,266 @@
+# carrinho/armazenamento.py
+"""
+Onde o carrinho fica guardado.
+
+Dois backends com a mesma interface:
+- ArmazenamentoBanco: tabela ItemCarrinho por session_key (usuários logados e
+  modo CARRINHO_ARMAZENAMENTO='banco').
+- ArmazenamentoCookie: lista compacta e assinada num cookie próprio, sem
+  nenhuma consulta; usado por visitantes anônimos no modo 'cookie' (padrão).
+
+O carrinho do cookie vai para o banco no login (sinal user_logged_in) — e,
+como o checkout exige login, sempre antes de virar pedido. O cookie é gravado
+ou apagado na resposta pelo CarrinhoMiddleware.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import F, Sum
+
+NOME_COOKIE = 'carrinho'
+SALT_COOKIE = 'carrinho.armazenamento'
+IDADE_COOKIE = 60 * 60 * 24 * 30  # 30 dias
+MAXIMO_LINHAS = 50                # mantém o cookie bem abaixo de 4 KB
+
+ATRIBUTO_CARRINHO = '_carrinho'
+ATRIBUTO_COOKIE = '_carrinho_cookie'
+
+LinhaCarrinho = namedtuple('LinhaCarrinho', ['id', 'produto_id', 'variacao_id', 'quantidade', 'preco'])
+
+
+class CarrinhoCheio(Exception):
+    pass
+
+
+class ArmazenamentoBanco:
+    """Carrinho na tabela ItemCarrinho, chaveado pela sessão."""
+
+    def __init__(self, request):
+        self.request = request
+
+    @property
+    def session_key(self):
+        return self.request.session.session_key
+
+    def _chave_para_escrita(self):
+        if not self.request.session.session_key:
+            self.request.session.create()
+        return self.request.session.session_key
+
+    def _queryset(self):
+        from carrinho.models import ItemCarrinho
+        if not self.session_key:
+            return ItemCarrinho.objects.none()
+        return ItemCarrinho.objects.filter(session_key=self.session_key)
+
+    def itens(self):
+        return self._queryset().select_related('produto', 'variacao__produto')
+
+    def linhas(self):
+        return [
+            LinhaCarrinho(*valores) for valores in
+            self._queryset().values_list('id', 'produto_id', 'variacao_id', 'quantidade', 'preco')
+        ]
+
+    def obter(self, item_id):
+        return next((l for l in self.linhas() if l.id == item_id), None)
+
+    def encontrar(self, produto_id, variacao_id):
+        valores = self._queryset().filter(produto_id=produto_id, variacao_id=variacao_id).values_list(
+            'id', 'produto_id', 'variacao_id', 'quantidade', 'preco'
+        ).first()
+        return LinhaCarrinho(*valores) if valores else None
+
+    def definir(self, produto_id, variacao_id, quantidade, preco):
+        """Grava a linha do produto/variação com a quantidade e o preço informados."""
+        from carrinho.models import ItemCarrinho
+        ItemCarrinho.objects.update_or_create(
+            session_key=self._chave_para_escrita(),
+            produto_id=produto_id,
+            variacao_id=variacao_id,
+            defaults={'quantidade': quantidade, 'preco': preco},
+        )
+
+    def atualizar_quantidade(self, item_id, quantidade):
+        return self._queryset().filter(id=item_id).update(quantidade=quantidade) > 0
+
+    def remover(self, item_id):
+        return self._queryset().filter(id=item_id).delete()[0] > 0
+
+    def limpar(self):
+        self._queryset().delete()
+
+    def totais(self):
+        totais = self._queryset().aggregate(
+            subtotal=Sum(F('quantidade') * F('preco')),
+            total_itens=Sum('quantidade'),
+        )
+        return totais['total_itens'] or 0, totais['subtotal'] or Decimal('0.00')
+
+
+class ArmazenamentoCookie:
+    """
+    Carrinho num cookie assinado: {'n': próximo id, 'l': [[id, produto, variação, qtd, preço], ...]}.
+    Ler, somar e alterar não tocam no banco; só itens() carrega produtos e variações para exibição.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.modificado = False
+        self._dados = self._ler()
+
+    def _ler(self):
+        valor = self.request.COOKIES.get(NOME_COOKIE)
+        if valor:
+            try:
+                return signing.loads(valor, salt=SALT_COOKIE, max_age=IDADE_COOKIE)
+            except signing.BadSignature:
+                pass  # cookie adulterado ou vencido: carrinho vazio
+        return {'n': 1, 'l': []}
+
+    def itens(self):
+        """Instâncias (não salvas) de ItemCarrinho, com produto e variação já carregados."""
+        from carrinho.models import ItemCarrinho
+        from produtos.models import Produto, Variacao
+
+        linhas = self.linhas()
+        if not linhas:
+            return []
+        produtos = Produto.objects.in_bulk({l.produto_id for l in linhas})
+        variacoes = Variacao.objects.in_bulk({l.variacao_id for l in linhas if l.variacao_id})
+
+        itens = []
+        for linha in linhas:
+            produto = produtos.get(linha.produto_id)
+            if produto is None:
+                continue  # produto removido do catálogo depois de ir para o carrinho
+            variacao = variacoes.get(linha.variacao_id)
+            if variacao is not None and variacao.produto_id == produto.pk:
+                variacao.produto = produto  # evita uma consulta por item em str()/preço da variação
+            itens.append(ItemCarrinho(
+                id=linha.id, produto=produto, variacao=variacao,
+                quantidade=linha.quantidade, preco=linha.preco,
+            ))
+        return itens
+
+    def linhas(self):
+        return [
+            LinhaCarrinho(item_id, produto_id, variacao_id, quantidade, Decimal(preco))
+            for item_id, produto_id, variacao_id, quantidade, preco in self._dados['l']
+        ]
+
+    def obter(self, item_id):
+        return next((l for l in self.linhas() if l.id == item_id), None)
+
+    def encontrar(self, produto_id, variacao_id):
+        return next(
+            (l for l in self.linhas() if l.produto_id == produto_id and l.variacao_id == variacao_id),
+            None,
+        )
+
+    def definir(self, produto_id, variacao_id, quantidade, preco):
+        for linha in self._dados['l']:
+            if linha[1] == produto_id and linha[2] == variacao_id:
+                linha[3], linha[4] = quantidade, str(preco)
+                break
+        else:
+            if len(self._dados['l']) >= MAXIMO_LINHAS:
+                raise CarrinhoCheio(f"O carrinho aceita no máximo {MAXIMO_LINHAS} produtos diferentes.")
+            self._dados['l'].append([self._dados['n'], produto_id, variacao_id, quantidade, str(preco)])
+            self._dados['n'] += 1
+        self.modificado = True
+
+    def atualizar_quantidade(self, item_id, quantidade):
+        for linha in self._dados['l']:
+            if linha[0] == item_id:
+                linha[3] = quantidade
+                self.modificado = True
+                return True
+        return False
+
+    def remover(self, item_id):
+        restantes = [l for l in self._dados['l'] if l[0] != item_id]
+        if len(restantes) == len(self._dados['l']):
+            return False
+        self._dados['l'] = restantes
+        self.modificado = True
+        return True
+
+    def limpar(self):
+        if self._dados['l']:
+            self._dados = {'n': 1, 'l': []}
+            self.modificado = True
+
+    def totais(self):
+        linhas = self.linhas()
+        return (
+            sum(l.quantidade for l in linhas),
+            sum((l.preco * l.quantidade for l in linhas), Decimal('0.00')),
+        )
+
+    def gravar(self, response):
+        """Grava (ou apaga, se vazio) o cookie na resposta, caso o carrinho tenha mudado."""
+        if not self.modificado:
+            return
+        if self._dados['l']:
+            response.set_cookie(
+                NOME_COOKIE,
+                signing.dumps(self._dados, salt=SALT_COOKIE, compress=True),
+                max_age=IDADE_COOKIE,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite='Lax',
+            )
+        else:
+            response.delete_cookie(NOME_COOKIE, samesite='Lax')
+
+
+def carrinho_do_cookie(request):
+    armazenamento = getattr(request, ATRIBUTO_COOKIE, None)
+    if armazenamento is None:
+        armazenamento = ArmazenamentoCookie(request)
+        setattr(request, ATRIBUTO_COOKIE, armazenamento)
+    return armazenamento
+
+
+def obter_carrinho(request):
+    """Backend do carrinho desta requisição (memoizado): banco para logados, senão conforme o modo."""
+    armazenamento = getattr(request, ATRIBUTO_CARRINHO, None)
+    if armazenamento is None:
+        usuario = getattr(request, 'user', None)
+        logado = usuario is not None and usuario.is_authenticated
+        if logado or getattr(settings, 'CARRINHO_ARMAZENAMENTO', 'cookie') == 'banco':
+            armazenamento = ArmazenamentoBanco(request)
+        else:
+            armazenamento = carrinho_do_cookie(request)
+        setattr(request, ATRIBUTO_CARRINHO, armazenamento)
+    return armazenamento
+
+
+def migrar_para_banco(request):
+    """Soma o carrinho do cookie ao carrinho do banco e esvazia o cookie."""
+    if NOME_COOKIE not in request.COOKIES:
+        return 0
+    cookie = carrinho_do_cookie(request)
+    banco = ArmazenamentoBanco(request)
+    linhas = cookie.linhas()
+    for linha in linhas:
+        existente = banco.encontrar(linha.produto_id, linha.variacao_id)
+        quantidade = linha.quantidade + (existente.quantidade if existente else 0)
+        banco.definir(linha.produto_id, linha.variacao_id, quantidade, linha.preco)
+    cookie.limpar()
+    # A partir daqui a requisição usa o banco
+    setattr(request, ATRIBUTO_CARRINHO, banco)
+    return len(linhas)
+
+
+def _ao_logar(sender, request, user, **kwargs):
+    if request is not None:
+        migrar_para_banco(request)
+
+
+def conectar_sinais():
+    from django.contrib.auth.signals import user_logged_in
+    user_logged_in.connect(_ao_logar, dispatch_uid='carrinho_migrar_no_login')
@@ -0,0 +1,20 @@
+# carrinho/middleware.py
+from django.utils.cache import patch_vary_headers
+
+from .armazenamento import ATRIBUTO_COOKIE
+
+
+class CarrinhoMiddleware:
+    """Grava o carrinho do cookie na resposta quando ele foi alterado durante a requisição."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        cookie = getattr(request, ATRIBUTO_COOKIE, None)
+        if cookie is not None:
+            # A resposta dependeu do carrinho do visitante
+            patch_vary_headers(response, ('Cookie',))
+            cookie.gravar(response)
+        return response
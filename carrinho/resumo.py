@@ -0,0 +1,83 @@
+# carrinho/resumo.py
+"""
+Resumo do carrinho (quantidade de itens, subtotal e cupom) calculado no máximo
+uma vez por requisição e só quando alguém o lê.
+
+Só leitura: nunca cria sessão. Os totais vêm do armazenamento do carrinho
+(carrinho/armazenamento.py): no cookie, nenhuma consulta; no banco, uma só.
+"""
+from decimal import Decimal
+
+from django.utils.functional import cached_property
+
+from .armazenamento import obter_carrinho
+
+ATRIBUTO_REQUEST = '_resumo_carrinho'
+
+
+class ResumoCarrinho:
+
+    def __init__(self, request):
+        self.request = request
+
+    @cached_property
+    def session_key(self):
+        session = getattr(self.request, 'session', None)
+        return session.session_key if session is not None else None
+
+    @cached_property
+    def _totais(self):
+        return obter_carrinho(self.request).totais()
+
+    @property
+    def total_itens(self):
+        return self._totais[0]
+
+    @property
+    def subtotal(self):
+        return self._totais[1]
+
+    @property
+    def vazio(self):
+        return self.total_itens == 0
+
+    # -------------------------------------
+    # Cupom (gravado na sessão por aplicar_cupom)
+    # -------------------------------------
+    @cached_property
+    def cupom_codigo(self):
+        if not self.session_key:
+            return ''
+        return self.request.session.get('cupom_codigo', '')
+
+    @cached_property
+    def desconto(self):
+        if not self.session_key:
+            return Decimal('0.00')
+        return Decimal(str(self.request.session.get('desconto_valor', '0.00')))
+
+    @property
+    def tem_cupom(self):
+        return bool(self.cupom_codigo)
+
+    @property
+    def total_com_desconto(self):
+        return max(self.subtotal - self.desconto, Decimal('0.00'))
+
+    def __repr__(self):
+        return f'<ResumoCarrinho session_key={self.session_key!r}>'
+
+
+def obter_resumo(request):
+    """Resumo memoizado na própria requisição (context processor e views dividem o mesmo)."""
+    resumo = getattr(request, ATRIBUTO_REQUEST, None)
+    if resumo is None:
+        resumo = ResumoCarrinho(request)
+        setattr(request, ATRIBUTO_REQUEST, resumo)
+    return resumo
+
+
+def invalidar_resumo(request):
+    """Descarta o resumo da requisição depois que o carrinho foi alterado nela."""
+    if hasattr(request, ATRIBUTO_REQUEST):
+        delattr(request, ATRIBUTO_REQUEST)
@@ -0,0 +1,122 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from produtos.models import Categoria, Produto
+from .armazenamento import NOME_COOKIE
+from .models import ItemCarrinho
+
+
+def consultas_do_carrinho(consultas):
+    return [
+        q for q in consultas.captured_queries
+        if 'carrinho_itemcarrinho' in q['sql'] or 'django_session' in q['sql']
+    ]
+
+
+class CarrinhoTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.categoria = Categoria.objects.create(nome='Perfumes', slug='perfumes')
+        self.produto = Produto.objects.bulk_create([Produto(
+            categoria=self.categoria, nome='Perfume', slug='perfume', descricao='',
+            preco=Decimal('40.00'), estoque=10, tem_estoque=True, estoque_total=10,
+        )])[0]
+
+
+@override_settings(CARRINHO_ARMAZENAMENTO='banco')
+class ResumoCarrinhoTests(CarrinhoTestCase):
+    def _iniciar_sessao(self, **dados):
+        session = self.client.session
+        session.update(dados)
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        return session.session_key
+
+    def test_leitura_anonima_nao_cria_sessao(self):
+        with self.assertNumQueries(0):
+            resposta = self.client.get(reverse('carrinho:get_carrinho_total_ajax'))
+        self.assertEqual(resposta.json(), {'total_itens': 0})
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, resposta.cookies)
+
+        resposta = self.client.get(reverse('carrinho:ver_carrinho'))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, resposta.cookies)
+
+    def test_pagina_consulta_o_carrinho_uma_unica_vez(self):
+        session_key = self._iniciar_sessao()
+        ItemCarrinho.objects.create(
+            session_key=session_key, produto=self.produto, quantidade=3, preco=Decimal('40.00')
+        )
+        url = reverse('listar_categoria', args=[self.categoria.slug])
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(url)
+        self.assertContains(resposta, '<span class="cart-count">3</span>', html=True)
+        do_carrinho = [q for q in consultas.captured_queries if 'carrinho_itemcarrinho' in q['sql']]
+        self.assertEqual(len(do_carrinho), 1)
+
+    def test_ver_carrinho_usa_cupom_da_sessao(self):
+        session_key = self._iniciar_sessao(cupom_codigo='BELLA10', desconto_valor='8.00')
+        ItemCarrinho.objects.create(
+            session_key=session_key, produto=self.produto, quantidade=2, preco=Decimal('40.00')
+        )
+        resposta = self.client.get(reverse('carrinho:ver_carrinho'))
+        self.assertEqual(resposta.context['subtotal_carrinho'], Decimal('80.00'))
+        self.assertEqual(resposta.context['total_com_desconto'], Decimal('72.00'))
+        self.assertEqual(resposta.context['cupom_codigo'], 'BELLA10')
+        self.assertTrue(resposta.context['carrinho_resumo'].tem_cupom)
+
+
+class CarrinhoCookieTests(CarrinhoTestCase):
+    def _adicionar(self, quantidade=1):
+        return self.client.post(
+            reverse('carrinho:adicionar_ao_carrinho_ajax'),
+            {'produto_slug': self.produto.slug, 'quantidade': quantidade},
+        )
+
+    def test_anonimo_adiciona_e_le_contador_sem_sql_do_carrinho(self):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self._adicionar(2)
+        self.assertEqual(resposta.json()['novo_total_itens'], 2)
+        self.assertEqual(consultas_do_carrinho(consultas), [])
+        self.assertIn(NOME_COOKIE, resposta.cookies)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, resposta.cookies)
+
+        self._adicionar(1)
+        with self.assertNumQueries(0):
+            resposta = self.client.get(reverse('carrinho:get_carrinho_total_ajax'))
+        self.assertEqual(resposta.json(), {'total_itens': 3})
+        self.assertFalse(ItemCarrinho.objects.exists())
+
+    def test_ver_atualizar_e_remover_no_cookie(self):
+        self._adicionar(2)
+        resposta = self.client.get(reverse('carrinho:ver_carrinho'))
+        self.assertEqual(resposta.context['subtotal_carrinho'], Decimal('80.00'))
+        item = resposta.context['itens_carrinho'][0]
+
+        self.client.post(reverse('carrinho:atualizar_carrinho'), {'item_id': item.id, 'quantidade': 5})
+        self.assertEqual(self.client.get(reverse('carrinho:get_carrinho_total_ajax')).json()['total_itens'], 5)
+
+        resposta = self.client.post(reverse('carrinho:remover_item', args=[item.id]))
+        self.assertEqual(resposta.cookies[NOME_COOKIE].value, '')
+
+    def test_cookie_adulterado_vira_carrinho_vazio(self):
+        self.client.cookies[NOME_COOKIE] = 'nao-assinado'
+        self.assertEqual(self.client.get(reverse('carrinho:get_carrinho_total_ajax')).json()['total_itens'], 0)
+
+    def test_checkout_logado_leva_o_carrinho_do_cookie_para_o_banco(self):
+        self._adicionar(2)
+        usuario = get_user_model().objects.create_user(
+            email='cliente@example.com', password='senha-forte-123', nome_completo='Cliente'
+        )
+        self.client.force_login(usuario)
+        self.client.get(reverse('pedidos:checkout'))
+        item = ItemCarrinho.objects.get()
+        self.assertEqual((item.produto_id, item.quantidade, item.preco), (self.produto.id, 2, Decimal('40.00')))
+        self.assertEqual(self.client.cookies[NOME_COOKIE].value, '')
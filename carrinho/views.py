@@ -4,13 +4,15 @@ from django.shortcuts import render, redirect, get_object_or_404
 
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
-from django.db.models import Sum, F
 from django.contrib import messages
 from django.utils import timezone
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
+from django.http import Http404
 from produtos.models import Produto, Variacao
 from pedidos.models import Cupom  
-from .models import ItemCarrinho  
+from .armazenamento import CarrinhoCheio, obter_carrinho
+from .resumo import obter_resumo, invalidar_resumo
+from core.consultas import orcamento_consultas
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 
@@ -27,7 +29,7 @@ def _get_session_key(request):
 @require_POST
 def adicionar_ao_carrinho(request, produto_slug):
     produto = get_object_or_404(Produto, slug=produto_slug)
-    session_key = _get_session_key(request)
+    carrinho = obter_carrinho(request)
 
     variacao_id = request.POST.get('variacao_id')
     quantidade = int(request.POST.get('quantidade', 1))
@@ -72,14 +74,9 @@ def adicionar_ao_carrinho(request, produto_slug):
         preco_unitario += variacao.preco_adicional or 0
 
     # --- Buscar item existente no carrinho ---
-    item_query = ItemCarrinho.objects.filter(
-        session_key=session_key,
-        produto=produto,
-        variacao=variacao
-    )
-
-    if item_query.exists():
-        item = item_query.first()
+    item = carrinho.encontrar(produto.id, variacao.id if variacao else None)
+
+    if item:
         nova_quantidade = item.quantidade + quantidade
 
         # 🔒 Travar se exceder estoque
@@ -91,52 +88,36 @@ def adicionar_ao_carrinho(request, produto_slug):
             )
             return redirect('detalhe_produto', slug=produto_slug)
 
-        item.quantidade = nova_quantidade
-        item.preco = preco_unitario  # 🔄 Atualiza preço se produto entrou em promoção
-        item.save()
+        # 🔄 Atualiza preço se produto entrou em promoção
+        carrinho.definir(produto.id, item.variacao_id, nova_quantidade, preco_unitario)
         messages.success(request, f"Quantidade de {produto.nome} atualizada no carrinho.")
     else:
-        ItemCarrinho.objects.create(
-            session_key=session_key,
-            produto=produto,
-            variacao=variacao,
-            quantidade=quantidade,
-            preco=preco_unitario  # ✅ Salva o preço certo no momento da adição
-        )
+        try:
+            # ✅ Salva o preço certo no momento da adição
+            carrinho.definir(produto.id, variacao.id if variacao else None, quantidade, preco_unitario)
+        except CarrinhoCheio as e:
+            messages.error(request, str(e))
+            return redirect('detalhe_produto', slug=produto_slug)
         messages.success(request, f"{produto.nome} adicionado ao carrinho!")
 
     return redirect('carrinho:ver_carrinho')
 
 
 # ---------------------- VER CARRINHO ----------------------
+@orcamento_consultas(12)
 def ver_carrinho(request):
-    session_key = _get_session_key(request)
-    itens_carrinho = ItemCarrinho.objects.filter(session_key=session_key)
-
-    # 💰 Calcula subtotal e quantidade total
-    carrinho_data = itens_carrinho.aggregate(
-        subtotal=Sum(F('quantidade') * F('preco')),
-        total_itens=Sum('quantidade')
-    )
-
-    subtotal = carrinho_data.get('subtotal') or Decimal('0.00')
-    total_itens = carrinho_data.get('total_itens') or 0
-
-    # 🧾 Lê valores salvos na sessão (cupom e desconto)
-    desconto = Decimal(str(request.session.get('desconto_valor', 0.00)))
-    cupom_codigo = request.session.get('cupom_codigo', '')
-    total_com_desconto = subtotal - desconto
-
-    if total_com_desconto < 0:
-        total_com_desconto = Decimal('0.00')
+    # 🛑 OTIMIZAÇÃO: ver o carrinho é leitura — não cria sessão
+    resumo = obter_resumo(request)
+    itens_carrinho = obter_carrinho(request).itens()
 
+    # 💰 Subtotal, quantidade e cupom vêm do resumo (o mesmo que o header usa)
     context = {
         'itens_carrinho': itens_carrinho,
-        'subtotal_carrinho': subtotal,
-        'total_itens': total_itens,
-        'desconto': desconto,
-        'total_com_desconto': total_com_desconto,
-        'cupom_codigo': cupom_codigo,
+        'subtotal_carrinho': resumo.subtotal,
+        'total_itens': resumo.total_itens,
+        'desconto': resumo.desconto,
+        'total_com_desconto': resumo.total_com_desconto,
+        'cupom_codigo': resumo.cupom_codigo,
         'titulo': "Seu Carrinho de Compras"
     }
 
@@ -147,19 +128,21 @@ def ver_carrinho(request):
 @require_POST
 def atualizar_carrinho(request):
     """Atualiza a quantidade de um item no carrinho"""
-    session_key = _get_session_key(request)
-    item_id = request.POST.get('item_id')
+    carrinho = obter_carrinho(request)
+    item_id = int(request.POST.get('item_id') or 0)
     nova_quantidade = int(request.POST.get('quantidade', 1))
 
-    item = get_object_or_404(ItemCarrinho, id=item_id, session_key=session_key)
+    item = carrinho.obter(item_id)
+    if item is None:
+        raise Http404("Item não encontrado no carrinho.")
+    nome_produto = Produto.objects.filter(pk=item.produto_id).values_list('nome', flat=True).first()
 
     if nova_quantidade <= 0:
-        item.delete()
-        messages.success(request, f"{item.produto.nome} foi removido do carrinho.")
+        carrinho.remover(item_id)
+        messages.success(request, f"{nome_produto} foi removido do carrinho.")
     else:
-        item.quantidade = nova_quantidade
-        item.save()
-        messages.success(request, f"Quantidade de {item.produto.nome} atualizada com sucesso.")
+        carrinho.atualizar_quantidade(item_id, nova_quantidade)
+        messages.success(request, f"Quantidade de {nome_produto} atualizada com sucesso.")
 
     return redirect('carrinho:ver_carrinho')
 
@@ -169,9 +152,8 @@ def atualizar_carrinho(request):
 @require_POST
 def remover_item(request, item_id):
     """Remove um item específico do carrinho"""
-    session_key = _get_session_key(request)
-    item = get_object_or_404(ItemCarrinho, id=item_id, session_key=session_key)
-    item.delete()
+    if not obter_carrinho(request).remover(item_id):
+        raise Http404("Item não encontrado no carrinho.")
     messages.success(request, "Item removido do carrinho.")
     return redirect('carrinho:ver_carrinho')
 
@@ -181,14 +163,10 @@ def remover_item(request, item_id):
 def aplicar_cupom(request):
     """Aplica um cupom de desconto e salva na sessão do usuário"""
     codigo_cupom = request.POST.get('cupom_codigo', '').strip()
-    session_key = _get_session_key(request)
-
-    if not session_key:
-        request.session.create()
-        session_key = request.session.session_key
+    # O cupom fica na sessão: aqui ela precisa existir
+    _get_session_key(request)
 
-    itens = ItemCarrinho.objects.filter(session_key=session_key)
-    total = sum(item.get_subtotal() for item in itens)
+    total = obter_carrinho(request).totais()[1]
 
     if not codigo_cupom:
         messages.error(request, "Por favor, insira um código de cupom.")
@@ -252,7 +230,7 @@ def aplicar_cupom(request):
 def adicionar_ao_carrinho_ajax(request):
     produto_slug = request.POST.get('produto_slug')
     produto = get_object_or_404(Produto, slug=produto_slug)
-    session_key = _get_session_key(request)
+    carrinho = obter_carrinho(request)
 
     variacao_id = request.POST.get('variacao_id')
     quantidade = int(request.POST.get('quantidade', 1))
@@ -273,12 +251,8 @@ def adicionar_ao_carrinho_ajax(request):
         return JsonResponse({'status': 'erro', 'mensagem': 'Produto esgotado.'})
 
     # Validação de estoque para a adição
-    item_existente = ItemCarrinho.objects.filter(
-        session_key=session_key,
-        produto=produto,
-        variacao=variacao
-    ).first()
-    
+    item_existente = carrinho.encontrar(produto.id, variacao.id if variacao else None)
+
     quantidade_atual_no_carrinho = item_existente.quantidade if item_existente else 0
     nova_quantidade_total = quantidade_atual_no_carrinho + quantidade
 
@@ -293,22 +267,14 @@ def adicionar_ao_carrinho_ajax(request):
     if variacao:
         preco_unitario += variacao.preco_adicional or 0
 
-    item, criado = ItemCarrinho.objects.get_or_create(
-        session_key=session_key,
-        produto=produto,
-        variacao=variacao,
-        defaults={'quantidade': quantidade, 'preco': preco_unitario}
-    )
-
-    if not criado:
-        item.quantidade = nova_quantidade_total
-        item.preco = preco_unitario
-        item.save()
+    try:
+        carrinho.definir(produto.id, variacao.id if variacao else None, nova_quantidade_total, preco_unitario)
+    except CarrinhoCheio as e:
+        return JsonResponse({'status': 'erro', 'mensagem': str(e)})
 
     # 🚀 NOVO CÓDIGO: CALCULAR O NOVO TOTAL DE ITENS E RETORNAR 🚀
-    total_itens = ItemCarrinho.objects.filter(session_key=session_key).aggregate(
-        total=Sum('quantidade')
-    )['total'] or 0
+    invalidar_resumo(request)
+    total_itens = obter_resumo(request).total_itens
 
     return JsonResponse({
         'status': 'ok',
@@ -318,25 +284,9 @@ def adicionar_ao_carrinho_ajax(request):
 
 # ---------------------- OBTER TOTAL DO CARRINHO (AJAX GLOBAL) ----------------------
 def get_carrinho_total_ajax(request):
-    """Retorna o número total de itens no carrinho da sessão atual."""
-    
-    session_key = request.session.session_key
-    
-    # Se não houver chave de sessão, garante que ela será criada se o Context Processor falhar
-    if not request.session.session_key:
-        request.session.create()
-        session_key = request.session.session_key
-        
-    if not session_key:
-        total_itens = 0
-    else:
-        # Usamos o F.objects.filter porque é mais eficiente
-        total_itens = ItemCarrinho.objects.filter(session_key=session_key).aggregate(
-            total=Sum('quantidade')
-        )['total'] or 0
-        
+    """Retorna o número total de itens no carrinho da sessão atual (sem criar sessão)."""
     return JsonResponse({
-        'total_itens': total_itens
+        'total_itens': obter_resumo(request).total_itens
     })
 
 
@@ -0,0 +1,206 @@
+# core/cache.py
+"""
+Camada de cache do projeto.
+
+O backend vem de settings.CACHES (Redis em produção, arquivo em disco como
+substituto local — ambos compartilhados entre os workers do gunicorn). Aqui
+ficam, por cima dele:
+
+- CacheNamespace: prefixo por assunto ('cards', 'layout', ...), contador de
+  versão para invalidação em bloco e métricas de hit/miss.
+- obter_ou_calcular(): recálculo single-flight (um único processo recalcula a
+  chave; os outros esperam ou recebem o valor antigo) com stale-while-revalidate.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+INTERVALO_METRICAS = 10  # segundos entre descargas dos contadores locais
+ESPERA_MAXIMA = 2.0      # quanto um processo espera pelo recálculo de outro
+CHAVE_NAMESPACES = 'metricas:namespaces'
+TIPOS_METRICA = ('hit', 'miss', 'stale', 'recalculo', 'espera', 'download', 'ausente')
+
+_AUSENTE = object()
+
+
+class _Metricas:
+    """Contadores locais por (namespace, tipo), somados periodicamente no cache compartilhado."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = defaultdict(int)
+        self._ultima_descarga = time.monotonic()
+
+    def registrar(self, namespace, tipo, quantidade=1):
+        if not quantidade:
+            return
+        with self._lock:
+            self._contadores[(namespace, tipo)] += quantidade
+            vencido = time.monotonic() - self._ultima_descarga >= INTERVALO_METRICAS
+        if vencido:
+            self.descarregar()
+
+    def descarregar(self, alias='default'):
+        with self._lock:
+            contadores, self._contadores = self._contadores, defaultdict(int)
+            self._ultima_descarga = time.monotonic()
+        if not contadores:
+            return
+        backend = caches[alias]
+        try:
+            namespaces = set(backend.get(CHAVE_NAMESPACES) or ())
+            novos = {ns for ns, _ in contadores} - namespaces
+            if novos:
+                backend.set(CHAVE_NAMESPACES, sorted(namespaces | novos), None)
+            for (namespace, tipo), quantidade in contadores.items():
+                chave = f'metricas:{namespace}:{tipo}'
+                if not backend.add(chave, quantidade, None):
+                    backend.incr(chave, quantidade)
+        except Exception:
+            # Métrica nunca derruba a requisição
+            logger.warning('Não foi possível gravar métricas de cache', exc_info=True)
+
+    def relatorio(self, alias='default'):
+        """{namespace: {tipo: total}} somando todos os processos."""
+        self.descarregar(alias)
+        backend = caches[alias]
+        namespaces = backend.get(CHAVE_NAMESPACES) or []
+        chaves = [f'metricas:{ns}:{tipo}' for ns in namespaces for tipo in TIPOS_METRICA]
+        valores = backend.get_many(chaves)
+        return {
+            ns: {tipo: valores.get(f'metricas:{ns}:{tipo}', 0) for tipo in TIPOS_METRICA}
+            for ns in namespaces
+        }
+
+    def zerar(self, alias='default'):
+        backend = caches[alias]
+        namespaces = backend.get(CHAVE_NAMESPACES) or []
+        backend.delete_many([f'metricas:{ns}:{tipo}' for ns in namespaces for tipo in TIPOS_METRICA])
+        with self._lock:
+            self._contadores.clear()
+
+
+metricas = _Metricas()
+
+
+class CacheNamespace:
+    """Acesso ao cache com prefixo, versão e métricas de um assunto."""
+
+    def __init__(self, nome, timeout=300, stale_ttl=0, alias='default'):
+        self.nome = nome
+        self.timeout = timeout
+        self.stale_ttl = stale_ttl
+        self.alias = alias
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def chave(self, chave):
+        return f'{self.nome}:{chave}'
+
+    # -------------------------------------
+    # Operações simples
+    # -------------------------------------
+    def get(self, chave, default=None):
+        valor = self.backend.get(self.chave(chave), _AUSENTE)
+        metricas.registrar(self.nome, 'miss' if valor is _AUSENTE else 'hit')
+        return default if valor is _AUSENTE else valor
+
+    def get_many(self, chaves):
+        """Um único round trip; devolve {chave_original: valor} só com os encontrados."""
+        completas = {self.chave(c): c for c in chaves}
+        encontrados = self.backend.get_many(list(completas))
+        metricas.registrar(self.nome, 'hit', len(encontrados))
+        metricas.registrar(self.nome, 'miss', len(completas) - len(encontrados))
+        return {completas[k]: v for k, v in encontrados.items()}
+
+    def set(self, chave, valor, timeout=_AUSENTE):
+        self.backend.set(self.chave(chave), valor, self.timeout if timeout is _AUSENTE else timeout)
+
+    def set_many(self, dados, timeout=_AUSENTE):
+        self.backend.set_many(
+            {self.chave(c): v for c, v in dados.items()},
+            self.timeout if timeout is _AUSENTE else timeout,
+        )
+
+    def delete(self, chave):
+        self.backend.delete(self.chave(chave))
+
+    # -------------------------------------
+    # Versão do namespace (invalidação em bloco)
+    # -------------------------------------
+    def versao(self):
+        return self.backend.get(self.chave('versao'), 0)
+
+    def avancar_versao(self):
+        chave = self.chave('versao')
+        if self.backend.add(chave, 1, None):
+            return 1
+        try:
+            return self.backend.incr(chave)
+        except ValueError:
+            # Expirou entre o add e o incr
+            self.backend.set(chave, 1, None)
+            return 1
+
+    # -------------------------------------
+    # Single-flight + stale-while-revalidate
+    # -------------------------------------
+    def obter_ou_calcular(self, chave, calcular, timeout=None, stale_ttl=None):
+        """
+        Retorna o valor da chave, calculando-o com `calcular()` se preciso.
+
+        O valor fica fresco por `timeout` segundos e pode ser servido vencido por
+        mais `stale_ttl` segundos enquanto UM processo recalcula. Se não há valor
+        nenhum e outro processo já está calculando, espera até ESPERA_MAXIMA.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        completa = self.chave(chave)
+        backend = self.backend
+
+        envelope = backend.get(completa)
+        if envelope is not None:
+            valor, fresco_ate = envelope
+            if time.time() < fresco_ate:
+                metricas.registrar(self.nome, 'hit')
+                return valor
+            if not self._travar(completa):
+                metricas.registrar(self.nome, 'stale')
+                return valor
+            # Este processo ganhou a trava: revalida e os demais seguem com o valor antigo
+            return self._recalcular(completa, calcular, timeout, stale_ttl)
+
+        metricas.registrar(self.nome, 'miss')
+        if self._travar(completa):
+            return self._recalcular(completa, calcular, timeout, stale_ttl)
+
+        metricas.registrar(self.nome, 'espera')
+        limite = time.monotonic() + ESPERA_MAXIMA
+        while time.monotonic() < limite:
+            time.sleep(0.05)
+            envelope = backend.get(completa)
+            if envelope is not None:
+                return envelope[0]
+        # Quem estava calculando demorou demais (ou morreu): calcula sem trava
+        return self._recalcular(completa, calcular, timeout, stale_ttl, travado=False)
+
+    def _travar(self, completa):
+        return self.backend.add(f'{completa}:trava', 1, max(int(ESPERA_MAXIMA * 5), 1))
+
+    def _recalcular(self, completa, calcular, timeout, stale_ttl, travado=True):
+        try:
+            valor = calcular()
+            metricas.registrar(self.nome, 'recalculo')
+            self.backend.set(completa, (valor, time.time() + timeout), timeout + stale_ttl)
+            return valor
+        finally:
+            if travado:
+                self.backend.delete(f'{completa}:trava')
+
@@ -0,0 +1,282 @@
+# core/cache_disco.py
+"""
+Limite de tamanho do cache local de mídia (MEDIA_ROOT).
+
+O storage e o MidiaMiddleware baixam do S3 sob demanda e nada saía do
+disco; em disco efêmero/pequeno ele enchia com o catálogo. Aqui cada arquivo
+do cache tem uma linha num índice SQLite (MIDIA_CACHE_INDICE) com tamanho e
+último acesso:
+
+- downloads e uploads entram no índice (registrar); leituras atualizam o
+  acesso em lote, no máximo a cada INTERVALO_ACESSOS segundos por processo
+  (tocar), sem uma escrita no SQLite por requisição;
+- passando de MIDIA_CACHE_LIMITE_MB, uma thread apaga os arquivos acessados
+  há mais tempo até FRACAO_ALVO do limite (LRU);
+- nunca sai do disco o que ainda não está confirmado no S3: arquivos com
+  entrada no diário de envios (pendentes ou com falha, core/fila_s3.py) — e,
+  sem S3 configurado, nada sai;
+- arquivos que chegaram por fora (espelho, cópia manual) entram no índice com
+  reconciliar(), que o comando `cache_midia` roda.
+
+Um arquivo apagado volta sozinho do S3 no próximo acesso.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from core import s3
+
+logger = logging.getLogger(__name__)
+
+FRACAO_ALVO = 0.9  # poda até 90% do limite, para não podar a cada download
+INTERVALO_ACESSOS = 30  # segundos entre gravações dos acessos acumulados
+MAXIMO_ACESSOS = 500  # ...ou antes, se acumular tantos nomes
+
+
+@dataclass
+class ResultadoPoda:
+    arquivos: int = 0
+    bytes: int = 0
+    protegidos: int = 0
+
+
+def _oculto(nome):
+    return any(parte.startswith('.') for parte in nome.split('/'))
+
+
+class CacheDisco:
+    def __init__(self, raiz=None, indice=None, limite=None):
+        self._raiz = raiz
+        self._indice = indice
+        self._limite = limite
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._acessos = {}
+        self._ultima_descarga = time.monotonic()
+        self._podando = threading.Lock()
+
+    # -------------------------------------
+    # Configuração
+    # -------------------------------------
+    @property
+    def raiz(self):
+        return str(self._raiz or settings.MEDIA_ROOT)
+
+    @property
+    def caminho_indice(self):
+        return str(self._indice or getattr(settings, 'MIDIA_CACHE_INDICE', '')
+                   or os.path.join(self.raiz, '.cache_midia.sqlite3'))
+
+    @property
+    def limite(self):
+        """Bytes; 0 = sem limite."""
+        if self._limite is not None:
+            return self._limite
+        return getattr(settings, 'MIDIA_CACHE_LIMITE_MB', 0) * 1024 * 1024
+
+    def _local_de(self, nome):
+        return os.path.join(self.raiz, *nome.split('/'))
+
+    # -------------------------------------
+    # Índice SQLite (uma conexão por thread e arquivo)
+    # -------------------------------------
+    def _conexao(self):
+        conexoes = self._local.__dict__.setdefault('conexoes', {})
+        caminho = self.caminho_indice
+        conexao = conexoes.get(caminho)
+        if conexao is None:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            conexao = sqlite3.connect(caminho, timeout=5, isolation_level=None)
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            conexao.execute(
+                'CREATE TABLE IF NOT EXISTS arquivos '
+                '(nome TEXT PRIMARY KEY, tamanho INTEGER NOT NULL, acesso REAL NOT NULL)'
+            )
+            conexao.execute('CREATE INDEX IF NOT EXISTS arquivos_acesso ON arquivos (acesso)')
+            conexao.execute('CREATE TABLE IF NOT EXISTS contadores (nome TEXT PRIMARY KEY, valor INTEGER NOT NULL)')
+            conexoes[caminho] = conexao
+        return conexao
+
+    def _somar(self, conexao, nome, valor):
+        conexao.execute(
+            'INSERT INTO contadores (nome, valor) VALUES (?, ?) '
+            'ON CONFLICT(nome) DO UPDATE SET valor = valor + excluded.valor', (nome, valor),
+        )
+
+    # -------------------------------------
+    # Registro de arquivos e acessos
+    # -------------------------------------
+    def registrar(self, nome, tamanho=None, acesso=None):
+        """Arquivo novo no cache (download ou upload); pode disparar a poda."""
+        if _oculto(nome):
+            return
+        try:
+            if tamanho is None:
+                tamanho = os.path.getsize(self._local_de(nome))
+            self._conexao().execute(
+                'INSERT OR REPLACE INTO arquivos (nome, tamanho, acesso) VALUES (?, ?, ?)',
+                (nome, tamanho, acesso or time.time()),
+            )
+        except (OSError, sqlite3.Error):
+            logger.warning('Não foi possível registrar %s no índice do cache de mídia', nome, exc_info=True)
+            return
+        self._podar_se_cheio()
+
+    def tocar(self, nome):
+        """Leitura de um arquivo do cache: acumula o acesso e grava em lote."""
+        with self._lock:
+            self._acessos[nome] = time.time()
+            vencido = (len(self._acessos) >= MAXIMO_ACESSOS
+                       or time.monotonic() - self._ultima_descarga >= INTERVALO_ACESSOS)
+        if vencido:
+            self.descarregar()
+
+    def descarregar(self):
+        with self._lock:
+            acessos, self._acessos = self._acessos, {}
+            self._ultima_descarga = time.monotonic()
+        if not acessos:
+            return
+        try:
+            self._conexao().executemany(
+                'UPDATE arquivos SET acesso = MAX(acesso, ?) WHERE nome = ?',
+                [(quando, nome) for nome, quando in acessos.items()],
+            )
+        except sqlite3.Error:
+            logger.warning('Não foi possível gravar os acessos do cache de mídia', exc_info=True)
+
+    def esquecer(self, nome):
+        try:
+            self._conexao().execute('DELETE FROM arquivos WHERE nome = ?', (nome,))
+        except sqlite3.Error:
+            pass
+
+    # -------------------------------------
+    # Poda (LRU)
+    # -------------------------------------
+    def tamanho(self):
+        """(arquivos, bytes) no índice."""
+        arquivos, total = self._conexao().execute('SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM arquivos').fetchone()
+        return arquivos, total
+
+    def protegidos(self):
+        """Nomes que ainda não estão confirmados no S3 (diário de envios)."""
+        from core.fila_s3 import fila
+        return {entrada['nome'] for entrada in fila.entradas()}
+
+    def _podar_se_cheio(self):
+        limite = self.limite
+        if not limite or not s3.bucket():
+            return
+        try:
+            _, total = self.tamanho()
+        except sqlite3.Error:
+            return
+        if total <= limite or not self._podando.acquire(blocking=False):
+            return
+
+        def podar():
+            try:
+                self.podar()
+            except Exception:  # noqa: BLE001 — a poda nunca derruba quem baixou
+                logger.exception('Falha ao podar o cache de mídia')
+            finally:
+                self._podando.release()
+
+        threading.Thread(target=podar, name='poda-cache-midia', daemon=True).start()
+
+    def podar(self, limite=None):
+        """
+        Apaga os arquivos menos usados até FRACAO_ALVO do limite e devolve um
+        ResultadoPoda. Sem S3 configurado não apaga nada (não haveria de onde
+        trazer de volta).
+        """
+        resultado = ResultadoPoda()
+        limite = self.limite if limite is None else limite
+        if not limite or not s3.bucket():
+            return resultado
+        self.descarregar()
+        conexao = self._conexao()
+        _, total = self.tamanho()
+        if total <= limite:
+            return resultado
+
+        alvo = limite * FRACAO_ALVO
+        candidatos = conexao.execute('SELECT nome, tamanho FROM arquivos ORDER BY acesso').fetchall()
+        # Diário lido depois dos candidatos: quem publica grava no diário antes de
+        # registrar no índice, então todo candidato pendente já aparece aqui
+        protegidos = self.protegidos()
+        for nome, tamanho in candidatos:
+            if total <= alvo:
+                break
+            if nome in protegidos:
+                resultado.protegidos += 1
+                continue
+            try:
+                os.remove(self._local_de(nome))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logger.warning('Não foi possível apagar %s do cache de mídia', nome, exc_info=True)
+                continue
+            conexao.execute('DELETE FROM arquivos WHERE nome = ?', (nome,))
+            total -= tamanho
+            resultado.arquivos += 1
+            resultado.bytes += tamanho
+
+        if resultado.arquivos:
+            self._somar(conexao, 'evicoes', resultado.arquivos)
+            self._somar(conexao, 'bytes_evictados', resultado.bytes)
+            logger.info('Cache de mídia podado: %d arquivos, %.1f MB', resultado.arquivos, resultado.bytes / 1024 / 1024)
+        return resultado
+
+    # -------------------------------------
+    # Manutenção e relatório
+    # -------------------------------------
+    def reconciliar(self):
+        """Põe no índice os arquivos do disco que não estão nele e tira os que sumiram; (adicionados, removidos)."""
+        no_disco = {}
+        for pasta, subpastas, arquivos in os.walk(self.raiz):
+            subpastas[:] = [s for s in subpastas if not s.startswith('.')]
+            relativa = os.path.relpath(pasta, self.raiz).replace(os.sep, '/')
+            for arquivo in arquivos:
+                if arquivo.startswith('.'):
+                    continue
+                caminho = os.path.join(pasta, arquivo)
+                try:
+                    estado = os.stat(caminho)
+                except OSError:
+                    continue
+                nome = arquivo if relativa == '.' else f'{relativa}/{arquivo}'
+                no_disco[nome] = (estado.st_size, max(estado.st_atime, estado.st_mtime))
+
+        conexao = self._conexao()
+        no_indice = {nome for (nome,) in conexao.execute('SELECT nome FROM arquivos')}
+        novos = [(nome, tamanho, acesso) for nome, (tamanho, acesso) in no_disco.items() if nome not in no_indice]
+        sumidos = [(nome,) for nome in no_indice if nome not in no_disco]
+        conexao.execute('BEGIN')
+        conexao.executemany('INSERT INTO arquivos (nome, tamanho, acesso) VALUES (?, ?, ?)', novos)
+        conexao.executemany('DELETE FROM arquivos WHERE nome = ?', sumidos)
+        conexao.execute('COMMIT')
+        return len(novos), len(sumidos)
+
+    def estatisticas(self):
+        self.descarregar()
+        arquivos, total = self.tamanho()
+        contadores = dict(self._conexao().execute('SELECT nome, valor FROM contadores'))
+        return {
+            'arquivos': arquivos,
+            'bytes': total,
+            'limite': self.limite,
+            'evicoes': contadores.get('evicoes', 0),
+            'bytes_evictados': contadores.get('bytes_evictados', 0),
+        }
+
+
+cache_disco = CacheDisco()
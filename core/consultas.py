@@ -0,0 +1,167 @@
+# core/consultas.py
+"""
+Monitor de consultas SQL por requisição.
+
+MonitorConsultasMiddleware embrulha todas as conexões com execute_wrapper e
+anota cada consulta da requisição: duração, SQL e local de chamada (a
+primeira linha do código do projeto na pilha, fora do Django e das libs).
+No fim da requisição:
+
+- agrupa as consultas por impressão digital (SQL com literais e listas IN
+  trocados por '?') e local; um grupo que se repete CONSULTAS_LIMITE_REPETICAO
+  vezes ou mais é um N+1 e vai para o log 'core.consultas';
+- acrescenta o cabeçalho Server-Timing (db, app e, se houver, n1), que o
+  DevTools do navegador mostra na aba de rede;
+- compara o total com o orçamento da view (@orcamento_consultas(n)): acima
+  dele, loga ou, com CONSULTAS_ESTRITO, levanta OrcamentoConsultasExcedido,
+  o que faz o teste que chamou a view falhar.
+
+Liga com CONSULTAS_MONITOR (desligado por padrão).
+"""
+import logging
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LIMITE_REPETICAO = 5  # padrão de CONSULTAS_LIMITE_REPETICAO
+
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+_RE_LISTA = re.compile(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)')
+_RE_ESPACOS = re.compile(r'\s+')
+
+
+class OrcamentoConsultasExcedido(Exception):
+    """A view fez mais consultas do que o orçamento declarado em @orcamento_consultas."""
+
+
+def orcamento_consultas(maximo):
+    """Declara quantas consultas a view pode fazer por requisição."""
+    def decorador(view):
+        view.orcamento_consultas = maximo
+        return view
+    return decorador
+
+
+def impressao_digital(sql):
+    """
+    SQL normalizado para agrupar consultas iguais com parâmetros diferentes:
+    "... WHERE id IN (1, 2, 3) AND nome = 'x'" -> "... WHERE id IN (?) AND nome = ?".
+    """
+    sql = _RE_STRING.sub('?', sql)
+    sql = _RE_NUMERO.sub('?', sql)
+    sql = _RE_LISTA.sub('(?)', sql)
+    return _RE_ESPACOS.sub(' ', sql).strip()
+
+
+# -------------------------------------
+# Local de chamada
+# -------------------------------------
+_RAIZ = str(Path(settings.BASE_DIR).resolve())
+_IGNORADOS = ('site-packages', 'dist-packages')
+
+
+def local_de_chamada():
+    """'arquivo.py:linha (função)' do primeiro quadro do projeto na pilha, ou '?'."""
+    quadro = sys._getframe(1)
+    while quadro is not None:
+        arquivo = quadro.f_code.co_filename
+        if (arquivo.startswith(_RAIZ) and arquivo != __file__
+                and not any(parte in arquivo for parte in _IGNORADOS)):
+            relativo = arquivo[len(_RAIZ):].lstrip('/\\')
+            return f'{relativo}:{quadro.f_lineno} ({quadro.f_code.co_name})'
+        quadro = quadro.f_back
+    return '?'
+
+
+# -------------------------------------
+# Registro de uma requisição
+# -------------------------------------
+class RegistroConsultas:
+    """Callable para connection.execute_wrapper que anota cada consulta executada."""
+
+    def __init__(self):
+        self.consultas = []  # (impressão digital, local, duração em ms)
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = (time.perf_counter() - inicio) * 1000
+            self.consultas.append((impressao_digital(sql), local_de_chamada(), duracao))
+
+    def __len__(self):
+        return len(self.consultas)
+
+    @property
+    def duracao(self):
+        return sum(d for _, _, d in self.consultas)
+
+    def repetidas(self, limite):
+        """[(quantidade, impressão digital, local)] dos grupos com `limite` repetições ou mais."""
+        grupos = defaultdict(int)
+        for digital, local, _ in self.consultas:
+            grupos[(digital, local)] += 1
+        return sorted(
+            ((n, digital, local) for (digital, local), n in grupos.items() if n >= limite),
+            reverse=True,
+        )
+
+
+# -------------------------------------
+# Middleware
+# -------------------------------------
+class MonitorConsultasMiddleware:
+    """Registra as consultas de cada requisição; ver a docstring do módulo."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CONSULTAS_MONITOR', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        registro = RegistroConsultas()
+        inicio = time.perf_counter()
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(registro))
+            response = self.get_response(request)
+        total = (time.perf_counter() - inicio) * 1000
+
+        limite = getattr(settings, 'CONSULTAS_LIMITE_REPETICAO', LIMITE_REPETICAO)
+        repetidas = registro.repetidas(limite)
+        for n, digital, local in repetidas:
+            logger.warning('N+1 em %s: %dx em %s: %s', request.path, n, local, digital)
+
+        metricas = [
+            f'db;dur={registro.duracao:.1f};desc="{len(registro)} consultas"',
+            f'app;dur={total:.1f}',
+        ]
+        if repetidas:
+            metricas.append(f'n1;desc="{len(repetidas)} repetidas"')
+        existente = response.get('Server-Timing')
+        response['Server-Timing'] = ', '.join(([existente] if existente else []) + metricas)
+
+        orcamento = getattr(request, '_orcamento_consultas', None)
+        if orcamento is not None and len(registro) > orcamento:
+            mensagem = (
+                f'{request.path} fez {len(registro)} consultas (orçamento: {orcamento}). '
+                f'Mais repetidas: {registro.repetidas(2)[:3]}'
+            )
+            if getattr(settings, 'CONSULTAS_ESTRITO', False):
+                raise OrcamentoConsultasExcedido(mensagem)
+            logger.warning(mensagem)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._orcamento_consultas = getattr(view_func, 'orcamento_consultas', None)
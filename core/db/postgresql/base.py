@@ -0,0 +1,53 @@
+# core/db/postgresql/base.py
+"""
+Backend PostgreSQL com pool de conexões (psycopg 3).
+
+Igual ao backend padrão do Django com OPTIONS['pool'], mais:
+- pre-ping: com CONN_HEALTH_CHECKS o próprio Django passa check_connection ao
+  pool, que testa a conexão antes de entregá-la;
+- fallback: se o pool esgotar (PoolTimeout), abre uma conexão avulsa em vez de
+  derrubar a requisição, e a fecha ao final em vez de devolvê-la ao pool.
+"""
+import logging
+
+from django.db.backends.postgresql import base
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._conexao_avulsa = False
+
+    def get_new_connection(self, conn_params):
+        if not self.pool:
+            return super().get_new_connection(conn_params)
+
+        from psycopg_pool import PoolTimeout
+        try:
+            return super().get_new_connection(conn_params)
+        except PoolTimeout:
+            stats = self.pool.get_stats()
+            logger.warning(
+                'Pool de conexões esgotado (%s/%s); abrindo conexão avulsa.',
+                stats.get('pool_size'), self.pool.max_size,
+            )
+            self._conexao_avulsa = True
+            return self.Database.connect(**conn_params)
+
+    def init_connection_state(self):
+        super().init_connection_state()
+        # O pool configura as próprias conexões; a avulsa precisa do fuso/role aqui
+        if self._conexao_avulsa and self.connection is not None:
+            commit = self._configure_connection(self.connection)
+            if commit and not self.get_autocommit():
+                self.connection.commit()
+
+    def _close(self):
+        if self._conexao_avulsa and self.connection is not None:
+            self._conexao_avulsa = False
+            with self.wrap_database_errors:
+                return self.connection.close()
+        return super()._close()
@@ -0,0 +1,204 @@
+# core/espelho_s3.py
+"""
+Espelho de um prefixo do S3 no disco local (MEDIA_ROOT).
+
+- Lista o bucket com paginação (sem o limite de 1000 chaves de uma chamada só).
+- Decide o que baixar pelo ETag e tamanho do S3 contra um manifesto local
+  (<destino>/.espelho_s3.json), não pelo mtime: um arquivo só é baixado de
+  novo se mudou de fato. Arquivo presente sem entrada no manifesto (baixado
+  por fora) tem o md5 conferido uma vez e passa a constar nele.
+- Baixa num pool de threads, cada arquivo num temporário renomeado no fim.
+- Com `podar`, apaga os arquivos locais que não existem mais no S3 — menos os
+  que ainda estão na fila de envio (core/fila_s3.py), que o S3 ainda não tem.
+- Com `simular`, só relata o que faria.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+from core import s3
+
+MANIFESTO = '.espelho_s3.json'
+TAMANHO_PAGINA = 1000
+
+
+@dataclass
+class ResultadoEspelho:
+    listados: int = 0
+    baixados: int = 0
+    mantidos: int = 0
+    podados: int = 0
+    erros: list = field(default_factory=list)
+    bytes_baixados: int = 0
+    segundos: float = 0.0
+
+    @property
+    def objetos_por_segundo(self):
+        return self.listados / self.segundos if self.segundos else 0.0
+
+    @property
+    def mb_por_segundo(self):
+        return self.bytes_baixados / 1024 / 1024 / self.segundos if self.segundos else 0.0
+
+
+def _md5(caminho):
+    md5 = hashlib.md5()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            md5.update(bloco)
+    return f'"{md5.hexdigest()}"'
+
+
+class EspelhoS3:
+    def __init__(self, destino, prefixo='media/', threads=8, cliente=None, bucket=None):
+        self.destino = str(destino)
+        self.prefixo = prefixo
+        self.threads = threads
+        self.cliente = cliente or s3.cliente()
+        self.bucket = bucket or s3.bucket()
+        self.caminho_manifesto = os.path.join(self.destino, MANIFESTO)
+
+    # -------------------------------------
+    # Manifesto local
+    # -------------------------------------
+    def ler_manifesto(self):
+        try:
+            with open(self.caminho_manifesto) as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError):
+            return {}
+
+    def gravar_manifesto(self, manifesto):
+        os.makedirs(self.destino, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=self.destino, prefix='.manifesto-')
+        with os.fdopen(fd, 'w') as arquivo:
+            json.dump(manifesto, arquivo, separators=(',', ':'))
+        os.replace(temporario, self.caminho_manifesto)
+
+    # -------------------------------------
+    # Listagem e comparação
+    # -------------------------------------
+    def listar(self):
+        """Todos os objetos do prefixo: {chave: (etag, tamanho)}."""
+        objetos = {}
+        paginas = self.cliente.get_paginator('list_objects_v2').paginate(
+            Bucket=self.bucket, Prefix=self.prefixo, PaginationConfig={'PageSize': TAMANHO_PAGINA},
+        )
+        for pagina in paginas:
+            for obj in pagina.get('Contents', []):
+                if not obj['Key'].endswith('/'):  # pula diretórios virtuais
+                    objetos[obj['Key']] = (obj['ETag'], obj['Size'])
+        return objetos
+
+    def caminho_local(self, chave):
+        relativo = chave[len(self.prefixo):] if chave.startswith(self.prefixo) else chave
+        return os.path.join(self.destino, *relativo.split('/'))
+
+    def _atualizado(self, chave, etag, tamanho, manifesto):
+        caminho = self.caminho_local(chave)
+        try:
+            tamanho_local = os.path.getsize(caminho)
+        except OSError:
+            return False
+        if tamanho_local != tamanho:
+            return False
+        registrado = manifesto.get(chave)
+        if registrado is not None:
+            return registrado[0] == etag
+        # Sem registro: ETag de envio simples é o md5 (multipart tem '-' e não dá para conferir)
+        if '-' not in etag and _md5(caminho) == etag:
+            manifesto[chave] = [etag, tamanho]
+            return True
+        return False
+
+    # -------------------------------------
+    # Execução
+    # -------------------------------------
+    def _baixar(self, chave):
+        caminho = self.caminho_local(chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), prefix='.download-')
+        os.close(fd)
+        try:
+            self.cliente.download_file(self.bucket, chave, temporario)
+            os.replace(temporario, caminho)
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+        return os.path.getsize(caminho)
+
+    def _locais(self):
+        """Chaves correspondentes aos arquivos locais (sem os ocultos: manifesto, diários, temporários)."""
+        for pasta, subpastas, arquivos in os.walk(self.destino):
+            subpastas[:] = [s for s in subpastas if not s.startswith('.')]
+            relativa = os.path.relpath(pasta, self.destino).replace(os.sep, '/')
+            for nome in arquivos:
+                if not nome.startswith('.'):
+                    yield self.prefixo + (nome if relativa == '.' else f'{relativa}/{nome}')
+
+    def sincronizar(self, forcar=False, podar=False, simular=False, progresso=None):
+        """
+        Espelha o prefixo e devolve um ResultadoEspelho. `progresso(chave, acao)`
+        é chamado para cada arquivo baixado ('baixar') ou apagado ('podar').
+        """
+        inicio = time.perf_counter()
+        resultado = ResultadoEspelho()
+        manifesto = self.ler_manifesto()
+        objetos = self.listar()
+        resultado.listados = len(objetos)
+
+        pendentes = []
+        for chave, (etag, tamanho) in objetos.items():
+            if not forcar and self._atualizado(chave, etag, tamanho, manifesto):
+                resultado.mantidos += 1
+            else:
+                pendentes.append(chave)
+
+        if simular:
+            resultado.baixados = len(pendentes)
+            for chave in pendentes:
+                if progresso:
+                    progresso(chave, 'baixar')
+        elif pendentes:
+            with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='espelho-s3') as executor:
+                futuros = {executor.submit(self._baixar, chave): chave for chave in pendentes}
+                for futuro in as_completed(futuros):
+                    chave = futuros[futuro]
+                    try:
+                        resultado.bytes_baixados += futuro.result()
+                    except Exception as erro:  # noqa: BLE001 — um arquivo com erro não para o espelho
+                        resultado.erros.append((chave, str(erro)))
+                        continue
+                    manifesto[chave] = list(objetos[chave])
+                    resultado.baixados += 1
+                    if progresso:
+                        progresso(chave, 'baixar')
+
+        if podar:
+            resultado.podados = self._podar(objetos, manifesto, simular, progresso)
+
+        if not simular:
+            # Só o que ainda existe no S3 fica no manifesto
+            self.gravar_manifesto({c: v for c, v in manifesto.items() if c in objetos})
+        resultado.segundos = time.perf_counter() - inicio
+        return resultado
+
+    def _podar(self, objetos, manifesto, simular, progresso):
+        from core.fila_s3 import fila
+
+        aguardando_envio = {entrada['chave'] for entrada in fila.entradas()}
+        podados = 0
+        for chave in list(self._locais()):
+            if chave in objetos or chave in aguardando_envio:
+                continue
+            if not simular:
+                os.remove(self.caminho_local(chave))
+                manifesto.pop(chave, None)
+            podados += 1
+            if progresso:
+                progresso(chave, 'podar')
+        return podados
@@ -0,0 +1,323 @@
+# core/fila_s3.py
+"""
+Fila de envios para o S3.
+
+O storage grava o arquivo em MEDIA_ROOT e devolve o controle ao admin na
+hora; o envio para o S3 fica com um pool limitado de threads
+(ENVIOS_S3_THREADS). Cada envio pendente tem uma entrada no diário em disco
+(ENVIOS_S3_DIARIO, um JSON por arquivo, gravado antes de agendar e apagado
+depois do envio), então um restart ou um worker morto não perde nada: o
+próximo processo que chamar recuperar() reenvia o que ficou.
+
+Cada entrada guarda o dono: um id aleatório do processo que a agendou, que
+segura um flock em .donos/<id>.lock enquanto vive. O pid sozinho não serve —
+depois de um restart do contêiner os pids recomeçam e o de um worker morto
+pode ser o de um processo novo. Sem fcntl (Windows) vale só o pid.
+
+Falhas são repetidas com espera exponencial (ENVIOS_S3_TENTATIVAS vezes);
+esgotadas as tentativas, a entrada fica marcada como falha no diário, aparece
+na página de status do admin e pode ser reenviada de lá.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from core import s3
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+THREADS = 4
+TENTATIVAS = 5
+ESPERA_INICIAL = 1.0  # segundos; dobra a cada tentativa
+ESPERA_MAXIMA = 60.0
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def _processo_vivo(pid):
+    if pid <= 0:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _travado(caminho):
+    """True se outro processo segura o flock do arquivo."""
+    try:
+        descritor = os.open(caminho, os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(descritor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(descritor)  # fechar também solta o flock, se foi obtido
+    return False
+
+
+class FilaEnviosS3:
+    def __init__(self, diretorio=None, threads=None, tentativas=None, espera_inicial=None):
+        self._diretorio = diretorio
+        self._threads = threads
+        self._tentativas = tentativas
+        self._espera_inicial = espera_inicial
+        self._lock = threading.Lock()
+        self._executor = None
+        self._em_andamento = set()
+        self._ocioso = threading.Condition(self._lock)
+        self._recuperada = False
+        self._donos = {}  # diretório -> (pid, id, descritor com o flock)
+        self.enviados = 0
+        self.falhas = 0
+
+    # -------------------------------------
+    # Configuração
+    # -------------------------------------
+    @property
+    def diretorio(self):
+        return str(self._diretorio or _config('ENVIOS_S3_DIARIO', os.path.join(settings.MEDIA_ROOT, '.envios_s3')))
+
+    @property
+    def tentativas(self):
+        return self._tentativas or _config('ENVIOS_S3_TENTATIVAS', TENTATIVAS)
+
+    @property
+    def espera_inicial(self):
+        return _config('ENVIOS_S3_ESPERA', ESPERA_INICIAL) if self._espera_inicial is None else self._espera_inicial
+
+    def _executor_ativo(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._threads or _config('ENVIOS_S3_THREADS', THREADS),
+                    thread_name_prefix='envio-s3',
+                )
+            return self._executor
+
+    # -------------------------------------
+    # Diário em disco
+    # -------------------------------------
+    def _pasta_donos(self):
+        return os.path.join(self.diretorio, '.donos')
+
+    def _dono(self):
+        """Id deste processo no diário; criado (com o flock) na primeira vez e de novo depois de um fork."""
+        diretorio = self.diretorio
+        with self._lock:
+            pid, dono, _ = self._donos.get(diretorio, (None, None, None))
+            if pid == os.getpid():
+                return dono
+            dono = uuid.uuid4().hex
+            descritor = None
+            if fcntl is not None:
+                os.makedirs(self._pasta_donos(), exist_ok=True)
+                descritor = os.open(os.path.join(self._pasta_donos(), f'{dono}.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(descritor, fcntl.LOCK_EX)
+            # O descritor fica aberto até o processo acabar: é ele que diz "vivo"
+            self._donos[diretorio] = (os.getpid(), dono, descritor)
+            return dono
+
+    def _dono_vivo(self, entrada):
+        dono = entrada.get('dono')
+        if dono == self._dono():
+            return True
+        if fcntl is None or not dono:
+            return _processo_vivo(entrada['pid'])
+        caminho = os.path.join(self._pasta_donos(), f'{dono}.lock')
+        if _travado(caminho):
+            return True
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+        return False
+
+    def _caminho(self, nome):
+        return os.path.join(self.diretorio, hashlib.sha1(nome.encode('utf-8')).hexdigest() + '.json')
+
+    def _gravar_entrada(self, entrada):
+        os.makedirs(self.diretorio, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=self.diretorio, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as arquivo:
+            json.dump(entrada, arquivo)
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        os.replace(temporario, self._caminho(entrada['nome']))
+
+    def _ler_entrada(self, caminho):
+        try:
+            with open(caminho) as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError):
+            return None
+
+    def _apagar_entrada(self, nome):
+        try:
+            os.remove(self._caminho(nome))
+        except FileNotFoundError:
+            pass
+
+    def entradas(self):
+        """Todas as entradas do diário (pendentes e com falha), das mais antigas às mais novas."""
+        if not os.path.isdir(self.diretorio):
+            return []
+        entradas = []
+        for arquivo in os.listdir(self.diretorio):
+            if arquivo.endswith('.json'):
+                entrada = self._ler_entrada(os.path.join(self.diretorio, arquivo))
+                if entrada:
+                    entradas.append(entrada)
+        return sorted(entradas, key=lambda e: e['criado_em'])
+
+    # -------------------------------------
+    # Agendamento
+    # -------------------------------------
+    def agendar(self, nome, caminho_local):
+        """Anota o envio no diário e o entrega ao pool; retorna na hora."""
+        if not self._recuperada:
+            self.recuperar()
+        entrada = {
+            'nome': nome,
+            'caminho': str(caminho_local),
+            'chave': s3.chave(nome),
+            'tentativas': 0,
+            'erro': '',
+            'falhou': False,
+            'pid': os.getpid(),
+            'dono': self._dono(),
+            'criado_em': time.time(),
+        }
+        self._gravar_entrada(entrada)
+        self._submeter(entrada)
+
+    def _submeter(self, entrada):
+        with self._lock:
+            if entrada['nome'] in self._em_andamento:
+                return
+            self._em_andamento.add(entrada['nome'])
+        self._executor_ativo().submit(self._enviar, entrada)
+
+    def _enviar(self, entrada):
+        try:
+            for tentativa in range(entrada['tentativas'], self.tentativas):
+                try:
+                    s3.cliente().upload_file(entrada['caminho'], s3.bucket(), entrada['chave'])
+                except FileNotFoundError:
+                    # Apagado localmente antes do envio: não há o que mandar
+                    logger.warning('Envio de %s descartado: arquivo local não existe mais', entrada['nome'])
+                    self._apagar_entrada(entrada['nome'])
+                    return
+                except Exception as erro:  # noqa: BLE001 — qualquer falha de rede/credencial é repetida
+                    entrada.update(tentativas=tentativa + 1, erro=str(erro)[:500])
+                    self._gravar_entrada(entrada)
+                    if tentativa + 1 < self.tentativas:
+                        time.sleep(min(self.espera_inicial * 2 ** tentativa, ESPERA_MAXIMA))
+                    continue
+                self._apagar_entrada(entrada['nome'])
+                with self._lock:
+                    self.enviados += 1
+                logger.info('Upload para S3 concluído: %s', entrada['chave'])
+                return
+
+            entrada['falhou'] = True
+            self._gravar_entrada(entrada)
+            with self._lock:
+                self.falhas += 1
+            logger.error('Envio de %s para o S3 falhou %d vezes: %s',
+                         entrada['chave'], entrada['tentativas'], entrada['erro'])
+        finally:
+            with self._lock:
+                self._em_andamento.discard(entrada['nome'])
+                self._ocioso.notify_all()
+
+    def recuperar(self):
+        """
+        Reagenda o que ficou no diário por processos que já não existem (restart,
+        worker morto). Entradas que esgotaram as tentativas ficam para reenviar().
+        """
+        self._recuperada = True
+        recuperadas = 0
+        for entrada in self.entradas():
+            if entrada['falhou'] or self._dono_vivo(entrada):
+                continue
+            entrada.update(pid=os.getpid(), dono=self._dono())
+            self._gravar_entrada(entrada)
+            self._submeter(entrada)
+            recuperadas += 1
+        if recuperadas:
+            logger.info('%d envios pendentes retomados do diário', recuperadas)
+        self._limpar_donos()
+        return recuperadas
+
+    def _limpar_donos(self):
+        """Apaga os .lock de processos que já acabaram (cada processo que agendou algo deixa um)."""
+        if fcntl is None or not os.path.isdir(self._pasta_donos()):
+            return
+        for arquivo in os.listdir(self._pasta_donos()):
+            caminho = os.path.join(self._pasta_donos(), arquivo)
+            if arquivo.endswith('.lock') and not _travado(caminho):
+                try:
+                    os.remove(caminho)
+                except FileNotFoundError:
+                    pass
+
+    def reenviar(self):
+        """Zera as tentativas das entradas com falha e as agenda de novo."""
+        reenviadas = 0
+        for entrada in self.entradas():
+            if not entrada['falhou']:
+                continue
+            entrada.update(tentativas=0, falhou=False, pid=os.getpid(), dono=self._dono())
+            self._gravar_entrada(entrada)
+            self._submeter(entrada)
+            reenviadas += 1
+        return reenviadas
+
+    def aguardar(self, timeout=None):
+        """Espera os envios em andamento neste processo terminarem; True se a fila esvaziou."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._em_andamento:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._ocioso.wait(restante)
+        return True
+
+    def situacao(self):
+        entradas = self.entradas()
+        with self._lock:
+            em_andamento = len(self._em_andamento)
+        return {
+            'pendentes': [e for e in entradas if not e['falhou']],
+            'falhas': [e for e in entradas if e['falhou']],
+            'em_andamento': em_andamento,
+            'enviados': self.enviados,
+            'falhas_processo': self.falhas,
+        }
+
+
+fila = FilaEnviosS3()
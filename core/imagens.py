@@ -0,0 +1,321 @@
+# core/imagens.py
+"""
+Derivados responsivos das imagens enviadas (Pillow).
+
+Para cada imagem salva pelo storage gera versões de tamanho fixo, com o lado
+maior limitado (TAMANHOS: thumb, card, zoom, sem ampliar), em WebP e em JPEG
+para os navegadores sem WebP (e AVIF, se listado em IMAGENS_FORMATOS e
+suportado pelo Pillow instalado). Ficam ao lado do original, numa pasta com
+o hash do conteúdo:
+
+    produtos/batom.3f9a0c1be2d4.jpg
+    produtos/_derivados/3f9a0c1be2d4/batom-card.webp
+    produtos/_derivados/batom.3f9a0c1be2d4.jpg.json   <- manifesto: hash, arquivos e larguras
+
+O manifesto diz aos templates que arquivos existem. A requisição só o procura
+no cache compartilhado (renderizar_cards busca os de todos os cards num
+get_many, via precarregar()); quem o põe lá é o consumidor da fila, ao
+publicar ou ao conferir uma imagem já em dia. Fora do cache, a vitrine usa o
+original e a imagem vai para a fila, cujo consumidor lê o manifesto do
+disco/S3 — nunca a requisição. Imagem nova (outro conteúdo) gera outra pasta, então as URLs dos
+derivados nunca mudam de conteúdo.
+
+A geração roda fora da requisição: o storage só agenda (core/tarefas_imagens.py)
+e a thread consumidora chama gerar() num pool de processos.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import posixpath
+import shutil
+import tempfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from core.cache import CacheNamespace
+from core.midia import sem_hash
+
+logger = logging.getLogger(__name__)
+
+cache_imagens = CacheNamespace('imagens', timeout=60 * 60 * 24)
+
+TAMANHOS = {'thumb': 160, 'card': 480, 'zoom': 1200}  # lado maior, em px
+FORMATOS_PADRAO = ('webp', 'jpg')
+OPCOES = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'avif': ('AVIF', {'quality': 60}),
+}
+EXTENSOES = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff'}
+PASTA = '_derivados'
+AUSENTE_TTL = 300  # falta no cache vira uma tarefa na fila a cada AUSENTE_TTL, não por requisição
+
+_precarregados = ContextVar('manifestos_precarregados', default=None)
+
+
+def formatos():
+    escolhidos = getattr(settings, 'IMAGENS_FORMATOS', FORMATOS_PADRAO)
+    if 'avif' in escolhidos:
+        from PIL import features
+        if not features.check('avif'):
+            escolhidos = tuple(f for f in escolhidos if f != 'avif')
+    return escolhidos
+
+
+def deve_gerar(nome):
+    """Imagens originais; não os próprios derivados nem outros arquivos."""
+    return (
+        f'/{PASTA}/' not in f'/{nome}'
+        and os.path.splitext(nome)[1].lower() in EXTENSOES
+    )
+
+
+def caminho_manifesto(nome):
+    pasta, arquivo = posixpath.split(nome)
+    return posixpath.join(pasta, PASTA, f'{arquivo}.json')
+
+
+def caminho_derivado(nome, digest, tamanho, formato):
+    pasta, arquivo = posixpath.split(sem_hash(nome))  # o hash já está na pasta
+    base = os.path.splitext(arquivo)[0]
+    return posixpath.join(pasta, PASTA, digest, f'{base}-{tamanho}.{formato}')
+
+
+def hash_conteudo(caminho):
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            sha.update(bloco)
+    return sha.hexdigest()[:12]
+
+
+def _local(nome):
+    return os.path.join(settings.MEDIA_ROOT, *nome.split('/'))
+
+
+def _gravar(nome, dados):
+    """Grava `dados` em MEDIA_ROOT/nome (atômico)."""
+    caminho = _local(nome)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), prefix='.derivado-')
+    with os.fdopen(fd, 'wb') as arquivo:
+        arquivo.write(dados)
+    os.replace(temporario, caminho)
+
+
+def arquivos(manifesto):
+    """Os derivados listados no manifesto (sem o arquivo do próprio manifesto)."""
+    return [nome for por_formato in manifesto['arquivos'].values() for nome in por_formato.values()]
+
+
+def publicar(nome, manifesto):
+    """
+    Grava o manifesto de `nome`, agenda o envio dele e dos derivados para o S3 e
+    atualiza o cache. Roda no processo que coordena o pool, não nos filhos.
+    """
+    from core import s3
+    from core.cache_disco import cache_disco
+    from core.fila_s3 import fila
+
+    _gravar(caminho_manifesto(nome), json.dumps(manifesto).encode('utf-8'))
+    publicados = arquivos(manifesto) + [caminho_manifesto(nome)]
+    # Primeiro no diário de envios, depois no índice do cache: a poda nunca vê
+    # no índice um arquivo que ainda não está protegido
+    if s3.bucket():
+        for arquivo in publicados:
+            fila.agendar(arquivo, _local(arquivo))
+    for arquivo in publicados:
+        cache_disco.registrar(arquivo)
+    cache_imagens.set(_chave(nome), manifesto, None)
+
+
+def atualizado(nome, digest):
+    """True se os derivados de `nome` já correspondem ao conteúdo `digest` e aos formatos atuais."""
+    atual = carregar(nome)
+    return bool(atual) and atual.get('hash') == digest and set(atual['formatos']) >= set(formatos())
+
+
+def replicar(origem, nome):
+    """
+    Derivados de `nome` a partir dos de outra imagem com o mesmo conteúdo
+    (manifesto `origem`): hardlink/cópia dos arquivos, sem reencodar.
+    """
+    manifesto = {**origem, 'arquivos': {}}
+    for tamanho, por_formato in origem['arquivos'].items():
+        manifesto['arquivos'][tamanho] = {}
+        for formato, arquivo in por_formato.items():
+            destino = caminho_derivado(nome, origem['hash'], tamanho, formato)
+            if destino != arquivo and not os.path.exists(_local(destino)):
+                os.makedirs(os.path.dirname(_local(destino)), exist_ok=True)
+                try:
+                    os.link(_local(arquivo), _local(destino))
+                except OSError:
+                    shutil.copyfile(_local(arquivo), _local(destino))
+            manifesto['arquivos'][tamanho][formato] = destino
+    return manifesto
+
+
+def _preparar(imagem, formato):
+    """Modo de cor aceito pelo formato; JPEG não tem transparência: fundo branco."""
+    from PIL import Image
+
+    transparente = imagem.mode in ('RGBA', 'LA') or (imagem.mode == 'P' and 'transparency' in imagem.info)
+    if formato == 'jpg':
+        if transparente:
+            fundo = Image.new('RGB', imagem.size, (255, 255, 255))
+            fundo.paste(imagem.convert('RGBA'), mask=imagem.convert('RGBA').getchannel('A'))
+            return fundo
+        return imagem.convert('RGB')
+    return imagem.convert('RGBA' if transparente else 'RGB')
+
+
+def gerar(nome, forcar=False, publicar_resultado=True):
+    """
+    Gera (ou confirma) os derivados do arquivo `nome` de MEDIA_ROOT e devolve o
+    manifesto; None se não for uma imagem legível. Se o manifesto já aponta
+    para o mesmo conteúdo, não refaz nada. Com publicar_resultado=False só grava
+    os derivados: quem chamou publica (processo filho do pool).
+    """
+    from PIL import Image, ImageOps
+
+    caminho = _local(nome)
+    digest = hash_conteudo(caminho)
+    if not forcar and atualizado(nome, digest):
+        return _ler_manifesto(nome)
+
+    try:
+        with Image.open(caminho) as original:
+            maior = max(TAMANHOS.values())
+            original.draft('RGB', (maior, maior))  # JPEG: decodifica já reduzido
+            imagem = ImageOps.exif_transpose(original)
+            imagem.load()
+    except (OSError, ValueError, Image.DecompressionBombError) as erro:
+        logger.warning('Derivados de %s não gerados: %s', nome, erro)
+        return None
+
+    manifesto = {'hash': digest, 'formatos': list(formatos()), 'arquivos': {}, 'larguras': {}}
+    # Do maior para o menor: cada redução parte da anterior, já pequena
+    for tamanho, lado in sorted(TAMANHOS.items(), key=lambda t: -t[1]):
+        imagem = imagem.copy()
+        imagem.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+        manifesto['larguras'][tamanho] = imagem.width
+        manifesto['arquivos'][tamanho] = {}
+        for formato in manifesto['formatos']:
+            pil, opcoes = OPCOES[formato]
+            saida = io.BytesIO()
+            _preparar(imagem, formato).save(saida, pil, **opcoes)
+            derivado = caminho_derivado(nome, digest, tamanho, formato)
+            _gravar(derivado, saida.getvalue())
+            manifesto['arquivos'][tamanho][formato] = derivado
+
+    if publicar_resultado:
+        publicar(nome, manifesto)
+    return manifesto
+
+
+# -------------------------------------
+# Consulta (templates)
+# -------------------------------------
+def _chave(nome):
+    return hashlib.md5(nome.encode('utf-8')).hexdigest()
+
+
+def _ler_manifesto(nome):
+    from django.core.files.storage import default_storage
+
+    caminho = caminho_manifesto(nome)
+    try:
+        # exists() do storage traz do S3 se faltar no disco local
+        if not default_storage.exists(caminho):
+            return None
+        with default_storage.open(caminho) as arquivo:
+            return json.loads(arquivo.read())
+    except (OSError, ValueError):
+        return None
+
+
+def carregar(nome):
+    """Lê o manifesto do storage (disco ou S3) e o repõe no cache. Só no consumidor da fila."""
+    dados = _ler_manifesto(nome)
+    if dados:
+        cache_imagens.set(_chave(nome), dados, None)
+    return dados
+
+
+def sem_derivados(nome):
+    """Imagem ilegível ou apagada: a vitrine fica com o original até o arquivo ser salvo de novo."""
+    cache_imagens.set(_chave(nome), {}, None)
+
+
+def _pedir_carga(nomes):
+    """Manifestos fora do cache: o consumidor da fila lê (ou gera) e repõe; até lá, o original."""
+    from core import tarefas_imagens
+
+    faltando = [nome for nome in nomes if deve_gerar(nome)]
+    if not faltando:
+        return
+    cache_imagens.set_many({_chave(nome): {} for nome in faltando}, AUSENTE_TTL)
+    for nome in faltando:
+        tarefas_imagens.agendar(nome, substituir=False)
+    tarefas_imagens.disparar()
+
+
+def manifestos(nomes):
+    """{nome: manifesto ou None} num único get_many; os que faltam no cache vão para a fila."""
+    chaves = {_chave(nome): nome for nome in set(nomes) if nome}
+    encontrados = cache_imagens.get_many(list(chaves))
+    _pedir_carga([nome for chave, nome in chaves.items() if chave not in encontrados])
+    return {nome: encontrados.get(chave) or None for chave, nome in chaves.items()}
+
+
+@contextmanager
+def precarregar(nomes):
+    """Dentro do bloco, manifesto() responde por `nomes` sem ir ao cache (cards de uma página)."""
+    token = _precarregados.set({**(_precarregados.get() or {}), **manifestos(nomes)})
+    try:
+        yield
+    finally:
+        _precarregados.reset(token)
+
+
+def manifesto(nome):
+    """Manifesto dos derivados de `nome`, só do cache compartilhado; None se não há (ainda)."""
+    if not nome:
+        return None
+    precarregados = _precarregados.get()
+    if precarregados is not None and nome in precarregados:
+        return precarregados[nome]
+    return manifestos([nome])[nome]
+
+
+def url(nome, tamanho, formato='jpg'):
+    """URL do derivado, ou None se ele ainda não existe (o chamador usa o original)."""
+    from django.core.files.storage import default_storage
+
+    dados = manifesto(nome)
+    try:
+        return default_storage.url(dados['arquivos'][tamanho][formato])
+    except (TypeError, KeyError):
+        return None
+
+
+def srcset(nome, formato='webp'):
+    """'url 160w, url 480w, url 1200w' para o atributo srcset; '' se não há derivados."""
+    from django.core.files.storage import default_storage
+
+    dados = manifesto(nome)
+    if not dados or formato not in dados['formatos']:
+        return ''
+    return ', '.join(
+        f"{default_storage.url(arquivos[formato])} {dados['larguras'][tamanho]}w"
+        for tamanho, arquivos in sorted(dados['arquivos'].items(), key=lambda t: dados['larguras'][t[0]])
+    )
+
+
+def esquecer(nome):
+    """Descarta o manifesto em cache (o arquivo original mudou)."""
+    cache_imagens.delete(_chave(nome))
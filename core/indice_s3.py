@@ -0,0 +1,92 @@
+# core/indice_s3.py
+"""
+Índice em memória das chaves de um prefixo do S3.
+
+Produto.save vinculava a imagem media/produtos/<slug>.<ext> perguntando ao
+S3 (um head_object por extensão, com um cliente novo a cada save). Aqui a
+resposta vem de um set montado com uma listagem paginada: a primeira
+consulta do processo monta o índice, as seguintes são um `in`. Passado
+INDICE_S3_INTERVALO, a próxima consulta dispara a atualização numa thread e
+continua respondendo com o índice anterior; arquivos enviados por este
+processo entram no índice na hora (adicionar()).
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from core import s3
+
+logger = logging.getLogger(__name__)
+
+INTERVALO = 600  # segundos entre atualizações
+
+
+class IndiceChavesS3:
+    def __init__(self, prefixo, intervalo=None):
+        self.prefixo = prefixo
+        self._intervalo = intervalo
+        self._chaves = None
+        self._atualizado_em = 0.0
+        self._lock = threading.Lock()
+        self._atualizando = False
+
+    @property
+    def intervalo(self):
+        return self._intervalo or getattr(settings, 'INDICE_S3_INTERVALO', INTERVALO)
+
+    def _listar(self):
+        chaves = set()
+        paginas = s3.cliente().get_paginator('list_objects_v2').paginate(Bucket=s3.bucket(), Prefix=self.prefixo)
+        for pagina in paginas:
+            chaves.update(obj['Key'] for obj in pagina.get('Contents', []))
+        return chaves
+
+    def atualizar(self):
+        """Relista o prefixo (síncrono). Sem S3 configurado, o índice fica vazio."""
+        try:
+            chaves = self._listar() if s3.bucket() else set()
+        except Exception:  # noqa: BLE001 — sem rede, fica com o que tinha e tenta no próximo intervalo
+            logger.warning('Não foi possível listar s3://%s/%s', s3.bucket(), self.prefixo, exc_info=True)
+            chaves = self._chaves if self._chaves is not None else set()
+        with self._lock:
+            self._chaves = chaves
+            self._atualizado_em = time.monotonic()
+            self._atualizando = False
+        return len(chaves)
+
+    def _em_dia(self):
+        if self._chaves is None:
+            self.atualizar()
+            return
+        if time.monotonic() - self._atualizado_em < self.intervalo:
+            return
+        with self._lock:
+            if self._atualizando:
+                return
+            self._atualizando = True
+        threading.Thread(target=self.atualizar, name='indice-s3', daemon=True).start()
+
+    def contem(self, chave):
+        self._em_dia()
+        chaves = self._chaves
+        return chaves is not None and chave in chaves
+
+    def adicionar(self, chave):
+        chaves = self._chaves
+        if chave.startswith(self.prefixo) and chaves is not None:
+            chaves.add(chave)
+
+    def descartar(self, chave):
+        chaves = self._chaves
+        if chaves is not None:
+            chaves.discard(chave)
+
+    def invalidar(self):
+        with self._lock:
+            self._chaves = None
+
+
+# Imagens principais dos produtos (vinculadas por slug em Produto.save)
+indice_produtos = IndiceChavesS3('media/produtos/')
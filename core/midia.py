@@ -0,0 +1,363 @@
+# core/midia.py
+"""
+Nomes de mídia com hash do conteúdo e os cabeçalhos de cache que eles permitem.
+
+O storage grava cada upload como `<base>.<hash12>.<ext>` (mesma convenção do
+CompressedManifestStaticFilesStorage dos estáticos): trocar a imagem gera
+outro nome e, portanto, outra URL. Como o conteúdo de uma URL com hash nunca
+muda, ela vai com `Cache-Control: public, max-age=31536000, immutable` —
+assim como os derivados em `_derivados/<hash12>/` (core/imagens.py). Nomes
+antigos, sem hash (e os vinculados do S3 por slug), recebem só
+MIDIA_MAX_AGE, já que o arquivo pode ser substituído no mesmo nome.
+
+Servir: MidiaMiddleware responde MEDIA_URL antes de sessão, autenticação e
+carrinho (como o WhiteNoise faz com os estáticos), em produção e em
+desenvolvimento:
+
+- arquivo no cache local: FileResponse (o gunicorn usa sendfile), ou só o
+  cabeçalho X-Sendfile / X-Accel-Redirect para o servidor na frente
+  (MIDIA_SENDFILE); ETag/Last-Modified com 304, Range de um intervalo (206/416)
+  e variantes pré-comprimidas (.br/.gz ao lado do arquivo) conforme o
+  Accept-Encoding;
+- arquivo só no S3: repassa o corpo do get_object ao cliente enquanto grava
+  no cache local (temporário renomeado no fim), sem esperar o download
+  inteiro; requisições simultâneas do mesmo arquivo esperam esse download
+  (o mesmo single-flight do storage) e servem do disco; 404 do S3 entra no
+  cache negativo do storage.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from urllib.parse import quote
+
+from core.cache import metricas
+from core.cache_disco import cache_disco
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_HASH = 12
+MAX_AGE_IMUTAVEL = 60 * 60 * 24 * 365
+MAX_AGE = 60 * 60  # nomes sem hash
+
+_NOME_COM_HASH = re.compile(r'\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[^./]+)?$' % TAMANHO_HASH)
+_PASTA_COM_HASH = re.compile(r'(^|/)_derivados/[0-9a-f]{%d}/' % TAMANHO_HASH)
+
+
+def hash_arquivo(arquivo):
+    """sha256 (12 primeiros dígitos) de um File do Django, lido em blocos."""
+    sha = hashlib.sha256()
+    if hasattr(arquivo, 'seek'):
+        arquivo.seek(0)
+    for bloco in arquivo.chunks():
+        sha.update(bloco)
+    if hasattr(arquivo, 'seek'):
+        arquivo.seek(0)
+    return sha.hexdigest()[:TAMANHO_HASH]
+
+
+def hash_do_nome(nome):
+    """O hash embutido em `nome`, ou None se for um nome antigo."""
+    encontrado = _NOME_COM_HASH.search(posixpath.basename(nome))
+    return encontrado.group('hash') if encontrado else None
+
+
+def sem_hash(nome):
+    """'produtos/batom.3f9a0c1be2d4.jpg' -> 'produtos/batom.jpg'."""
+    pasta, arquivo = posixpath.split(nome)
+    return posixpath.join(pasta, _NOME_COM_HASH.sub(lambda m: m.group('ext') or '', arquivo))
+
+
+def com_hash(nome, digest):
+    """'produtos/batom.jpg' -> 'produtos/batom.<digest>.jpg' (troca um hash anterior)."""
+    base, ext = os.path.splitext(sem_hash(nome))
+    return f'{base}.{digest}{ext}'
+
+
+def imutavel(nome):
+    return bool(hash_do_nome(nome) or _PASTA_COM_HASH.search(nome))
+
+
+def cache_control(nome):
+    if imutavel(nome):
+        return f'public, max-age={MAX_AGE_IMUTAVEL}, immutable'
+    return f"public, max-age={getattr(settings, 'MIDIA_MAX_AGE', MAX_AGE)}"
+
+
+# -------------------------------------
+# Servir
+# -------------------------------------
+BLOCO = 64 * 1024
+COMPRESSOES = (('br', '.br'), ('gzip', '.gz'))  # em ordem de preferência
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _caminho_seguro(caminho):
+    """
+    Nome relativo a MEDIA_ROOT; 404 para fuga do diretório e arquivos ocultos
+    (diários, manifesto do espelho). `caminho` vem de request.path, já decodificado.
+    """
+    nome = posixpath.normpath(caminho).lstrip('/')
+    if not nome or nome == '.' or any(parte.startswith('.') for parte in nome.split('/')):
+        raise Http404
+    try:
+        return nome, safe_join(settings.MEDIA_ROOT, nome)
+    except Exception:  # SuspiciousFileOperation
+        raise Http404
+
+
+def _etag(nome, estado, codificacao=None):
+    digest = hash_do_nome(nome)
+    etag = f'{digest}-{estado.st_size:x}' if digest else f'{estado.st_mtime_ns:x}-{estado.st_size:x}'
+    return quote_etag(f'{etag}-{codificacao}' if codificacao else etag)  # cada representação tem o seu
+
+
+def _nao_modificado(request, etag, modificado_em):
+    se_nenhum = request.META.get('HTTP_IF_NONE_MATCH')
+    if se_nenhum is not None:
+        return etag in [e.strip() for e in se_nenhum.split(',')] or se_nenhum.strip() == '*'
+    desde = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return desde is not None and int(modificado_em) <= desde
+
+
+def _variante_comprimida(request, caminho):
+    """(caminho, codificação) da versão pré-comprimida aceita pelo cliente, ou (caminho, None)."""
+    aceitas = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for codificacao, sufixo in COMPRESSOES:
+        if codificacao in aceitas and os.path.isfile(caminho + sufixo):
+            return caminho + sufixo, codificacao
+    return caminho, None
+
+
+def _intervalo(request, etag, tamanho):
+    """(inicio, fim) de um Range válido; None para servir tudo (sem Range ou inválido); False se não satisfazível."""
+    pedido = request.META.get('HTTP_RANGE', '')
+    encontrado = _RANGE.match(pedido.replace(' ', ''))
+    if not encontrado:
+        return None  # ausente, inválido ou vários intervalos: resposta inteira
+    se_range = request.META.get('HTTP_IF_RANGE')
+    if se_range is not None and se_range.strip() != etag:
+        return None
+    inicio, fim = encontrado.groups()
+    if not inicio:
+        if not fim:
+            return None  # 'bytes=-': inválido
+        if int(fim) == 0:
+            return False  # bytes=-0: começa no fim do arquivo
+        inicio, fim = max(tamanho - int(fim), 0), tamanho - 1  # bytes=-N: os últimos N
+    else:
+        if fim and int(fim) < int(inicio):
+            return None  # bytes=5-3: inválido (RFC 9110), não insatisfazível
+        inicio, fim = int(inicio), min(int(fim), tamanho - 1) if fim else tamanho - 1
+    if inicio >= tamanho:
+        return False
+    return inicio, fim
+
+
+def _trecho(caminho, inicio, tamanho):
+    with open(caminho, 'rb') as arquivo:
+        arquivo.seek(inicio)
+        while tamanho > 0:
+            bloco = arquivo.read(min(BLOCO, tamanho))
+            if not bloco:
+                break
+            tamanho -= len(bloco)
+            yield bloco
+
+
+def _cabecalhos(resposta, nome, etag=None, modificado_em=None):
+    resposta['Cache-Control'] = cache_control(nome)
+    if etag:
+        resposta['ETag'] = etag
+    if modificado_em is not None:
+        resposta['Last-Modified'] = http_date(modificado_em)
+    return resposta
+
+
+def servir(request, caminho):
+    """Serve MEDIA_ROOT/caminho (ou o traz do S3); ver a docstring do módulo."""
+    nome, local = _caminho_seguro(caminho)
+    try:
+        estado = os.stat(local)
+    except OSError:
+        return _do_s3(request, nome)
+    if not os.path.isfile(local):
+        raise Http404
+
+    arquivo, codificacao = _variante_comprimida(request, local)
+    etag = _etag(nome, estado, codificacao)
+    metricas.registrar('midia', 'hit')
+    cache_disco.tocar(nome)
+    if _nao_modificado(request, etag, estado.st_mtime):
+        resposta = _cabecalhos(HttpResponseNotModified(), nome, etag, estado.st_mtime)
+        resposta['Vary'] = 'Accept-Encoding'
+        return resposta
+
+    tipo = mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+    tamanho = estado.st_size if arquivo == local else os.path.getsize(arquivo)
+    intervalo = None if codificacao else _intervalo(request, etag, tamanho)
+
+    if intervalo is False:
+        resposta = HttpResponse(status=416)
+        resposta['Content-Range'] = f'bytes */{tamanho}'
+        return _cabecalhos(resposta, nome, etag)
+
+    sendfile = getattr(settings, 'MIDIA_SENDFILE', '')
+    if request.method == 'HEAD' or (sendfile and not intervalo):
+        # Sem corpo: o servidor na frente envia o arquivo (e trata o Range sozinho)
+        resposta = HttpResponse(content_type=tipo)
+        if request.method != 'HEAD':
+            if sendfile == 'x-accel-redirect':
+                relativo = os.path.relpath(arquivo, settings.MEDIA_ROOT).replace(os.sep, '/')
+                resposta['X-Accel-Redirect'] = quote(getattr(settings, 'MIDIA_ACCEL_PREFIXO', '/_midia/') + relativo)
+            else:
+                resposta['X-Sendfile'] = arquivo
+        else:
+            resposta['Content-Length'] = tamanho
+    elif intervalo:
+        inicio, fim = intervalo
+        resposta = StreamingHttpResponse(_trecho(arquivo, inicio, fim - inicio + 1), status=206, content_type=tipo)
+        resposta['Content-Length'] = fim - inicio + 1
+        resposta['Content-Range'] = f'bytes {inicio}-{fim}/{tamanho}'
+    else:
+        resposta = FileResponse(open(arquivo, 'rb'), content_type=tipo)
+
+    if codificacao:
+        resposta['Content-Encoding'] = codificacao
+    resposta['Accept-Ranges'] = 'none' if codificacao else 'bytes'
+    resposta['Vary'] = 'Accept-Encoding'
+    return _cabecalhos(resposta, nome, etag, estado.st_mtime)
+
+
+class _Repasse:
+    """Iterador do corpo repassado; ao fechar (fim da resposta), solta a reserva do download."""
+
+    def __init__(self, corpo, nome, local):
+        self._corpo = corpo
+        self._nome = nome
+        self._blocos = _repassar_e_guardar(corpo, nome, local)
+
+    def __iter__(self):
+        return self._blocos
+
+    def close(self):
+        from core.storages import liberar_download
+
+        try:
+            self._blocos.close()
+            self._corpo.close()  # o gerador nem começou: o finally dele não rodou
+        finally:
+            liberar_download(self._nome)
+
+
+def _repassar_e_guardar(corpo, nome, local):
+    """Entrega o corpo do S3 em blocos e grava o mesmo conteúdo no cache local."""
+    os.makedirs(os.path.dirname(local), exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=os.path.dirname(local), prefix='.download-')
+    completo = False
+    try:
+        with os.fdopen(fd, 'wb') as arquivo:
+            for bloco in iter(lambda: corpo.read(BLOCO), b''):
+                arquivo.write(bloco)
+                yield bloco
+        os.replace(temporario, local)
+        completo = True
+        cache_disco.registrar(nome)
+    finally:
+        # Cliente desconectou no meio: nada de arquivo pela metade no cache
+        if not completo and os.path.exists(temporario):
+            os.remove(temporario)
+        corpo.close()
+
+
+def _indisponivel(nome, erro):
+    logger.warning('S3 indisponível ao servir %s: %s', nome, erro)
+    resposta = HttpResponse(status=503)
+    resposta['Retry-After'] = '5'
+    resposta['Cache-Control'] = 'no-store'
+    return resposta
+
+
+def _do_s3(request, nome):
+    from core import s3
+    from core.storages import ESPERA_DOWNLOAD, cache_ausentes, chave_ausente, reservar_download
+
+    metricas.registrar('midia', 'miss')
+    if not s3.bucket() or cache_ausentes.get(chave_ausente(nome)):
+        raise Http404
+
+    local = os.path.join(settings.MEDIA_ROOT, *nome.split('/'))
+    em_andamento = reservar_download(nome)
+    if em_andamento is not None:
+        # Outra requisição (ou o storage) já baixa este arquivo: espera e serve do disco
+        metricas.registrar('midia', 'espera')
+        em_andamento.wait(ESPERA_DOWNLOAD)
+        if os.path.isfile(local):
+            return servir(request, nome)
+        if cache_ausentes.get(chave_ausente(nome)):
+            raise Http404
+        return _baixar(request, nome, local, reservado=False)  # o outro falhou: tenta por conta própria
+    return _baixar(request, nome, local, reservado=True)
+
+
+def _baixar(request, nome, local, reservado):
+    from botocore.exceptions import ClientError
+
+    from core import s3
+    from core.storages import cache_ausentes, chave_ausente, liberar_download
+
+    entregue = False  # com o corpo em andamento, quem solta a reserva é o _Repasse
+    try:
+        try:
+            objeto = s3.cliente().get_object(Bucket=s3.bucket(), Key=s3.chave(nome))
+        except ClientError as erro:
+            if not s3.nao_encontrado(erro):
+                return _indisponivel(nome, erro)
+            cache_ausentes.set(chave_ausente(nome), True, getattr(settings, 'MIDIA_AUSENTE_TTL', cache_ausentes.timeout))
+            metricas.registrar('midia', 'ausente')
+            raise Http404
+        except Exception as erro:  # noqa: BLE001 — rede/credenciais
+            return _indisponivel(nome, erro)
+        metricas.registrar('midia', 'download')
+
+        tipo = mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+        if request.method == 'HEAD':
+            objeto['Body'].close()
+            resposta = HttpResponse(content_type=tipo)
+        elif reservado:
+            resposta = StreamingHttpResponse(_Repasse(objeto['Body'], nome, local), content_type=tipo)
+            entregue = True
+        else:
+            resposta = StreamingHttpResponse(_repassar_e_guardar(objeto['Body'], nome, local), content_type=tipo)
+        resposta['Content-Length'] = objeto['ContentLength']
+        return _cabecalhos(resposta, nome)
+    finally:
+        if reservado and not entregue:
+            liberar_download(nome)
+
+
+class MidiaMiddleware:
+    """Responde GET/HEAD em MEDIA_URL sem passar pelo resto da pilha; ver a docstring do módulo."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'MIDIA_SERVIR', True):
+            raise MiddlewareNotUsed  # o servidor na frente serve /media/ direto
+        self.get_response = get_response
+        self.prefixo = settings.MEDIA_URL
+
+    def __call__(self, request):
+        if request.path.startswith(self.prefixo) and request.method in ('GET', 'HEAD'):
+            try:
+                return servir(request, request.path[len(self.prefixo):])
+            except Http404:
+                return HttpResponse(status=404)
+        return self.get_response(request)
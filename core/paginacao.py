@@ -0,0 +1,55 @@
+# core/paginacao.py
+"""
+Paginação por keyset (cursor).
+
+A página seguinte é pedida a partir dos valores de ordenação do último item
+visto, em vez de OFFSET: cada página custa o mesmo, qualquer que seja a
+profundidade. O cursor é opaco para o cliente (base64 de um JSON curto) e,
+se vier adulterado, é tratado como início da lista.
+"""
+import base64
+import binascii
+import json
+
+
+def codificar_cursor(*valores):
+    bruto = json.dumps(valores, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(bruto).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(token, tamanho):
+    """Tupla com `tamanho` valores, ou None se o token estiver ausente ou inválido."""
+    if not token:
+        return None
+    try:
+        bruto = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        valores = json.loads(bruto)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if not isinstance(valores, list) or len(valores) != tamanho:
+        return None
+    return tuple(valores)
+
+
+def id_do_cursor(token):
+    """Último id visto numa listagem ordenada por -id, ou None (início da lista)."""
+    valores = decodificar_cursor(token, 1)
+    if valores is None or type(valores[0]) is not int:
+        return None
+    return valores[0]
+
+
+def paginar_por_id(queryset, depois_de, por_pagina):
+    """
+    Ids da página seguinte a `depois_de` em ordem decrescente de id e o cursor da
+    próxima página (None na última). Busca por_pagina + 1 linhas para saber se há
+    mais, sem COUNT(*) nem OFFSET.
+    """
+    ids = queryset.order_by('-id').values_list('id', flat=True)
+    if depois_de is not None:
+        ids = ids.filter(id__lt=depois_de)
+    ids = list(ids[:por_pagina + 1])
+    if len(ids) <= por_pagina:
+        return ids, None
+    ids = ids[:por_pagina]
+    return ids, codificar_cursor(ids[-1])
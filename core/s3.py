@@ -0,0 +1,68 @@
+# core/s3.py
+"""
+Cliente S3 compartilhado pelo processo.
+
+Montar um cliente boto3 custa dezenas de milissegundos, e o cliente é
+thread-safe: um por processo basta, criado no primeiro uso. Com
+settings.AWS_S3_LOCAL apontando para uma pasta, o cliente é o S3 falso em
+disco (core/s3_local.py) e o bucket, 'local' se nenhum outro foi configurado.
+"""
+import threading
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_cliente = None
+
+CODIGOS_NAO_ENCONTRADO = {'404', 'NoSuchKey', 'NotFound'}
+
+
+def cliente():
+    global _cliente
+    if _cliente is None:
+        with _lock:
+            if _cliente is None:
+                _cliente = _criar()
+    return _cliente
+
+
+def _criar():
+    raiz_local = getattr(settings, 'AWS_S3_LOCAL', '')
+    if raiz_local:
+        from core.s3_local import S3Local
+        return S3Local(raiz_local, latencia=getattr(settings, 'AWS_S3_LOCAL_LATENCIA', 0.0))
+
+    import boto3
+    from botocore.config import Config
+    return boto3.client(
+        's3',
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_S3_REGION_NAME,
+        # Conexões suficientes para as threads de envio/download em paralelo
+        config=Config(max_pool_connections=32, retries={'mode': 'standard'}),
+    )
+
+
+def bucket():
+    """Nome do bucket, ou '' se o S3 não está configurado (só o disco local)."""
+    if settings.AWS_STORAGE_BUCKET_NAME:
+        return settings.AWS_STORAGE_BUCKET_NAME
+    return 'local' if getattr(settings, 'AWS_S3_LOCAL', '') else ''
+
+
+def chave(nome):
+    """Chave no bucket de um arquivo de mídia."""
+    return f"media/{nome}"
+
+
+def nao_encontrado(erro):
+    """True se o ClientError é um 404 (objeto inexistente)."""
+    return erro.response.get('Error', {}).get('Code') in CODIGOS_NAO_ENCONTRADO
+
+
+def redefinir():
+    """Descarta o cliente (depois de mudar as configurações, nos testes)."""
+    global _cliente
+    with _lock:
+        _cliente = None
@@ -0,0 +1,178 @@
+# core/s3_local.py
+"""
+S3 falso em disco, no espírito do moto: a mesma interface do cliente boto3
+para o que o projeto usa (upload/download, head, put/get/delete, listagem
+paginada), com os objetos em <raiz>/<bucket>/<chave>. Serve para testes,
+benchmarks e desenvolvimento sem credenciais (settings.AWS_S3_LOCAL).
+
+Erros saem como botocore ClientError com os mesmos códigos do S3 ('404',
+'NoSuchKey'), então o código de produção trata os dois do mesmo jeito.
+`latencia` (segundos) simula a ida e volta da rede em cada chamada.
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+DIR_METADADOS = '.metadados'
+
+
+class S3Local:
+    def __init__(self, raiz, latencia=0.0):
+        self.raiz = str(raiz)
+        self.latencia = latencia
+        self.chamadas = {}  # operação -> quantidade (para testes e benchmarks)
+        self._lock = threading.Lock()
+
+    # -------------------------------------
+    # Auxiliares
+    # -------------------------------------
+    def _contar(self, operacao):
+        with self._lock:
+            self.chamadas[operacao] = self.chamadas.get(operacao, 0) + 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def _caminho(self, bucket, chave):
+        return os.path.join(self.raiz, bucket, *chave.split('/'))
+
+    def _caminho_metadados(self, bucket, chave):
+        return os.path.join(self.raiz, DIR_METADADOS, bucket, *chave.split('/')) + '.json'
+
+    @staticmethod
+    def _erro(codigo, operacao, mensagem='Not Found'):
+        return ClientError({'Error': {'Code': codigo, 'Message': mensagem}}, operacao)
+
+    def _gravar(self, bucket, chave, origem):
+        """Copia o arquivo/stream `origem` para o bucket (escrita atômica) e anota ETag e tamanho."""
+        destino = self._caminho(bucket, chave)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        md5 = hashlib.md5()
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(destino), prefix='.envio-')
+        with os.fdopen(fd, 'wb') as saida:
+            for bloco in iter(lambda: origem.read(1024 * 1024), b''):
+                md5.update(bloco)
+                saida.write(bloco)
+        os.replace(temporario, destino)
+
+        metadados = {'ETag': f'"{md5.hexdigest()}"', 'ContentLength': os.path.getsize(destino)}
+        caminho = self._caminho_metadados(bucket, chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with open(caminho, 'w') as arquivo:
+            json.dump(metadados, arquivo)
+
+    def _metadados(self, bucket, chave, operacao):
+        caminho = self._caminho(bucket, chave)
+        if not os.path.isfile(caminho):
+            raise self._erro('404', operacao)
+        try:
+            with open(self._caminho_metadados(bucket, chave)) as arquivo:
+                metadados = json.load(arquivo)
+        except (OSError, ValueError):
+            with open(caminho, 'rb') as arquivo:
+                metadados = {'ETag': f'"{hashlib.md5(arquivo.read()).hexdigest()}"'}
+        estado = os.stat(caminho)
+        metadados['ContentLength'] = estado.st_size
+        metadados['LastModified'] = datetime.fromtimestamp(estado.st_mtime, tz=timezone.utc)
+        return metadados
+
+    # -------------------------------------
+    # Operações do cliente boto3
+    # -------------------------------------
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, **kwargs):
+        self._contar('upload_file')
+        with open(Filename, 'rb') as origem:
+            self._gravar(Bucket, Key, origem)
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        self._contar('put_object')
+        self._gravar(Bucket, Key, io.BytesIO(Body) if isinstance(Body, (bytes, bytearray)) else Body)
+        return {'ETag': self._metadados(Bucket, Key, 'PutObject')['ETag']}
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        self._contar('download_file')
+        self._metadados(Bucket, Key, 'HeadObject')
+        os.makedirs(os.path.dirname(os.path.abspath(Filename)), exist_ok=True)
+        shutil.copyfile(self._caminho(Bucket, Key), Filename)
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._contar('get_object')
+        try:
+            metadados = self._metadados(Bucket, Key, 'GetObject')
+        except ClientError:
+            raise self._erro('NoSuchKey', 'GetObject', 'The specified key does not exist.')
+        with open(self._caminho(Bucket, Key), 'rb') as arquivo:
+            return {**metadados, 'Body': io.BytesIO(arquivo.read())}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._contar('head_object')
+        return self._metadados(Bucket, Key, 'HeadObject')
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._contar('delete_object')
+        for caminho in (self._caminho(Bucket, Key), self._caminho_metadados(Bucket, Key)):
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix='', MaxKeys=1000, ContinuationToken=None, StartAfter='', **kwargs):
+        self._contar('list_objects_v2')
+        raiz = os.path.join(self.raiz, Bucket)
+        chaves = []
+        for pasta, _, arquivos in os.walk(raiz):
+            relativa = os.path.relpath(pasta, raiz).replace(os.sep, '/')
+            for nome in arquivos:
+                if nome.startswith('.envio-'):
+                    continue
+                chave = nome if relativa == '.' else f'{relativa}/{nome}'
+                if chave.startswith(Prefix):
+                    chaves.append(chave)
+        chaves.sort()
+
+        depois_de = ContinuationToken or StartAfter
+        if depois_de:
+            chaves = [c for c in chaves if c > depois_de]
+        pagina, truncada = chaves[:MaxKeys], len(chaves) > MaxKeys
+        resposta = {
+            'KeyCount': len(pagina),
+            'IsTruncated': truncada,
+            'Contents': [
+                {'Key': c, 'Size': m['ContentLength'], 'ETag': m['ETag'], 'LastModified': m['LastModified']}
+                for c in pagina for m in [self._metadados(Bucket, c, 'ListObjectsV2')]
+            ],
+        }
+        if truncada:
+            resposta['NextContinuationToken'] = pagina[-1]
+        if not pagina:
+            del resposta['Contents']  # como no S3: sem a chave quando a página vem vazia
+        return resposta
+
+    def get_paginator(self, operacao):
+        """Só a listagem pagina aqui; é a única que o espelho e o índice usam."""
+        if operacao == 'list_objects_v2':
+            return _PaginadorListagem(self)
+        raise ValueError(f"S3 local não pagina a operação '{operacao}' (só list_objects_v2)")
+
+
+class _PaginadorListagem:
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def paginate(self, PaginationConfig=None, **kwargs):
+        tamanho = (PaginationConfig or {}).get('PageSize', kwargs.pop('MaxKeys', 1000))
+        token = None
+        while True:
+            pagina = self.cliente.list_objects_v2(MaxKeys=tamanho, ContinuationToken=token, **kwargs)
+            yield pagina
+            if not pagina['IsTruncated']:
+                return
+            token = pagina['NextContinuationToken']
@@ -0,0 +1,25 @@
+# core/serializacao.py
+"""
+JSON rápido para as respostas da API.
+
+Usa orjson quando instalado (serializa direto para bytes, em C). Sem ele, um
+JSONEncoder da biblioteca padrão montado uma única vez, sem escape de não-ASCII,
+sem espaços e sem checagem de referências circulares. Os dados chegam só com
+tipos nativos (str, int, float, bool, None, list, dict): Decimal e datas são
+convertidos na projeção, não aqui.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # opcional: sem ele, cai no codificador da biblioteca padrão
+    orjson = None
+
+_codificador = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), check_circular=False)
+
+
+def para_json(dados):
+    """Serializa `dados` em bytes UTF-8."""
+    if orjson is not None:
+        return orjson.dumps(dados)
+    return _codificador.encode(dados).encode('utf-8')
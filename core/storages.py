@@ -1,26 +1,73 @@
+import hashlib
+import logging
 import os
-import boto3
+import tempfile
+import threading
 from django.core.files.storage import FileSystemStorage
 from django.conf import settings
 from botocore.exceptions import ClientError
 
+from core import imagens, midia, s3 as nuvem, tarefas_imagens
+from core.cache import CacheNamespace, metricas
+from core.cache_disco import cache_disco
+from core.fila_s3 import fila
+from core.indice_s3 import indice_produtos
+
+logger = logging.getLogger(__name__)
+
+# 404s do S3 lembrados por MIDIA_AUSENTE_TTL segundos, para todos os workers
+cache_ausentes = CacheNamespace('midia_ausente', timeout=300)
+ESPERA_DOWNLOAD = 30  # segundos que uma thread espera o download de outra
+
+_downloads = {}  # nome -> threading.Event do download em andamento neste processo
+_downloads_lock = threading.Lock()
+
+
+def chave_ausente(name):
+    """Chave de `name` no cache negativo (compartilhada com core/midia.py)."""
+    return hashlib.md5(name.encode('utf-8')).hexdigest()
+
+
+def reservar_download(name):
+    """
+    Single-flight dos downloads do S3 neste processo (storage e core/midia.py):
+    None se quem chamou deve baixar — e depois chamar liberar_download() —, ou
+    o Event do download que outra thread já está fazendo.
+    """
+    with _downloads_lock:
+        em_andamento = _downloads.get(name)
+        if em_andamento is None:
+            _downloads[name] = threading.Event()
+        return em_andamento
+
+
+def liberar_download(name):
+    with _downloads_lock:
+        evento = _downloads.pop(name, None)
+    if evento is not None:
+        evento.set()
+
 
 class LocalCacheS3FallbackStorage(FileSystemStorage):
     """
     Storage híbrido:
-    - Salva os arquivos tanto localmente quanto no S3.
+    - Salva os arquivos tanto localmente quanto no S3 (o envio vai para a fila
+      em segundo plano, ver core/fila_s3.py).
     - Lê primeiro do cache local; se não existir, baixa automaticamente do S3.
+      Arquivos que o S3 não tem ficam lembrados por um tempo (sem nova ida ao
+      S3) e downloads simultâneos do mesmo arquivo viram um só.
+    - Grava com o hash do conteúdo no nome (core/midia.py): conteúdo novo,
+      URL nova, e as URLs podem ser cacheadas para sempre.
     """
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.s3 = boto3.client(
-            "s3",
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_S3_REGION_NAME,
-        )
-        self.bucket = settings.AWS_STORAGE_BUCKET_NAME
+    @property
+    def s3(self):
+        # Cliente compartilhado pelo processo, criado no primeiro uso (core/s3.py)
+        return nuvem.cliente()
+
+    @property
+    def bucket(self):
+        return nuvem.bucket()
 
     # -------------------------------------
     # 🧱 AUXILIARES
@@ -30,9 +77,27 @@ class LocalCacheS3FallbackStorage(FileSystemStorage):
         local_dir = os.path.join(settings.MEDIA_ROOT, os.path.dirname(name))
         os.makedirs(local_dir, exist_ok=True)
 
+    def get_available_name(self, name, max_length=None):
+        """
+        O nome final leva o hash do conteúdo (_save), então não há colisão a
+        evitar com sufixos aleatórios; só garante que o nome com hash caiba.
+        """
+        if midia.hash_do_nome(name) and os.path.exists(self.path(name)):
+            # Outro processo gravou o mesmo conteúdo entre a checagem e o open exclusivo
+            return super().get_available_name(name, max_length)
+        if max_length:
+            base, ext = os.path.splitext(midia.sem_hash(name))
+            excesso = len(base) + len(ext) + midia.TAMANHO_HASH + 1 - max_length
+            if excesso > 0:
+                name = base[:-excesso] + ext
+        return name
+
     def _s3_key(self, name):
         """Gera a chave completa do S3."""
-        return f"media/{name}"
+        return nuvem.chave(name)
+
+    def _chave_ausente(self, name):
+        return chave_ausente(name)
 
     # -------------------------------------
     # 💾 SALVAR (UPLOAD)
@@ -40,22 +105,35 @@ class LocalCacheS3FallbackStorage(FileSystemStorage):
     def _save(self, name, content):
         """
         Sobrescreve o método padrão:
+        0️⃣ Põe o hash do conteúdo no nome (batom.jpg -> batom.3f9a0c1be2d4.jpg).
         1️⃣ Salva localmente.
-        2️⃣ Envia o mesmo arquivo para o S3.
+        2️⃣ Agenda o envio do mesmo arquivo para o S3 e retorna sem esperar.
+        3️⃣ Agenda os derivados responsivos, se for imagem (core/tarefas_imagens.py).
         """
+        # 0. Nome com hash do conteúdo
+        name = midia.com_hash(name, midia.hash_arquivo(content))
         self._ensure_local_dir(name)
+        local_path = os.path.join(settings.MEDIA_ROOT, name)
+        cache_ausentes.delete(self._chave_ausente(name))
+        if os.path.exists(local_path):
+            return name  # mesmo conteúdo já gravado (e enviado): nada a fazer
 
         # 1. Salva localmente
         saved_name = super()._save(name, content)
-        local_path = os.path.join(settings.MEDIA_ROOT, saved_name)
 
-        # 2. Faz upload para o S3
-        key = self._s3_key(saved_name)
-        try:
-            self.s3.upload_file(local_path, self.bucket, key)
-            print(f"☁️ Upload para S3 concluído: {key}")
-        except Exception as e:
-            print(f"❌ Erro ao enviar {key} para o S3: {e}")
+        # 2. Upload para o S3 em segundo plano (diário em disco + retentativas);
+        #    no índice do cache local só depois de estar no diário, que o protege
+        #    da poda até o envio terminar
+        if self.bucket:
+            fila.agendar(saved_name, local_path)
+            indice_produtos.adicionar(self._s3_key(saved_name))
+        cache_disco.registrar(saved_name)
+
+        # 3. Versões reduzidas (thumb/card/zoom): a thread consumidora gera fora da requisição
+        if getattr(settings, 'IMAGENS_DERIVADOS', True) and imagens.deve_gerar(saved_name):
+            imagens.esquecer(saved_name)
+            tarefas_imagens.agendar(saved_name)
+            tarefas_imagens.disparar()
 
         return saved_name
 
@@ -63,32 +141,71 @@ class LocalCacheS3FallbackStorage(FileSystemStorage):
     # 📥 LEITURA (DOWNLOAD)
     # -------------------------------------
     def _download_from_s3(self, name):
-        """Tenta baixar o arquivo do S3 para o cache local."""
+        """
+        Tenta baixar o arquivo do S3 para o cache local. Grava num temporário e
+        renomeia, para nenhum leitor (nem outro worker) ver o arquivo pela metade.
+        """
         key = self._s3_key(name)
         local_path = os.path.join(settings.MEDIA_ROOT, name)
         self._ensure_local_dir(name)
 
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(local_path), prefix='.download-')
+        os.close(fd)
         try:
-            self.s3.download_file(self.bucket, key, local_path)
-            print(f"⬇️ Cache atualizado automaticamente: {key}")
+            self.s3.download_file(self.bucket, key, temporario)
+            os.replace(temporario, local_path)
+            cache_disco.registrar(name)
+            metricas.registrar('midia', 'download')
+            logger.info('Cache atualizado automaticamente: %s', key)
             return True
         except ClientError as e:
-            if e.response["Error"]["Code"] == "404":
-                print(f"⚠️ Arquivo não encontrado no S3: {key}")
+            if nuvem.nao_encontrado(e):
+                ttl = getattr(settings, 'MIDIA_AUSENTE_TTL', cache_ausentes.timeout)
+                cache_ausentes.set(self._chave_ausente(name), True, ttl)
+                metricas.registrar('midia', 'ausente')
+                logger.info('Arquivo não encontrado no S3: %s', key)
             else:
-                print(f"❌ Erro ao baixar {key}: {e}")
+                logger.warning('Erro ao baixar %s: %s', key, e)
             return False
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+    def _download_coalescido(self, name):
+        """
+        Um download por arquivo por processo: quem chega enquanto outra thread
+        baixa o mesmo nome espera por ela e confere o disco local.
+        """
+        em_andamento = reservar_download(name)
+        if em_andamento is not None:
+            metricas.registrar('midia', 'espera')
+            em_andamento.wait(ESPERA_DOWNLOAD)
+            return super().exists(name)
+
+        try:
+            return self._download_from_s3(name)
+        finally:
+            liberar_download(name)
 
     def exists(self, name):
-        """Verifica se existe localmente, senão tenta baixar do S3."""
+        """
+        Verifica se existe localmente, senão tenta baixar do S3 — a menos que o
+        S3 tenha respondido 404 para esse nome há pouco (cache negativo).
+        """
         if super().exists(name):
+            metricas.registrar('midia', 'hit')
+            cache_disco.tocar(name)
             return True
-        return self._download_from_s3(name)
+        metricas.registrar('midia', 'miss')
+        if not self.bucket or cache_ausentes.get(self._chave_ausente(name)):
+            return False
+        return self._download_coalescido(name)
 
     def url(self, name):
         """
         Sempre retorna a URL local (/media/...), 
         garantindo que o site funcione mesmo se o S3 estiver offline.
+        Nomes com hash (uploads) são imutáveis: ver core/midia.py.
         """
         return f"/media/{name}"
 
@@ -0,0 +1,352 @@
+# core/tarefas_imagens.py
+"""
+Fila local de geração de derivados de imagem (core/imagens.py).
+
+O storage só anota o arquivo na fila (um JSON por imagem em IMAGENS_FILA_DIR,
+então a mesma imagem salva duas vezes vira uma tarefa) e o save do admin
+termina na hora. Quem consome a fila é o próprio processo web, numa thread
+(disparar()): a fila e o MEDIA_ROOT ficam no disco deste servidor, que um
+worker em outra máquina não enxergaria. Entre os processos do gunicorn, um
+flock (.consumidor.lock) deixa um só consumindo; `manage.py processar_imagens`
+usa a mesma trava (backfill, reprocessar falhas). O consumidor:
+
+- confere o hash do conteúdo de cada imagem: derivados já em dia são pulados
+  e imagens com o mesmo conteúdo são processadas uma vez só (as outras
+  recebem cópias/hardlinks dos arquivos gerados);
+- redimensiona/encoda num ProcessPoolExecutor do tamanho dos núcleos, fora
+  do GIL;
+- publica os resultados no processo principal (manifesto, cache e fila de
+  envio para o S3);
+- repete falhas com espera exponencial até IMAGENS_TENTATIVAS; depois a
+  tarefa fica marcada como falha na fila, à espera de --reprocessar-falhas;
+- avisa com o sinal derivados_publicados quais imagens ganharam derivados
+  (produtos/cards.py avança a versão dos cards delas).
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connections
+from django.dispatch import Signal
+
+from core import imagens
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TENTATIVAS = 3
+ESPERA_INICIAL = 30  # segundos antes da 2ª tentativa; dobra a cada falha
+LOTE = 200  # imagens por rodada do pool
+ESPERA_MAXIMA = 60  # o consumidor relê a fila pelo menos a cada minuto enquanto há tarefas em espera
+
+# Enviado depois de cada lote com as imagens que ganharam derivados: nomes=[...]
+derivados_publicados = Signal()
+
+
+def diretorio():
+    return str(getattr(settings, 'IMAGENS_FILA_DIR', '') or os.path.join(settings.MEDIA_ROOT, '.imagens_pendentes'))
+
+
+def _caminho(nome):
+    return os.path.join(diretorio(), hashlib.sha1(nome.encode('utf-8')).hexdigest() + '.json')
+
+
+def _gravar(tarefa):
+    os.makedirs(diretorio(), exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=diretorio(), prefix='.tmp-')
+    with os.fdopen(fd, 'w') as arquivo:
+        json.dump(tarefa, arquivo)
+    os.replace(temporario, _caminho(tarefa['nome']))
+
+
+def _ler(caminho):
+    try:
+        with open(caminho) as entrada:
+            return json.load(entrada)
+    except (OSError, ValueError):
+        return None
+
+
+def _apagar(tarefa):
+    """Remove a tarefa concluída — a não ser que a imagem tenha sido salva de novo nesse meio-tempo."""
+    caminho = _caminho(tarefa['nome'])
+    atual = _ler(caminho)
+    if atual is None or atual['criado_em'] != tarefa['criado_em']:
+        return
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+
+
+def agendar(nome, forcar=False, substituir=True):
+    """Anota a imagem na fila (substitui tarefa anterior do mesmo arquivo, se `substituir`)."""
+    if not imagens.deve_gerar(nome):
+        return False
+    if not substituir and os.path.exists(_caminho(nome)):
+        return False
+    _gravar({'nome': nome, 'forcar': forcar, 'tentativas': 0, 'proxima': 0, 'erro': '',
+             'falhou': False, 'criado_em': time.time()})
+    return True
+
+
+def tarefas():
+    if not os.path.isdir(diretorio()):
+        return []
+    lidas = (_ler(os.path.join(diretorio(), arquivo)) for arquivo in os.listdir(diretorio())
+             if arquivo.endswith('.json'))
+    return sorted((t for t in lidas if t), key=lambda t: t['criado_em'])
+
+
+def prontas(agora=None):
+    """Tarefas que podem rodar agora (sem falha definitiva e fora da espera)."""
+    agora = agora or time.time()
+    return [t for t in tarefas() if not t['falhou'] and t['proxima'] <= agora]
+
+
+def reprocessar_falhas():
+    reabertas = 0
+    for tarefa in tarefas():
+        if tarefa['falhou']:
+            tarefa.update(falhou=False, tentativas=0, proxima=0)
+            _gravar(tarefa)
+            reabertas += 1
+    return reabertas
+
+
+# -------------------------------------
+# Processamento
+# -------------------------------------
+def _inicializar_processo():
+    """Filhos do pool: Django configurado e sem herdar o cliente S3 (conexões) do pai."""
+    import django
+    django.setup()
+    from core import s3
+    s3.redefinir()
+
+
+def _gerar(nome):
+    # No filho só o trabalho de CPU; publicar (cache, S3) fica com o pai
+    return imagens.gerar(nome, forcar=True, publicar_resultado=False)
+
+
+@dataclass
+class ResultadoLote:
+    tarefas: int = 0
+    geradas: int = 0
+    replicadas: int = 0
+    em_dia: int = 0
+    ausentes: int = 0
+    falhas: int = 0
+    segundos: float = 0.0
+    publicadas: list = field(default_factory=list)  # nomes com derivados novos
+
+    @property
+    def por_segundo(self):
+        return self.tarefas / self.segundos if self.segundos else 0.0
+
+
+def _falhou(tarefa, erro, resultado):
+    tentativas = getattr(settings, 'IMAGENS_TENTATIVAS', TENTATIVAS)
+    tarefa['tentativas'] += 1
+    tarefa['erro'] = str(erro)[:500]
+    tarefa['falhou'] = tarefa['tentativas'] >= tentativas
+    tarefa['proxima'] = time.time() + ESPERA_INICIAL * 2 ** (tarefa['tentativas'] - 1)
+    _gravar(tarefa)
+    resultado.falhas += 1
+    logger.warning('Derivados de %s falharam (%d/%d): %s', tarefa['nome'], tarefa['tentativas'], tentativas, erro)
+
+
+def processar(lote, processos=None, progresso=None):
+    """
+    Processa as tarefas `lote` (de prontas()) e devolve um ResultadoLote.
+    `processos=0` roda tudo neste processo (testes, depuração); None usa um
+    processo por núcleo. `progresso(resultado)` é chamado a cada conteúdo
+    concluído.
+    """
+    from django.core.files.storage import default_storage
+
+    inicio = time.perf_counter()
+    resultado = ResultadoLote(tarefas=len(lote))
+
+    # 1. Hash de cada imagem (o storage traz do S3 o que faltar no disco)
+    grupos = defaultdict(list)  # hash -> [tarefa]
+    for tarefa in lote:
+        nome = tarefa['nome']
+        try:
+            if not default_storage.exists(nome):
+                raise FileNotFoundError(nome)
+            digest = imagens.hash_conteudo(imagens._local(nome))
+        except FileNotFoundError:
+            logger.warning('Imagem %s não existe mais; tarefa descartada', nome)
+            imagens.sem_derivados(nome)
+            _apagar(tarefa)
+            resultado.ausentes += 1
+            continue
+        if not tarefa['forcar'] and imagens.atualizado(nome, digest):
+            _apagar(tarefa)
+            resultado.em_dia += 1
+            continue
+        grupos[digest].append(tarefa)
+
+    def concluir(tarefas_do_grupo, manifesto):
+        principal, *copias = tarefas_do_grupo
+        if manifesto is None:  # não é uma imagem legível: não adianta repetir
+            for tarefa in tarefas_do_grupo:
+                imagens.sem_derivados(tarefa['nome'])
+                _apagar(tarefa)
+            resultado.falhas += len(tarefas_do_grupo)
+            return
+        imagens.publicar(principal['nome'], manifesto)
+        _apagar(principal)
+        resultado.geradas += 1
+        resultado.publicadas.append(principal['nome'])
+        for tarefa in copias:
+            imagens.publicar(tarefa['nome'], imagens.replicar(manifesto, tarefa['nome']))
+            _apagar(tarefa)
+            resultado.replicadas += 1
+            resultado.publicadas.append(tarefa['nome'])
+        if progresso:
+            progresso(resultado)
+
+    # 2. Uma geração por conteúdo distinto
+    if processos == 0:
+        for tarefas_do_grupo in grupos.values():
+            try:
+                concluir(tarefas_do_grupo, _gerar(tarefas_do_grupo[0]['nome']))
+            except Exception as erro:  # noqa: BLE001
+                for tarefa in tarefas_do_grupo:
+                    _falhou(tarefa, erro, resultado)
+    elif grupos:
+        # spawn: o pai é um processo web com threads, e fork de processo com threads não é seguro
+        with ProcessPoolExecutor(max_workers=processos or os.cpu_count(), initializer=_inicializar_processo,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            futuros = {executor.submit(_gerar, t[0]['nome']): t for t in grupos.values()}
+            for futuro in as_completed(futuros):
+                tarefas_do_grupo = futuros[futuro]
+                try:
+                    concluir(tarefas_do_grupo, futuro.result())
+                except Exception as erro:  # noqa: BLE001
+                    for tarefa in tarefas_do_grupo:
+                        _falhou(tarefa, erro, resultado)
+
+    resultado.segundos = time.perf_counter() - inicio
+    if resultado.publicadas:
+        derivados_publicados.send(sender=None, nomes=resultado.publicadas)
+    return resultado
+
+
+# -------------------------------------
+# Consumidor (thread do processo web)
+# -------------------------------------
+_trava_local = threading.Lock()  # sem fcntl, vale só dentro do processo
+_estado = threading.Lock()
+_novas = threading.Event()
+_consumidor = None  # (pid, thread)
+
+
+@contextmanager
+def consumidor():
+    """
+    Trava de consumidor da fila neste servidor: True se obtida, False se
+    outro processo (ou thread) já está consumindo.
+    """
+    if fcntl is None:
+        obtida = _trava_local.acquire(blocking=False)
+        try:
+            yield obtida
+        finally:
+            if obtida:
+                _trava_local.release()
+        return
+
+    os.makedirs(diretorio(), exist_ok=True)
+    descritor = os.open(os.path.join(diretorio(), '.consumidor.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(descritor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+        else:
+            yield True
+    finally:
+        os.close(descritor)  # solta o flock junto
+
+
+def _espera():
+    """Segundos até a próxima tarefa em espera ficar pronta; None se a fila está vazia."""
+    proximas = [t['proxima'] for t in tarefas() if not t['falhou']]
+    if not proximas:
+        return None
+    return min(max(min(proximas) - time.time(), 0.1), ESPERA_MAXIMA)
+
+
+def _esvaziar():
+    """Processa a fila até não sobrar tarefa pronta nem em espera."""
+    processos = getattr(settings, 'IMAGENS_PROCESSOS', None)
+    while True:
+        pendentes = prontas()
+        if pendentes:
+            processar(pendentes[:LOTE], processos=processos)
+            continue
+        espera = _espera()
+        if espera is None:
+            return
+        time.sleep(espera)
+
+
+def _consumir():
+    global _consumidor
+    while True:
+        _novas.clear()
+        try:
+            with consumidor() as livre:
+                if livre:
+                    _esvaziar()
+        except Exception:  # noqa: BLE001 — o consumidor nunca derruba o processo web
+            logger.exception('Falha ao processar a fila de derivados de imagem')
+            livre = False
+        with _estado:
+            # Tarefa nova deste processo durante a rodada, ou de outro processo
+            # enquanto a trava era solta: mais uma volta
+            if not _novas.is_set() and not (livre and prontas()):
+                _consumidor = None
+                connections.close_all()  # as da thread (sinal derivados_publicados)
+                return
+
+
+def disparar():
+    """Garante uma thread consumindo a fila neste processo (se nenhum outro já consome)."""
+    global _consumidor
+    if not getattr(settings, 'IMAGENS_EM_SEGUNDO_PLANO', True):
+        return
+    with _estado:
+        _novas.set()
+        if _consumidor is not None and _consumidor[0] == os.getpid() and _consumidor[1].is_alive():
+            return
+        thread = threading.Thread(target=_consumir, name='derivados-imagens', daemon=True)
+        _consumidor = (os.getpid(), thread)
+        thread.start()
+
+
+def aguardar(timeout=None):
+    """Espera a thread consumidora deste processo terminar; True se terminou."""
+    atual = _consumidor
+    if atual is None or atual[0] != os.getpid():
+        return True
+    atual[1].join(timeout)
+    return not atual[1].is_alive()
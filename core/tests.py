@@ -0,0 +1,835 @@
+import importlib.util
+import io
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core import fila_s3, imagens, midia, s3, storages, tarefas_imagens
+from core.cache import CacheNamespace, metricas
+from core.cache_disco import CacheDisco
+from core.consultas import (
+    MonitorConsultasMiddleware, OrcamentoConsultasExcedido, impressao_digital, orcamento_consultas,
+)
+from core.fila_s3 import FilaEnviosS3
+from core.indice_s3 import indice_produtos
+from core.storages import LocalCacheS3FallbackStorage
+from produtos import cards, precos
+from produtos.models import Categoria, Produto
+from produtos.tests import criar_produto
+
+
+class CacheNamespaceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ns = CacheNamespace('teste', timeout=60, stale_ttl=60)
+
+    def test_single_flight_calcula_uma_vez(self):
+        chamadas = []
+
+        def calcular():
+            chamadas.append(1)
+            time.sleep(0.2)
+            return 'valor'
+
+        resultados = []
+        threads = [
+            threading.Thread(target=lambda: resultados.append(self.ns.obter_ou_calcular('k', calcular)))
+            for _ in range(5)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(resultados, ['valor'] * 5)
+        self.assertEqual(len(chamadas), 1)
+
+    def test_valor_vencido_servido_enquanto_outro_revalida(self):
+        self.ns.obter_ou_calcular('k', lambda: 'antigo', timeout=0)
+        # Outro processo segura a trava de recálculo
+        cache.add(self.ns.chave('k') + ':trava', 1)
+        self.assertEqual(self.ns.obter_ou_calcular('k', lambda: 'novo'), 'antigo')
+        cache.delete(self.ns.chave('k') + ':trava')
+        self.assertEqual(self.ns.obter_ou_calcular('k', lambda: 'novo'), 'novo')
+
+    def test_metricas_por_namespace(self):
+        metricas.zerar()
+        self.ns.set('a', 1)
+        self.ns.get('a')
+        self.ns.get_many(['a', 'b'])
+        relatorio = metricas.relatorio()['teste']
+        self.assertEqual(relatorio['hit'], 2)
+        self.assertEqual(relatorio['miss'], 1)
+
+    def test_versao_do_namespace(self):
+        self.assertEqual(self.ns.versao(), 0)
+        self.ns.avancar_versao()
+        self.ns.avancar_versao()
+        self.assertEqual(self.ns.versao(), 2)
+
+
+@override_settings(CONSULTAS_MONITOR=True, CONSULTAS_LIMITE_REPETICAO=3, CONSULTAS_ESTRITO=False)
+class MonitorConsultasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        categoria = Categoria.objects.create(nome='Batons', slug='batons')
+        self.produtos = [criar_produto(categoria, f'batom-{i}', estoque=3) for i in range(4)]
+
+    def _chamar(self, view):
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+        middleware = MonitorConsultasMiddleware(get_response)
+        return middleware(RequestFactory().get('/teste/'))
+
+    def test_impressao_digital_ignora_literais_e_listas(self):
+        self.assertEqual(
+            impressao_digital("SELECT * FROM p WHERE id IN (1, 2,  3) AND nome = 'x''y' AND preco > 9.90"),
+            "SELECT * FROM p WHERE id IN (?) AND nome = ? AND preco > ?",
+        )
+        self.assertEqual(impressao_digital('SELECT 1 FROM "U0" LIMIT 21'), 'SELECT ? FROM "U0" LIMIT ?')
+
+    def test_aponta_n_mais_1_e_manda_server_timing(self):
+        def view(request):
+            for produto in self.produtos:
+                Produto.objects.get(pk=produto.pk)
+            return HttpResponse('ok')
+
+        with self.assertLogs('core.consultas', 'WARNING') as logs:
+            resposta = self._chamar(view)
+        self.assertIn('4x', logs.output[0])
+        self.assertIn('core/tests.py', logs.output[0])
+        self.assertIn('db;dur=', resposta['Server-Timing'])
+        self.assertIn('desc="4 consultas"', resposta['Server-Timing'])
+        self.assertIn('n1;', resposta['Server-Timing'])
+
+    def test_consultas_distintas_nao_sao_n_mais_1(self):
+        def view(request):
+            list(Produto.objects.all())
+            list(Categoria.objects.all())
+            return HttpResponse('ok')
+
+        resposta = self._chamar(view)
+        self.assertIn('desc="2 consultas"', resposta['Server-Timing'])
+        self.assertNotIn('n1;', resposta['Server-Timing'])
+
+    def test_orcamento_excedido_falha_no_modo_estrito(self):
+        @orcamento_consultas(2)
+        def view(request):
+            for produto in self.produtos:
+                Produto.objects.filter(pk=produto.pk).exists()
+            return HttpResponse('ok')
+
+        with self.assertLogs('core.consultas', 'WARNING'):
+            self._chamar(view)  # fora do modo estrito, só avisa
+        with override_settings(CONSULTAS_ESTRITO=True), self.assertRaises(OrcamentoConsultasExcedido):
+            self._chamar(view)
+
+    @override_settings(CONSULTAS_ESTRITO=True)
+    def test_views_da_vitrine_dentro_do_orcamento(self):
+        precos.invalidar_tabela()
+        for url in (reverse('home'), reverse('detalhe_produto', args=['batom-1']),
+                    reverse('api_produtos'), reverse('sugestoes') + '?q=bat'):
+            resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 200, url)
+            self.assertIn('Server-Timing', resposta)
+
+
+@skipUnless(importlib.util.find_spec('psycopg_pool'), 'psycopg_pool não instalado')
+class PoolConexoesTests(SimpleTestCase):
+    def test_backend_monta_o_pool_com_o_health_check_do_django(self):
+        from psycopg_pool import ConnectionPool
+
+        from core.db.postgresql.base import DatabaseWrapper
+
+        conexao = DatabaseWrapper({
+            'ENGINE': 'core.db.postgresql', 'NAME': 'loja', 'USER': 'loja', 'PASSWORD': '',
+            'HOST': 'localhost', 'PORT': '', 'OPTIONS': {'pool': {'min_size': 1, 'max_size': 2}},
+            'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True, 'AUTOCOMMIT': True,
+            'ATOMIC_REQUESTS': False, 'TIME_ZONE': None, 'TEST': {},
+        }, alias='pool_teste')
+        self.addCleanup(conexao._connection_pools.pop, 'pool_teste', None)
+
+        pool = conexao.pool  # fechado: open=False, nada de rede aqui
+        self.assertIsInstance(pool, ConnectionPool)
+        self.assertEqual(pool.max_size, 2)
+        self.assertEqual(pool._check, ConnectionPool.check_connection)
+
+
+class S3LocalMixin:
+    """MEDIA_ROOT e um S3 falso (core/s3_local.py) em pastas temporárias."""
+
+    def setUp(self):
+        super().setUp()
+        self.pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.pasta.cleanup)
+        self.media = os.path.join(self.pasta.name, 'media')
+        configuracao = override_settings(
+            MEDIA_ROOT=self.media, AWS_S3_LOCAL=os.path.join(self.pasta.name, 's3'),
+            AWS_STORAGE_BUCKET_NAME='', ENVIOS_S3_DIARIO=os.path.join(self.pasta.name, 'diario'),
+            IMAGENS_FILA_DIR=os.path.join(self.pasta.name, 'imagens_pendentes'), IMAGENS_EM_SEGUNDO_PLANO=False,
+            MIDIA_CACHE_INDICE=os.path.join(self.pasta.name, 'cache_midia.sqlite3'),
+        )
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        s3.redefinir()
+        self.addCleanup(s3.redefinir)
+
+    def objeto_no_s3(self, nome):
+        try:
+            s3.cliente().head_object(Bucket=s3.bucket(), Key=s3.chave(nome))
+            return True
+        except Exception:
+            return False
+
+
+class FilaEnviosS3Tests(S3LocalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.fila = FilaEnviosS3(diretorio=os.path.join(self.pasta.name, 'diario'), espera_inicial=0)
+
+    def _arquivo_local(self, nome, conteudo=b'imagem'):
+        caminho = os.path.join(self.media, nome)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with open(caminho, 'wb') as arquivo:
+            arquivo.write(conteudo)
+        return caminho
+
+    def test_save_grava_local_e_envia_em_segundo_plano(self):
+        from core.fila_s3 import fila
+
+        nome = LocalCacheS3FallbackStorage().save('produtos/batom.jpg', ContentFile(b'jpg'))
+        self.assertTrue(os.path.exists(os.path.join(self.media, nome)))
+        self.assertTrue(fila.aguardar(timeout=5))
+        self.assertTrue(self.objeto_no_s3(nome))
+        self.assertEqual(fila.situacao()['pendentes'], [])
+
+    def test_falhas_sao_repetidas_com_o_diario_atualizado(self):
+        caminho = self._arquivo_local('produtos/perfume.jpg')
+        cliente = s3.cliente()
+        original = cliente.upload_file
+        falhas = []
+
+        def instavel(*args, **kwargs):
+            if len(falhas) < 2:
+                falhas.append(1)
+                raise ConnectionError('rede fora')
+            return original(*args, **kwargs)
+
+        cliente.upload_file = instavel
+        self.fila.agendar('produtos/perfume.jpg', caminho)
+        self.assertTrue(self.fila.aguardar(timeout=5))
+        self.assertEqual(len(falhas), 2)
+        self.assertTrue(self.objeto_no_s3('produtos/perfume.jpg'))
+        self.assertEqual(self.fila.entradas(), [])
+
+    def test_tentativas_esgotadas_ficam_no_diario_para_reenviar(self):
+        caminho = self._arquivo_local('produtos/bolsa.jpg')
+        cliente = s3.cliente()
+        original = cliente.upload_file
+        cliente.upload_file = lambda *a, **k: (_ for _ in ()).throw(ConnectionError('rede fora'))
+        self.fila._tentativas = 2
+        self.fila.agendar('produtos/bolsa.jpg', caminho)
+        self.fila.aguardar(timeout=5)
+        self.assertEqual([e['falhou'] for e in self.fila.entradas()], [True])
+
+        cliente.upload_file = original
+        self.assertEqual(self.fila.reenviar(), 1)
+        self.fila.aguardar(timeout=5)
+        self.assertEqual(self.fila.entradas(), [])
+        self.assertTrue(self.objeto_no_s3('produtos/bolsa.jpg'))
+
+    def test_recupera_envios_de_processo_morto(self):
+        caminho = self._arquivo_local('produtos/kit.jpg')
+        self.fila._gravar_entrada({
+            'nome': 'produtos/kit.jpg', 'caminho': caminho, 'chave': s3.chave('produtos/kit.jpg'),
+            'tentativas': 0, 'erro': '', 'falhou': False, 'pid': 0, 'criado_em': time.time(),
+        })
+        self.assertEqual(self.fila.recuperar(), 1)
+        self.fila.aguardar(timeout=5)
+        self.assertTrue(self.objeto_no_s3('produtos/kit.jpg'))
+
+    def _entrada(self, nome, **campos):
+        entrada = {
+            'nome': nome, 'caminho': self._arquivo_local(nome), 'chave': s3.chave(nome),
+            'tentativas': 0, 'erro': '', 'falhou': False, 'pid': os.getpid(), 'criado_em': time.time(),
+        }
+        entrada.update(campos)
+        self.fila._gravar_entrada(entrada)
+
+    @skipUnless(fila_s3.fcntl, 'sem fcntl o dono é decidido só pelo pid')
+    def test_pid_reaproveitado_nao_segura_a_entrada(self):
+        # Depois de um restart do contêiner o pid do dono morto pode ser o de um processo vivo
+        self._entrada('produtos/colar.jpg', dono='processo-de-antes-do-restart')
+        self.assertEqual(self.fila.recuperar(), 1)
+        self.fila.aguardar(timeout=5)
+        self.assertTrue(self.objeto_no_s3('produtos/colar.jpg'))
+
+    @skipUnless(fila_s3.fcntl, 'sem fcntl o dono é decidido só pelo pid')
+    def test_entrada_de_processo_vivo_nao_e_retomada(self):
+        # Outra instância segura o próprio flock, como outro worker do gunicorn
+        outra = FilaEnviosS3(diretorio=self.fila.diretorio)
+        self._entrada('produtos/anel.jpg', pid=0, dono=outra._dono())
+        self.assertEqual(self.fila.recuperar(), 0)
+        self.assertEqual(len(os.listdir(self.fila._pasta_donos())), 2)
+
+
+class FallbackS3Tests(S3LocalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.storage = LocalCacheS3FallbackStorage()
+        self.cliente = s3.cliente()
+
+    def test_baixa_do_s3_quando_falta_no_disco(self):
+        self.cliente.put_object(Bucket=s3.bucket(), Key=s3.chave('produtos/batom.jpg'), Body=b'jpg')
+        self.assertTrue(self.storage.exists('produtos/batom.jpg'))
+        with open(os.path.join(self.media, 'produtos', 'batom.jpg'), 'rb') as arquivo:
+            self.assertEqual(arquivo.read(), b'jpg')
+        self.assertTrue(self.storage.exists('produtos/batom.jpg'))
+        self.assertEqual(self.cliente.chamadas['download_file'], 1)
+
+    def test_404_fica_no_cache_negativo(self):
+        for _ in range(3):
+            self.assertFalse(self.storage.exists('produtos/nao-existe.jpg'))
+        self.assertEqual(self.cliente.chamadas['download_file'], 1)
+        self.assertEqual(os.listdir(os.path.join(self.media, 'produtos')), [])
+
+    def test_salvar_limpa_o_cache_negativo(self):
+        from core.fila_s3 import fila
+
+        nome = midia.com_hash('produtos/novo.jpg', midia.hash_arquivo(ContentFile(b'png')))
+        self.assertFalse(self.storage.exists(nome))
+        self.assertEqual(self.storage.save('produtos/novo.jpg', ContentFile(b'png')), nome)
+        fila.aguardar(timeout=5)
+        os.remove(os.path.join(self.media, nome))  # cache local perdido (disco efêmero)
+        self.assertTrue(self.storage.exists(nome))
+
+    def test_downloads_simultaneos_do_mesmo_arquivo_viram_um(self):
+        self.cliente.put_object(Bucket=s3.bucket(), Key=s3.chave('produtos/kit.jpg'), Body=b'kit')
+        self.cliente.latencia = 0.2
+        resultados = []
+        threads = [threading.Thread(target=lambda: resultados.append(self.storage.exists('produtos/kit.jpg')))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(resultados, [True] * 5)
+        self.assertEqual(self.cliente.chamadas['download_file'], 1)
+
+
+class EspelhoS3Tests(S3LocalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cliente = s3.cliente()
+        for i in range(5):
+            self.cliente.put_object(Bucket=s3.bucket(), Key=f'media/produtos/p{i}.jpg', Body=b'x' * (i + 1))
+
+    def _sincronizar(self, *args):
+        saida = StringIO()
+        with mock.patch('core.espelho_s3.TAMANHO_PAGINA', 2):  # força várias páginas
+            call_command('sincronizar_produtos_aws', *args, stdout=saida)
+        return saida.getvalue()
+
+    def _locais(self):
+        return sorted(n for n in os.listdir(os.path.join(self.media, 'produtos')) if not n.startswith('.'))
+
+    def test_espelha_todas_as_paginas_e_depois_so_o_que_mudou(self):
+        self._sincronizar()
+        self.assertEqual(self._locais(), [f'p{i}.jpg' for i in range(5)])
+
+        self.cliente.put_object(Bucket=s3.bucket(), Key='media/produtos/p0.jpg', Body=b'y')  # mesmo tamanho
+        antes = self.cliente.chamadas['download_file']
+        self.assertIn('1 baixados, 4 mantidos', self._sincronizar())
+        self.assertEqual(self.cliente.chamadas['download_file'], antes + 1)
+        with open(os.path.join(self.media, 'produtos', 'p0.jpg'), 'rb') as arquivo:
+            self.assertEqual(arquivo.read(), b'y')
+
+    def test_s3_local_so_pagina_a_listagem(self):
+        with self.assertRaisesMessage(ValueError, "'list_objects'"):
+            self.cliente.get_paginator('list_objects')
+
+    def test_prune_e_dry_run(self):
+        self._sincronizar()
+        self.cliente.delete_object(Bucket=s3.bucket(), Key='media/produtos/p4.jpg')
+
+        self.assertIn('1 a apagar', self._sincronizar('--prune', '--dry-run'))
+        self.assertIn('p4.jpg', self._locais())
+
+        self._sincronizar('--prune')
+        self.assertEqual(self._locais(), [f'p{i}.jpg' for i in range(4)])
+
+
+class VinculoImagemS3Tests(S3LocalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        indice_produtos.invalidar()
+        self.addCleanup(indice_produtos.invalidar)
+        self.cliente = s3.cliente()
+        self.cliente.put_object(Bucket=s3.bucket(), Key='media/produtos/batom-matte.png', Body=b'png')
+        self.categoria = Categoria.objects.create(nome='Maquiagem', slug='maquiagem')
+
+    def _salvar(self, slug):
+        produto = Produto(categoria=self.categoria, nome=slug, slug=slug, descricao='', preco=Decimal('10.00'))
+        produto.save()
+        return produto
+
+    def test_vincula_pela_listagem_sem_head_por_save(self):
+        self.assertEqual(self._salvar('batom-matte').imagem.name, 'produtos/batom-matte.png')
+        for i in range(10):
+            self.assertFalse(self._salvar(f'sem-imagem-{i}').imagem)
+        self.assertNotIn('head_object', self.cliente.chamadas)
+        self.assertEqual(self.cliente.chamadas['list_objects_v2'], 1)
+
+    def test_resalvar_produto_com_imagem_nao_toca_no_storage(self):
+        produto = self._salvar('batom-matte')
+        chamadas = dict(self.cliente.chamadas)
+        produto.nome = 'Batom Matte'
+        produto.save()
+        produto.refresh_from_db()
+        self.assertEqual(produto.imagem.name, 'produtos/batom-matte.png')
+        self.assertEqual(self.cliente.chamadas, chamadas)
+
+
+def imagem_de_teste(largura=2000, altura=1000, formato='JPEG', modo='RGB'):
+    from PIL import Image
+
+    saida = io.BytesIO()
+    Image.new(modo, (largura, altura), (200, 30, 90, 128)[:len(modo)]).save(saida, formato)
+    return saida.getvalue()
+
+
+class ConsumidorImagensTests(S3LocalMixin, TransactionTestCase):
+    # TransactionTestCase: a thread consumidora usa outra conexão com o banco
+
+    def test_save_dispara_o_consumidor_do_proprio_processo(self):
+        cache.clear()
+        storage = LocalCacheS3FallbackStorage()
+        categoria = Categoria.objects.create(nome='Olhos', slug='olhos')
+        produto = criar_produto(categoria, 'delineador', imagem=storage.save('produtos/delineador.jpg',
+                                                                            ContentFile(imagem_de_teste())))
+        versao = produto.atualizado_em
+
+        with override_settings(IMAGENS_EM_SEGUNDO_PLANO=True, IMAGENS_PROCESSOS=0):
+            nome = storage.save('produtos/rimel.jpg', ContentFile(imagem_de_teste(500, 500)))
+            self.assertTrue(tarefas_imagens.aguardar(timeout=10))
+        self.assertEqual(imagens.manifesto(produto.imagem.name)['larguras']['card'], 480)
+        self.assertEqual(tarefas_imagens.tarefas(), [])
+        self.assertEqual(imagens.manifesto(nome)['larguras']['card'], 480)
+        produto.refresh_from_db()
+        self.assertGreater(produto.atualizado_em, versao)  # o card troca de URL
+
+
+class DerivadosImagemTests(S3LocalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.storage = LocalCacheS3FallbackStorage()
+
+    def _salvar(self, nome, conteudo):
+        # O storage só enfileira; o worker (aqui, no mesmo processo) gera
+        nome = self.storage.save(nome, conteudo)
+        tarefas_imagens.processar(tarefas_imagens.prontas(), processos=0)
+        return nome
+
+    def test_gera_tamanhos_fixos_em_webp_e_jpeg(self):
+        from PIL import Image
+
+        nome = self._salvar('produtos/batom.jpg', ContentFile(imagem_de_teste()))
+        dados = imagens.manifesto(nome)
+        self.assertEqual(dados['larguras'], {'zoom': 1200, 'card': 480, 'thumb': 160})
+        for tamanho, arquivos in dados['arquivos'].items():
+            self.assertEqual(set(arquivos), {'webp', 'jpg'})
+            with Image.open(os.path.join(self.media, arquivos['webp'])) as derivado:
+                self.assertEqual(derivado.format, 'WEBP')
+                self.assertEqual(derivado.width, dados['larguras'][tamanho])
+        self.assertIn(f"/_derivados/{dados['hash']}/batom-card.jpg", imagens.url(nome, 'card'))
+        self.assertRegex(imagens.srcset(nome), r'batom-thumb\.webp 160w, .*480w, .*1200w$')
+
+    def test_imagem_pequena_nao_e_ampliada_e_png_transparente_vira_jpeg(self):
+        nome = self._salvar('produtos/kit.png', ContentFile(imagem_de_teste(300, 200, 'PNG', 'RGBA')))
+        dados = imagens.manifesto(nome)
+        self.assertEqual(dados['larguras'], {'zoom': 300, 'card': 300, 'thumb': 160})
+        self.assertTrue(os.path.exists(os.path.join(self.media, dados['arquivos']['card']['jpg'])))
+
+    def test_produto_usa_derivado_e_cai_no_original_sem_ele(self):
+        nome = self._salvar('produtos/perfume.jpg', ContentFile(imagem_de_teste()))
+        categoria = Categoria.objects.create(nome='Perfumaria', slug='perfumaria')
+        produto = criar_produto(categoria, 'perfume', imagem=nome)
+        self.assertTrue(produto.get_imagem_url(size='thumb').endswith('/perfume-thumb.jpg'))
+        self.assertEqual(produto.get_imagem_url(), f'/media/{nome}')
+
+        sem_derivados = criar_produto(categoria, 'colonia', imagem='produtos/colonia.jpg')
+        self.assertEqual(sem_derivados.get_imagem_url(size='card'), '/media/produtos/colonia.jpg')
+        self.assertEqual(sem_derivados.get_imagem_srcset(), '')
+
+    def test_mesmo_conteudo_mesma_pasta_conteudo_novo_pasta_nova(self):
+        nome = self._salvar('produtos/bolsa.jpg', ContentFile(imagem_de_teste()))
+        primeiro = imagens.manifesto(nome)['hash']
+        self.assertEqual(imagens.gerar(nome)['hash'], primeiro)
+
+        with open(os.path.join(self.media, nome), 'wb') as arquivo:
+            arquivo.write(imagem_de_teste(900, 900))
+        self.assertNotEqual(imagens.gerar(nome)['hash'], primeiro)
+
+    def test_save_so_enfileira_e_worker_gera(self):
+        nome = self.storage.save('produtos/base.jpg', ContentFile(imagem_de_teste()))
+        self.assertIsNone(imagens.manifesto(nome))
+        self.assertEqual([t['nome'] for t in tarefas_imagens.prontas()], [nome])
+
+        resultado = tarefas_imagens.processar(tarefas_imagens.prontas(), processos=0)
+        self.assertEqual((resultado.geradas, resultado.publicadas), (1, [nome]))
+        self.assertEqual(tarefas_imagens.tarefas(), [])
+        self.assertEqual(imagens.manifesto(nome)['larguras']['card'], 480)
+
+    def test_um_consumidor_por_servidor(self):
+        self.storage.save('produtos/corretivo.jpg', ContentFile(imagem_de_teste()))
+        with tarefas_imagens.consumidor() as livre:
+            self.assertTrue(livre)
+            saida = StringIO()
+            call_command('processar_imagens', '--processos', '0', stdout=saida)
+        self.assertIn('Outro processo deste servidor já consome a fila', saida.getvalue())
+        self.assertEqual(len(tarefas_imagens.prontas()), 1)
+
+    def test_falta_no_cache_nao_le_o_storage_na_requisicao(self):
+        nome = self._salvar('produtos/blush.jpg', ContentFile(imagem_de_teste()))
+        cache.clear()
+        with mock.patch('core.imagens._ler_manifesto') as ler:
+            self.assertIsNone(imagens.manifesto(nome))
+            self.assertIsNone(imagens.manifesto(nome))  # lembrada: não enfileira de novo
+        ler.assert_not_called()
+        self.assertEqual([t['nome'] for t in tarefas_imagens.prontas()], [nome])
+
+        # O worker confere que está em dia e repõe o manifesto no cache
+        resultado = tarefas_imagens.processar(tarefas_imagens.prontas(), processos=0)
+        self.assertEqual(resultado.em_dia, 1)
+        self.assertEqual(imagens.manifesto(nome)['larguras']['card'], 480)
+
+    def test_cards_buscam_os_manifestos_num_get_many(self):
+        categoria = Categoria.objects.create(nome='Rosto', slug='rosto')
+        ids = []
+        for i in range(3):
+            nome = self._salvar(f'produtos/po-{i}.jpg', ContentFile(imagem_de_teste()))
+            ids.append(criar_produto(categoria, f'po-{i}', imagem=nome, estoque=1).pk)
+        with mock.patch.object(imagens.cache_imagens, 'get_many', wraps=imagens.cache_imagens.get_many) as get_many:
+            html = cards.renderizar_cards(ids)
+        self.assertEqual(get_many.call_count, 1)
+        self.assertIn('po-0-card.jpg', html[0])
+
+    def test_mesmo_conteudo_em_dois_arquivos_e_processado_uma_vez(self):
+        conteudo = imagem_de_teste()
+        nomes = [self.storage.save(n, ContentFile(conteudo)) for n in ('produtos/a.jpg', 'produtos/galeria/b.jpg')]
+        with mock.patch('core.imagens.gerar', wraps=imagens.gerar) as gerar:
+            resultado = tarefas_imagens.processar(tarefas_imagens.prontas(), processos=0)
+        self.assertEqual(gerar.call_count, 1)
+        self.assertEqual((resultado.geradas, resultado.replicadas), (1, 1))
+        for nome in nomes:
+            card = imagens.manifesto(nome)['arquivos']['card']['webp']
+            self.assertTrue(os.path.exists(os.path.join(self.media, card)))
+        self.assertTrue(imagens.url(nomes[1], 'card').endswith('/galeria/_derivados/'
+                                                              f"{imagens.manifesto(nomes[1])['hash']}/b-card.jpg"))
+
+        # Já em dia: nada é refeito
+        tarefas_imagens.agendar(nomes[0])
+        resultado = tarefas_imagens.processar(tarefas_imagens.prontas(), processos=0)
+        self.assertEqual((resultado.geradas, resultado.em_dia), (0, 1))
+
+    @override_settings(IMAGENS_TENTATIVAS=2)
+    def test_falha_e_repetida_com_espera_e_depois_marcada(self):
+        nome = self.storage.save('produtos/sombra.jpg', ContentFile(imagem_de_teste()))
+        with mock.patch('core.imagens.gerar', side_effect=OSError('disco cheio')):
+            resultado = tarefas_imagens.processar(tarefas_imagens.prontas(), processos=0)
+            self.assertEqual(resultado.falhas, 1)
+            [tarefa] = tarefas_imagens.tarefas()
+            self.assertEqual((tarefa['tentativas'], tarefa['falhou'], tarefa['erro']), (1, False, 'disco cheio'))
+            self.assertEqual(tarefas_imagens.prontas(), [])  # esperando a próxima tentativa
+
+            tarefas_imagens.processar(tarefas_imagens.tarefas(), processos=0)
+            self.assertTrue(tarefas_imagens.tarefas()[0]['falhou'])
+
+        self.assertEqual(tarefas_imagens.reprocessar_falhas(), 1)
+        tarefas_imagens.processar(tarefas_imagens.prontas(), processos=0)
+        self.assertEqual(tarefas_imagens.tarefas(), [])
+        self.assertIsNotNone(imagens.manifesto(nome))
+
+    def test_backfill_gera_derivados_das_imagens_cadastradas(self):
+        os.makedirs(os.path.join(self.media, 'produtos'))
+        with open(os.path.join(self.media, 'produtos', 'esmalte.jpg'), 'wb') as arquivo:
+            arquivo.write(imagem_de_teste())
+        categoria = Categoria.objects.create(nome='Unhas', slug='unhas')
+        produto = criar_produto(categoria, 'esmalte', imagem='produtos/esmalte.jpg')
+        criar_produto(categoria, 'lixa')
+        versao = produto.atualizado_em
+
+        saida = StringIO()
+        call_command('processar_imagens', '--backfill', '--processos', '0', stdout=saida)
+
+        self.assertIn('1 imagens cadastradas enfileiradas', saida.getvalue())
+        self.assertIn('img/s', saida.getvalue())
+        self.assertIsNotNone(imagens.manifesto('produtos/esmalte.jpg'))
+        produto.refresh_from_db()
+        self.assertGreater(produto.atualizado_em, versao)
+
+
+class MidiaImutavelTests(S3LocalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = LocalCacheS3FallbackStorage()
+
+    def test_nome_leva_hash_do_conteudo(self):
+        nome = self.storage.save('produtos/batom.jpg', ContentFile(b'v1'))
+        self.assertRegex(nome, r'^produtos/batom\.[0-9a-f]{12}\.jpg$')
+        self.assertEqual(self.storage.save('produtos/batom.jpg', ContentFile(b'v1')), nome)
+        novo = self.storage.save('produtos/batom.jpg', ContentFile(b'v2'))
+        self.assertNotEqual(novo, nome)
+        self.assertTrue(os.path.exists(os.path.join(self.media, nome)))  # a URL antiga continua valendo
+        self.assertEqual(midia.sem_hash(novo), 'produtos/batom.jpg')
+
+    def test_trocar_imagem_do_produto_gera_url_nova(self):
+        categoria = Categoria.objects.create(nome='Maquiagem', slug='maquiagem')
+        produto = Produto(categoria=categoria, nome='Blush', slug='blush', descricao='', preco=Decimal('10.00'))
+        produto.imagem = ContentFile(b'foto 1', name='IMG_001.JPG')
+        produto.save()
+        primeira = produto.get_imagem_url()
+        self.assertRegex(primeira, r'^/media/produtos/blush\.[0-9a-f]{12}\.jpg$')
+
+        produto.imagem = ContentFile(b'foto 2', name='IMG_002.jpg')
+        produto.save()
+        self.assertNotEqual(produto.get_imagem_url(), primeira)
+        self.assertTrue(produto.get_imagem_url().startswith('/media/produtos/blush.'))
+
+    def test_cache_control(self):
+        imutavel = 'public, max-age=31536000, immutable'
+        self.assertEqual(midia.cache_control('produtos/batom.3f9a0c1be2d4.jpg'), imutavel)
+        self.assertEqual(midia.cache_control('produtos/_derivados/3f9a0c1be2d4/batom-card.webp'), imutavel)
+        with override_settings(MIDIA_MAX_AGE=600):
+            self.assertEqual(midia.cache_control('produtos/batom.jpg'), 'public, max-age=600')
+            self.assertEqual(midia.cache_control('produtos/_derivados/batom.jpg.json'), 'public, max-age=600')
+
+    def test_servir_envia_cache_control(self):
+        nome = self.storage.save('produtos/batom.jpg', ContentFile(b'v1'))
+        resposta = midia.servir(RequestFactory().get(f'/media/{nome}'), nome)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('immutable', resposta['Cache-Control'])
+
+
+class ServirMidiaTests(S3LocalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.nome = LocalCacheS3FallbackStorage().save('produtos/batom.jpg', ContentFile(b'0123456789'))
+
+    def _get(self, caminho, **cabecalhos):
+        resposta = self.client.get(f'/media/{caminho}', **cabecalhos)
+        corpo = b''.join(resposta.streaming_content) if resposta.streaming else resposta.content
+        return resposta, corpo
+
+    def test_arquivo_local_com_etag_e_cache_imutavel(self):
+        resposta, corpo = self._get(self.nome)
+        self.assertEqual((resposta.status_code, corpo), (200, b'0123456789'))
+        self.assertEqual(resposta['Content-Type'], 'image/jpeg')
+        self.assertEqual(resposta['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', resposta['Cache-Control'])
+
+        resposta, corpo = self._get(self.nome, HTTP_IF_NONE_MATCH=resposta['ETag'])
+        self.assertEqual((resposta.status_code, corpo), (304, b''))
+
+    def test_range(self):
+        resposta, corpo = self._get(self.nome, HTTP_RANGE='bytes=2-5')
+        self.assertEqual((resposta.status_code, corpo), (206, b'2345'))
+        self.assertEqual(resposta['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(self._get(self.nome, HTTP_RANGE='bytes=-3')[1], b'789')
+        self.assertEqual(self._get(self.nome, HTTP_RANGE='bytes=20-')[0].status_code, 416)
+        # Intervalo inválido é ignorado: arquivo inteiro, não 416
+        for invalido in ('bytes=5-3', 'bytes=-'):
+            resposta, corpo = self._get(self.nome, HTTP_RANGE=invalido)
+            self.assertEqual((resposta.status_code, corpo), (200, b'0123456789'), invalido)
+        # If-Range com outra versão: arquivo inteiro
+        resposta, corpo = self._get(self.nome, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"outra"')
+        self.assertEqual((resposta.status_code, corpo), (200, b'0123456789'))
+
+    def test_variante_pre_comprimida(self):
+        import gzip
+
+        with open(os.path.join(self.media, self.nome + '.gz'), 'wb') as arquivo:
+            arquivo.write(gzip.compress(b'0123456789'))
+        comprimida, corpo = self._get(self.nome, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(comprimida['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(corpo), b'0123456789')
+        normal, _ = self._get(self.nome)
+        self.assertNotEqual(comprimida['ETag'], normal['ETag'])
+        self.assertEqual(normal['Vary'], 'Accept-Encoding')
+
+    @override_settings(MIDIA_SENDFILE='x-accel-redirect', MIDIA_ACCEL_PREFIXO='/_midia/')
+    def test_x_accel_redirect(self):
+        resposta, corpo = self._get(self.nome)
+        self.assertEqual(resposta['X-Accel-Redirect'], f'/_midia/{self.nome}')
+        self.assertEqual(corpo, b'')
+        self.assertIn('immutable', resposta['Cache-Control'])
+
+    def test_nao_serve_arquivos_internos_nem_fora_da_pasta(self):
+        os.makedirs(os.path.join(self.media, '.envios_s3'))
+        with open(os.path.join(self.media, '.envios_s3', 'x.json'), 'w') as arquivo:
+            arquivo.write('{}')
+        for caminho in ('.envios_s3/x.json', '.espelho_s3.json', '../db.sqlite3', 'produtos/../../db.sqlite3'):
+            self.assertEqual(self._get(caminho)[0].status_code, 404, caminho)
+
+    def test_busca_no_s3_repassa_e_guarda_no_cache(self):
+        cliente = s3.cliente()
+        cliente.put_object(Bucket=s3.bucket(), Key=s3.chave('produtos/antigo.jpg'), Body=b'do s3')
+        resposta, corpo = self._get('produtos/antigo.jpg')
+        self.assertEqual((resposta.status_code, corpo), (200, b'do s3'))
+        self.assertTrue(os.path.exists(os.path.join(self.media, 'produtos', 'antigo.jpg')))
+
+        self.assertEqual(self._get('produtos/antigo.jpg')[1], b'do s3')
+        self.assertEqual(cliente.chamadas['get_object'], 1)
+        self.assertNotIn('produtos/antigo.jpg', storages._downloads)  # reserva solta no fim da resposta
+
+    def test_requisicao_simultanea_espera_o_download_em_andamento(self):
+        cliente = s3.cliente()
+        cliente.put_object(Bucket=s3.bucket(), Key=s3.chave('produtos/novo.jpg'), Body=b'do s3')
+        self.assertIsNone(storages.reservar_download('produtos/novo.jpg'))  # "outra thread" baixando
+        evento = storages._downloads['produtos/novo.jpg']
+        esperar = evento.wait
+
+        def termina_o_outro_download(timeout=None):
+            with open(os.path.join(self.media, 'produtos', 'novo.jpg'), 'wb') as arquivo:
+                arquivo.write(b'do s3')
+            storages.liberar_download('produtos/novo.jpg')
+            return esperar(timeout)
+
+        evento.wait = termina_o_outro_download
+        resposta, corpo = self._get('produtos/novo.jpg')
+        self.assertEqual((resposta.status_code, corpo), (200, b'do s3'))
+        self.assertNotIn('get_object', cliente.chamadas)
+
+    def test_nome_com_porcento_nao_e_decodificado_duas_vezes(self):
+        # request.path já vem decodificado: '%2e%2e' literal é parte do nome, não '..'
+        with open(os.path.join(self.media, 'produtos', 'batom%20rosa.jpg'), 'wb') as arquivo:
+            arquivo.write(b'rosa')
+        resposta, corpo = self._get('produtos/batom%2520rosa.jpg')
+        self.assertEqual((resposta.status_code, corpo), (200, b'rosa'))
+        self.assertEqual(self._get('produtos/%252e%252e/%252e%252e/db.sqlite3')[0].status_code, 404)
+
+    def test_ausente_no_s3_vai_para_o_cache_negativo(self):
+        cliente = s3.cliente()
+        self.assertEqual(self._get('produtos/sumiu.jpg')[0].status_code, 404)
+        self.assertEqual(self._get('produtos/sumiu.jpg')[0].status_code, 404)
+        self.assertEqual(cliente.chamadas['get_object'], 1)
+        self.assertNotIn('produtos/sumiu.jpg', storages._downloads)
+
+
+class CacheDiscoTests(S3LocalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # limite=0: registrar não dispara a poda em segundo plano; o teste poda explicitamente
+        self.cache_disco = CacheDisco(limite=0)
+
+    def _arquivo(self, nome, acesso, tamanho=100):
+        caminho = os.path.join(self.media, *nome.split('/'))
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with open(caminho, 'wb') as arquivo:
+            arquivo.write(b'x' * tamanho)
+        self.cache_disco.registrar(nome, acesso=acesso)
+
+    def _existe(self, nome):
+        return os.path.exists(os.path.join(self.media, *nome.split('/')))
+
+    def test_remove_os_menos_usados_ate_caber(self):
+        agora = time.time()
+        for i, nome in enumerate(('produtos/a.jpg', 'produtos/b.jpg', 'produtos/c.jpg')):
+            self._arquivo(nome, agora - 100 + i)
+        self.cache_disco.tocar('produtos/a.jpg')  # a vira o mais recente
+
+        resultado = self.cache_disco.podar(limite=250)
+        self.assertEqual((resultado.arquivos, resultado.bytes), (1, 100))
+        self.assertFalse(self._existe('produtos/b.jpg'))
+        self.assertTrue(self._existe('produtos/a.jpg') and self._existe('produtos/c.jpg'))
+        self.assertEqual(self.cache_disco.tamanho(), (2, 200))
+        self.assertEqual(self.cache_disco.estatisticas()['evicoes'], 1)
+        self.assertEqual(self.cache_disco.podar(limite=250).arquivos, 0)
+
+    def test_nunca_remove_o_que_ainda_nao_foi_para_o_s3(self):
+        from core.fila_s3 import fila
+
+        agora = time.time()
+        self._arquivo('produtos/enviando.jpg', agora - 100)
+        self._arquivo('produtos/velho.jpg', agora - 50)
+        self._arquivo('produtos/novo.jpg', agora)
+        fila._gravar_entrada({'nome': 'produtos/enviando.jpg', 'falhou': True, 'criado_em': agora})
+
+        resultado = self.cache_disco.podar(limite=150)
+        self.assertEqual((resultado.arquivos, resultado.protegidos), (2, 1))
+        self.assertTrue(self._existe('produtos/enviando.jpg'))
+        self.assertFalse(self._existe('produtos/velho.jpg') or self._existe('produtos/novo.jpg'))
+
+    def test_poda_nao_apaga_o_publicado_durante_ela(self):
+        from core.fila_s3 import fila
+
+        agora = time.time()
+        self._arquivo('produtos/velho.jpg', agora - 50)
+        self._arquivo('produtos/novo.jpg', agora)
+        lidos = self.cache_disco.protegidos
+
+        def publicacao_no_meio():
+            # Outro processo publica (diário, depois índice) enquanto a poda roda
+            antes = lidos()
+            fila._gravar_entrada({'nome': 'produtos/subindo.jpg', 'falhou': True, 'criado_em': agora})
+            self._arquivo('produtos/subindo.jpg', agora - 100)
+            return antes
+
+        with mock.patch.object(self.cache_disco, 'protegidos', side_effect=publicacao_no_meio):
+            self.cache_disco.podar(limite=150)
+        self.assertTrue(self._existe('produtos/subindo.jpg'))
+
+    def test_publicar_anota_no_diario_antes_do_indice(self):
+        from core.cache_disco import cache_disco
+        from core.fila_s3 import fila
+
+        ordem = mock.Mock()
+        manifesto = {'hash': 'abc123abc123', 'formatos': ['jpg'], 'larguras': {'card': 480},
+                     'arquivos': {'card': {'jpg': 'produtos/_derivados/abc123abc123/bolsa-card.jpg'}}}
+        with mock.patch.object(fila, 'agendar', ordem.agendar), \
+                mock.patch.object(cache_disco, 'registrar', ordem.registrar):
+            imagens.publicar('produtos/bolsa.jpg', manifesto)
+        chamadas = [nome for nome, _, _ in ordem.mock_calls]
+        self.assertEqual(chamadas, ['agendar', 'agendar', 'registrar', 'registrar'])
+
+    def test_sem_s3_nada_sai_do_disco(self):
+        self._arquivo('produtos/unico.jpg', time.time())
+        with mock.patch('core.s3.bucket', return_value=''):
+            self.assertEqual(self.cache_disco.podar(limite=1).arquivos, 0)
+        self.assertTrue(self._existe('produtos/unico.jpg'))
+
+    def test_arquivo_removido_volta_do_s3(self):
+        from core.fila_s3 import fila
+
+        storage = LocalCacheS3FallbackStorage()
+        nome = storage.save('produtos/perfume.jpg', ContentFile(b'y' * 100))
+        self.assertTrue(fila.aguardar(timeout=5))
+        self.assertEqual(self.cache_disco.podar(limite=10).arquivos, 1)
+        self.assertFalse(self._existe(nome))
+        self.assertTrue(storage.exists(nome))
+        self.assertEqual(self.cache_disco.tamanho(), (1, 100))
+
+    def test_comando_reconcilia_e_relata(self):
+        os.makedirs(os.path.join(self.media, 'produtos'))
+        with open(os.path.join(self.media, 'produtos', 'externo.jpg'), 'wb') as arquivo:
+            arquivo.write(b'z' * 2048)
+        saida = StringIO()
+        call_command('cache_midia', '--reconciliar', stdout=saida)
+        self.assertIn('1 arquivos adicionados', saida.getvalue())
+        self.assertIn('Cache de mídia: 1 arquivos', saida.getvalue())
+        self.assertIn('aproveitamento=', saida.getvalue())
+        self.assertIn('Remoções (LRU): 0 arquivos', saida.getvalue())
@@ -0,0 +1,26 @@
+# core/views.py
+from django.contrib import messages
+from django.contrib.admin import site
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+
+from core import s3
+from core.fila_s3 import fila
+
+
+# --------------------------------------------------------------------------------------
+# ☁️ Status da fila de envios para o S3 (página do admin; ver core/fila_s3.py)
+# --------------------------------------------------------------------------------------
+def status_envios_s3(request):
+    if request.method == 'POST':
+        reenviadas = fila.reenviar()
+        messages.success(request, f"{reenviadas} envio(s) com falha reagendado(s).")
+        return redirect('status_envios_s3')
+
+    contexto = {
+        **site.each_context(request),
+        'title': 'Envios para o S3',
+        'bucket': s3.bucket(),
+        'situacao': fila.situacao(),
+    }
+    return TemplateResponse(request, 'admin/envios_s3.html', contexto)
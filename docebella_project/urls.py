@@ -1,10 +1,11 @@
 # docebella_project/urls.py
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
+from core.views import status_envios_s3
 
 urlpatterns = [
+    # Status da fila de envios para o S3 (antes do admin, para não cair no catch-all dele)
+    path('painel-loja/envios-s3/', admin.site.admin_view(status_envios_s3), name='status_envios_s3'),
     path('painel-loja/', admin.site.urls),
     
     # 1. Rotas do App PRODUTOS (Home Page)
@@ -26,6 +27,4 @@ urlpatterns = [
     # path('accounts/', include('django.contrib.auth.urls')), 
 ]
 
-# ... restante do código para MEDIA
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# MEDIA_URL é servido pelo core.midia.MidiaMiddleware (produção e desenvolvimento)
@@ -14,3 +14,18 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'docebella_project.settings')
 
 application = get_wsgi_application()
+
+# Índice do autocompletar montado antes da primeira requisição de cada worker
+from produtos.sugestoes import aquecer  # noqa: E402
+
+aquecer()
+
+# Envios para o S3 que ficaram no diário (restart/worker morto) voltam para a fila
+from core.fila_s3 import fila  # noqa: E402
+
+fila.recuperar()
+
+# Derivados de imagem que ficaram na fila: a thread consumidora retoma
+from core import tarefas_imagens  # noqa: E402
+
+tarefas_imagens.disparar()
@@ -15,6 +15,10 @@ class ItemPedidoInline(admin.TabularInline):
     readonly_fields = ('produto', 'variacao', 'preco_unitario', 'quantidade')
     fields = ('produto', 'variacao', 'preco_unitario', 'quantidade')
 
+    def get_queryset(self, request):
+        # str(variacao) usa o nome do produto: sem isto, duas consultas por item
+        return super().get_queryset(request).select_related('produto', 'variacao__produto')
+
 
 # ------------------------------------
 # 2. ADMIN PARA PEDIDOS (CONSOLIDADO)
@@ -51,6 +55,7 @@ class PedidoAdmin(admin.ModelAdmin):
         'codigo_rastreio',
     )
     list_filter = ('status', 'data_criacao')
+    list_select_related = ('cliente',)
     
     # Busca por email do cliente
     search_fields = ('cliente__email', 'endereco__cep', 'id')
@@ -89,7 +89,7 @@ class ItemPedido(models.Model):
         else:
             nome_display = "Produto Deletado/Inválido"
 
-        return f'{self.quantidade}x {nome_display} (Pedido {self.pedido.id})'
+        return f'{self.quantidade}x {nome_display} (Pedido {self.pedido_id})'
 
 
 
@@ -0,0 +1,73 @@
+# pedidos/montagem.py
+"""
+Montagem do pedido a partir dos itens do carrinho, com número fixo de
+consultas qualquer que seja a quantidade de itens: endereço, pedido, baixa de
+estoque em lote (produtos.estoque.reservar_estoque) e um único bulk_create
+dos ItemPedido.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+
+from produtos.estoque import reservar_estoque
+from .models import Cupom, EnderecoEntrega, ItemPedido, Pedido
+
+
+def montar_pedido(cliente, itens_carrinho, nome, telefone, cupom_codigo=None,
+                  desconto=Decimal('0.00'), total=Decimal('0.00')):
+    """
+    Cria o pedido de retirada na loja com os itens informados (já carregados)
+    e baixa o estoque. Tudo ou nada: EstoqueInsuficiente desfaz o pedido.
+    """
+    baixa_produtos, baixa_variacoes = defaultdict(int), defaultdict(int)
+    for item in itens_carrinho:
+        if not item.produto_id:
+            raise Exception("Item inválido: Produto ou Variação não encontrados.")
+        if item.variacao_id:
+            baixa_variacoes[item.variacao_id] += item.quantidade
+        else:
+            baixa_produtos[item.produto_id] += item.quantidade
+
+    with transaction.atomic():
+        # 1️⃣ Endereço fictício (retirada)
+        endereco_retirada = EnderecoEntrega.objects.create(
+            nome=nome,
+            sobrenome="",
+            email=cliente.email,
+            cep="00000-000",
+            rua="Retirada na Loja",
+            numero="S/N",
+            complemento=f"Telefone: {telefone}",
+            bairro="Loja",
+            cidade="Doce&Bella",
+            estado="PR"
+        )
+
+        # 2️⃣ Cria o pedido (já com desconto e cupom)
+        pedido = Pedido.objects.create(
+            cliente=cliente,
+            endereco=endereco_retirada,
+            valor_total=total,
+            valor_frete=Decimal('0.00'),
+            metodo_envio="Retirada na Loja",
+            cupom=Cupom.objects.filter(codigo=cupom_codigo).first() if cupom_codigo else None,
+            valor_desconto=desconto
+        )
+
+        # 3️⃣ Baixa atômica: UPDATE ... WHERE estoque >= qtd; sem saldo, o pedido inteiro é desfeito
+        reservar_estoque(produtos=baixa_produtos, variacoes=baixa_variacoes)
+
+        # 4️⃣ Todos os itens num único INSERT
+        ItemPedido.objects.bulk_create([
+            ItemPedido(
+                pedido=pedido,
+                produto_id=item.produto_id,
+                variacao_id=item.variacao_id,
+                preco_unitario=item.preco,
+                quantidade=item.quantidade,
+            )
+            for item in itens_carrinho
+        ])
+
+    return pedido
@@ -1,3 +1,119 @@
-from django.test import TestCase
+import threading
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from carrinho.models import ItemCarrinho
+from produtos.models import Categoria, Produto, Variacao
+from .models import ItemPedido, Pedido
+
+DADOS_CHECKOUT = {'nome': 'Cliente', 'telefone': '41999999999'}
+
+
+def criar_cliente_com_carrinho(indice, produto, quantidade=1):
+    """Client logado com `quantidade` do produto no carrinho (tabela ItemCarrinho)."""
+    usuario = get_user_model().objects.create_user(
+        email=f'cliente{indice}@example.com', password='senha-forte-123', nome_completo=f'Cliente {indice}'
+    )
+    client = Client()
+    client.force_login(usuario)
+    ItemCarrinho.objects.create(
+        session_key=client.session.session_key, produto=produto, quantidade=quantidade, preco=produto.preco
+    )
+    return client
+
+
+def criar_produto(slug, estoque):
+    categoria, _ = Categoria.objects.get_or_create(nome='Perfumes', slug='perfumes')
+    # bulk_create evita o Produto.save() (que consulta o S3)
+    return Produto.objects.bulk_create([Produto(
+        categoria=categoria, nome=slug, slug=slug, descricao='', preco=Decimal('50.00'),
+        estoque=estoque, estoque_total=estoque, tem_estoque=estoque > 0,
+    )])[0]
+
+
+class CheckoutEstoqueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_sem_saldo_o_pedido_inteiro_e_desfeito(self):
+        produto = criar_produto('perfume-unico', estoque=1)
+        primeiro = criar_cliente_com_carrinho(1, produto)
+        segundo = criar_cliente_com_carrinho(2, produto)
+
+        self.assertEqual(primeiro.post(reverse('pedidos:checkout'), DADOS_CHECKOUT).status_code, 302)
+        resposta = segundo.post(reverse('pedidos:checkout'), DADOS_CHECKOUT, follow=True)
+        self.assertContains(resposta, 'Estoque insuficiente')
+
+        produto.refresh_from_db()
+        self.assertEqual((produto.estoque, produto.tem_estoque), (0, False))
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.assertEqual(ItemPedido.objects.count(), 1)
+        # O carrinho de quem não conseguiu comprar continua lá
+        self.assertEqual(ItemCarrinho.objects.count(), 1)
+
+    def _consultas_do_checkout(self, indice, quantidade_itens):
+        client = criar_cliente_com_carrinho(indice, criar_produto(f'simples-{indice}', estoque=5))
+        session_key = client.session.session_key
+        for i in range(quantidade_itens - 1):
+            produto = criar_produto(f'bolsa-{indice}-{i}', estoque=0)
+            variacao = Variacao.objects.create(produto=produto, cor=f'Cor {i}', estoque=4)
+            ItemCarrinho.objects.create(
+                session_key=session_key, produto=produto, variacao=variacao, quantidade=2, preco=produto.preco
+            )
+
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = client.post(reverse('pedidos:checkout'), DADOS_CHECKOUT)
+        pedido = Pedido.objects.latest('id')
+        self.assertRedirects(resposta, reverse('pedidos:detalhe_pedido', args=[pedido.id]), fetch_redirect_response=False)
+        self.assertEqual(pedido.itens.count(), quantidade_itens)
+        return len(consultas)
+
+    def test_quantidade_de_consultas_nao_depende_do_numero_de_itens(self):
+        self.assertEqual(self._consultas_do_checkout(1, 2), self._consultas_do_checkout(2, 8))
+
+
+class CheckoutConcorrenteTests(TransactionTestCase):
+    """Dispara checkouts em paralelo contra o mesmo SKU e confere que nada é vendido a mais."""
+
+    COMPRADORES = 8
+    ESTOQUE = 3
+
+    def setUp(self):
+        cache.clear()
+
+    def test_checkouts_paralelos_nao_vendem_acima_do_estoque(self):
+        produto = criar_produto('perfume-disputado', estoque=self.ESTOQUE)
+        clients = [criar_cliente_com_carrinho(i, produto) for i in range(self.COMPRADORES)]
+        for client in clients:
+            # No SQLite os perdedores podem receber "table is locked" (500); o que importa é o saldo
+            client.raise_request_exception = False
+        largada = threading.Barrier(len(clients))
+        respostas = []
+
+        def comprar(client):
+            try:
+                largada.wait()
+                respostas.append(client.post(reverse('pedidos:checkout'), DADOS_CHECKOUT).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=comprar, args=(c,)) for c in clients]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        produto.refresh_from_db()
+        vendidos = ItemPedido.objects.filter(produto=produto).count()
+        self.assertEqual(len(respostas), self.COMPRADORES)
+        self.assertGreaterEqual(vendidos, 1)
+        self.assertLessEqual(vendidos, self.ESTOQUE)
+        self.assertEqual(Pedido.objects.count(), vendidos)
+        self.assertEqual(produto.estoque, self.ESTOQUE - vendidos)
+        self.assertEqual(produto.estoque_total, produto.estoque)
@@ -4,10 +4,11 @@ from carrinho.models import ItemCarrinho
 from .models import EnderecoEntrega, Pedido, ItemPedido
 from django.db import transaction
 from django import forms
-from carrinho.views import _get_session_key
+from carrinho.armazenamento import migrar_para_banco, obter_carrinho
 from produtos.models import Produto, Variacao 
 from django.contrib import messages
 from decimal import Decimal, InvalidOperation
+from .montagem import montar_pedido
 from pedidos.models import Cupom
 
 
@@ -31,11 +32,14 @@ class CheckoutFormSimplificado(forms.Form):
 # ---------------------- CHECKOUT ----------------------
 @login_required
 def checkout(request):
-    session_key = _get_session_key(request)
-    itens_carrinho = ItemCarrinho.objects.filter(session_key=session_key)
+    # Logado, o carrinho é sempre o do banco; se ainda houver um no cookie, ele é somado agora
+    migrar_para_banco(request)
+    carrinho = obter_carrinho(request)
+    # 🛑 OTIMIZAÇÃO: carrega os itens (com produto e variação) uma única vez
+    itens_carrinho = list(carrinho.itens())
 
     # ⚠️ Se o carrinho estiver vazio, redireciona
-    if not itens_carrinho.exists():
+    if not itens_carrinho:
         messages.warning(request, "Seu carrinho está vazio.")
         return redirect('carrinho:ver_carrinho')
 
@@ -74,55 +78,18 @@ def checkout(request):
 
             try:
                 with transaction.atomic():
-                    # 1️⃣ Endereço fictício (retirada)
-                    endereco_retirada = EnderecoEntrega.objects.create(
+                    pedido = montar_pedido(
+                        request.user,
+                        itens_carrinho,
                         nome=cleaned_data['nome'],
-                        sobrenome="",
-                        email=request.user.email,
-                        cep="00000-000",
-                        rua="Retirada na Loja",
-                        numero="S/N",
-                        complemento=f"Telefone: {cleaned_data['telefone']}",
-                        bairro="Loja",
-                        cidade="Doce&Bella",
-                        estado="PR"
+                        telefone=cleaned_data['telefone'],
+                        cupom_codigo=cupom_codigo,
+                        desconto=desconto_valor,
+                        total=total_com_desconto,
                     )
 
-                    # 2️⃣ Cria o pedido (já com desconto e cupom)
-                    pedido = Pedido.objects.create(
-                        cliente=request.user,
-                        endereco=endereco_retirada,
-                        valor_total=total_com_desconto,
-                        valor_frete=Decimal('0.00'),
-                        metodo_envio="Retirada na Loja",
-                        cupom=Cupom.objects.filter(codigo=cupom_codigo).first() if cupom_codigo else None,
-                        valor_desconto=desconto_valor
-                    )
-
-                    # 3️⃣ Move os itens do carrinho para o pedido
-                    for item_carrinho in itens_carrinho:
-                        target = item_carrinho.variacao or item_carrinho.produto
-
-                        if not target:
-                            raise Exception("Item inválido: Produto ou Variação não encontrados.")
-
-                        if target.estoque < item_carrinho.quantidade:
-                            raise Exception(f"Estoque insuficiente para {item_carrinho.produto.nome}.")
-
-                        ItemPedido.objects.create(
-                            pedido=pedido,
-                            produto=item_carrinho.produto,
-                            variacao=item_carrinho.variacao,
-                            preco_unitario=item_carrinho.preco,
-                            quantidade=item_carrinho.quantidade
-                        )
-
-                        # Atualiza o estoque
-                        target.estoque -= item_carrinho.quantidade
-                        target.save()
-
                     # 🧹 Limpa carrinho e cupom após o pedido
-                    itens_carrinho.delete()
+                    carrinho.limpar()
                     for key in ['cupom_codigo', 'desconto_valor', 'total_com_desconto']:
                         request.session.pop(key, None)
 
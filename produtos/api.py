@@ -0,0 +1,167 @@
+# produtos/api.py
+"""
+API de catálogo somente leitura (JSON).
+
+- /api/produtos/, /api/produtos/<slug>/ e /api/categorias/<slug>/produtos/.
+- Projeções com .values(): nenhuma instância de modelo é montada.
+- ETag forte derivada da versão do catálogo (no cache compartilhado, avançada a
+  cada alteração de Produto, Variacao, Categoria, Promocao ou ImagemProduto e a
+  cada baixa de estoque) e da tabela de preços vigentes, que muda sozinha quando
+  uma promoção começa ou termina. If-None-Match igual vira 304 sem SQL.
+- Listas paginadas por cursor (keyset em -id), como a vitrine.
+"""
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponse
+from django.templatetags.static import static
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_safe
+
+from core.cache import CacheNamespace
+from core.consultas import orcamento_consultas
+from core.paginacao import codificar_cursor, id_do_cursor
+from core.serializacao import para_json
+from produtos.precos import obter_tabela
+
+cache_catalogo = CacheNamespace('catalogo')
+
+POR_PAGINA = 48
+POR_PAGINA_MAXIMA = 100
+
+CAMPOS_PRODUTO = (
+    'id', 'nome', 'slug', 'preco', 'imagem', 'imagem_url_externa', 'estoque_total', 'categoria__slug',
+)
+CAMPOS_VARIACAO = ('id', 'cor', 'tamanho', 'outro', 'estoque', 'imagem', 'imagem_url_externa')
+CAMPOS_GALERIA = ('imagem', 'imagem_url_externa', 'descricao')
+
+
+def etag_catalogo(request, *args, **kwargs):
+    tabela = obter_tabela()
+    fronteira = int(tabela.valido_ate.timestamp()) if tabela.valido_ate else 0
+    return f'catalogo-{cache_catalogo.versao()}-{tabela.versao}-{fronteira}'
+
+
+def invalidar_catalogo(**kwargs):
+    cache_catalogo.avancar_versao()
+
+
+# -------------------------------------
+# Projeções
+# -------------------------------------
+def _imagem(nome, url_externa):
+    # Mesma prioridade de Produto.get_imagem_url(), sem instanciar o modelo
+    if url_externa:
+        return url_externa
+    if nome:
+        return default_storage.url(nome)
+    return static('img/placeholder.png')
+
+
+def _produto(linha, tabela):
+    vigente = tabela.get(linha['id'])
+    promocao = vigente.titulo if vigente and vigente.promocao_id else None
+    return {
+        'id': linha['id'],
+        'nome': linha['nome'],
+        'slug': linha['slug'],
+        'categoria': linha['categoria__slug'],
+        'preco': f"{vigente.preco_final if vigente else linha['preco']:.2f}",
+        'preco_original': f"{linha['preco']:.2f}",
+        'promocao': promocao,
+        'estoque': linha['estoque_total'],
+        'imagem': _imagem(linha['imagem'], linha['imagem_url_externa']),
+    }
+
+
+def _pagina(request, produtos):
+    try:
+        por_pagina = min(max(int(request.GET.get('limite', POR_PAGINA)), 1), POR_PAGINA_MAXIMA)
+    except ValueError:
+        por_pagina = POR_PAGINA
+    depois_de = id_do_cursor(request.GET.get('cursor'))
+    if depois_de is not None:
+        produtos = produtos.filter(id__lt=depois_de)
+
+    linhas = list(produtos.order_by('-id').values(*CAMPOS_PRODUTO)[:por_pagina + 1])
+    proximo = None
+    if len(linhas) > por_pagina:
+        linhas = linhas[:por_pagina]
+        proximo = codificar_cursor(linhas[-1]['id'])
+    tabela = obter_tabela()
+    return {'produtos': [_produto(linha, tabela) for linha in linhas], 'proximo': proximo}
+
+
+def _resposta(dados):
+    resposta = HttpResponse(para_json(dados), content_type='application/json')
+    # O cliente guarda a resposta, mas revalida sempre (barato: 304 pela ETag)
+    patch_cache_control(resposta, public=True, no_cache=True)
+    return resposta
+
+
+# -------------------------------------
+# Views
+# -------------------------------------
+@require_safe
+@orcamento_consultas(6)
+@condition(etag_func=etag_catalogo)
+def listar_produtos(request):
+    from produtos.models import Produto
+
+    return _resposta(_pagina(request, Produto.objects.filter(disponivel=True, tem_estoque=True)))
+
+
+@require_safe
+@orcamento_consultas(6)
+@condition(etag_func=etag_catalogo)
+def detalhe_produto(request, slug):
+    from produtos.models import ImagemProduto, Produto, Variacao
+
+    linha = (
+        Produto.objects.filter(slug=slug, disponivel=True)
+        .values(*CAMPOS_PRODUTO, 'descricao', 'usa_variacoes')
+        .first()
+    )
+    if linha is None:
+        raise Http404('Produto não encontrado.')
+
+    dados = _produto(linha, obter_tabela())
+    dados['descricao'] = linha['descricao']
+    dados['variacoes'] = []
+    if linha['usa_variacoes']:
+        for v in Variacao.objects.filter(produto_id=linha['id']).order_by('id').values(*CAMPOS_VARIACAO):
+            imagem = v.pop('imagem'), v.pop('imagem_url_externa')
+            # Sem imagem própria a variação usa a do produto (null)
+            v['imagem'] = _imagem(*imagem) if any(imagem) else None
+            dados['variacoes'].append(v)
+    dados['galeria'] = [
+        {'imagem': _imagem(g['imagem'], g['imagem_url_externa']), 'descricao': g['descricao']}
+        for g in ImagemProduto.objects.filter(produto_id=linha['id']).values(*CAMPOS_GALERIA)
+    ]
+    return _resposta(dados)
+
+
+@require_safe
+@orcamento_consultas(6)
+@condition(etag_func=etag_catalogo)
+def listar_produtos_categoria(request, slug):
+    from produtos.models import Categoria, Produto
+
+    categoria = Categoria.objects.filter(slug=slug).values('id', 'nome', 'slug').first()
+    if categoria is None:
+        raise Http404('Categoria não encontrada.')
+
+    # Mesmo filtro da página da categoria (listar_por_categoria)
+    dados = _pagina(request, Produto.objects.filter(categoria_id=categoria['id'], disponivel=True))
+    dados['categoria'] = {'nome': categoria['nome'], 'slug': categoria['slug']}
+    return _resposta(dados)
+
+
+# -------------------------------------
+# Sinais
+# -------------------------------------
+def conectar_sinais():
+    from django.db.models.signals import post_save, post_delete
+    from produtos.models import Categoria, ImagemProduto, Produto, Promocao, Variacao
+
+    for model in (Produto, Variacao, Categoria, Promocao, ImagemProduto):
+        post_save.connect(invalidar_catalogo, sender=model, dispatch_uid=f'catalogo_save_{model.__name__}')
+        post_delete.connect(invalidar_catalogo, sender=model, dispatch_uid=f'catalogo_delete_{model.__name__}')
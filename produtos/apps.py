@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class ProdutosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'produtos'
+
+    def ready(self):
+        from produtos import api, busca, cards, estoque, layout, precos, sugestoes
+        precos.conectar_sinais()
+        estoque.conectar_sinais()
+        cards.conectar_sinais()
+        layout.conectar_sinais()
+        busca.conectar_sinais()
+        sugestoes.conectar_sinais()
+        api.conectar_sinais()
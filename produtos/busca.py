@@ -0,0 +1,268 @@
+# produtos/busca.py
+"""
+Busca textual de produtos.
+
+Cada produto tem um documento de busca, sem acentos e em minúsculas, com pesos:
+  A: nome · B: categoria e variações (cor, tamanho, outro) · D: descrição
+
+- PostgreSQL: coluna tsvector Produto.busca_documento (config 'portuguese',
+  com stemming) + índice GIN, ordenada por ts_rank; cada termo vira um prefixo
+  (to_tsquery 'bat:*'), como no FTS5 e no antigo icontains.
+- SQLite: tabela virtual FTS5 produtos_busca_fts (unicode61 sem diacríticos),
+  ordenada por bm25; os termos casam por prefixo no lugar do stemming.
+- Outros bancos (ou SQLite sem FTS5): icontains nos mesmos campos, sem índice.
+
+Os resultados são paginados por keyset em (relevância, id): a página 50 custa
+o mesmo que a primeira. O índice é atualizado pelos sinais de Produto,
+Variacao e Categoria; `reindexar_busca` refaz tudo.
+"""
+import hashlib
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast
+
+from core.paginacao import codificar_cursor, decodificar_cursor
+
+CONFIG = 'portuguese'
+TABELA_FTS = 'produtos_busca_fts'
+PESOS_FTS = (10.0, 4.0, 1.0)  # nome, categoria/variações, descrição
+LOTE = 500
+
+_motores = {}
+
+
+def normalizar(texto):
+    """Minúsculas, sem acentos e com espaços simples: 'Batom Vermelho Paixão' -> 'batom vermelho paixao'."""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.lower().split())
+
+
+def termos(texto):
+    return re.findall(r'\w+', normalizar(texto))
+
+
+def documento(produto):
+    """(nome, categoria + variações, descrição) normalizados; espera categoria e variações carregadas."""
+    extras = [produto.categoria.nome if produto.categoria_id else '']
+    for variacao in produto.variacoes.all():
+        extras.extend(v for v in (variacao.cor, variacao.tamanho, variacao.outro) if v)
+    return normalizar(produto.nome), normalizar(' '.join(extras)), normalizar(produto.descricao)
+
+
+def motor():
+    """'postgresql', 'fts5' ou 'icontains', conforme o banco da conexão padrão."""
+    vendor = connection.vendor
+    if vendor in _motores:
+        return _motores[vendor]
+    if vendor == 'postgresql':
+        _motores[vendor] = 'postgresql'
+    elif vendor == 'sqlite' and TABELA_FTS in connection.introspection.table_names():
+        _motores[vendor] = 'fts5'
+    else:
+        # Não memoriza: a tabela FTS pode ser criada depois (migração)
+        return 'icontains'
+    return _motores[vendor]
+
+
+# -------------------------------------
+# Manutenção do índice
+# -------------------------------------
+def reindexar(produto_ids=None, modelo=None):
+    """
+    Recalcula o documento de busca dos produtos indicados (ou de todos), em
+    lotes de LOTE. `modelo` permite usar o Produto histórico numa migração.
+    Retorna o número de produtos indexados.
+    """
+    if modelo is None:
+        from produtos.models import Produto as modelo
+
+    produtos = modelo.objects.select_related('categoria').prefetch_related('variacoes').order_by('pk')
+    if produto_ids is not None:
+        produto_ids = list(produto_ids)
+        if not produto_ids:
+            return 0
+        produtos = produtos.filter(pk__in=produto_ids)
+
+    if motor() == 'fts5':
+        # Linhas antigas saem antes (inclusive de produtos que não existem mais)
+        if produto_ids is None:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {TABELA_FTS}')
+        else:
+            remover(produto_ids)
+
+    total = 0
+    lote = []
+    for produto in produtos.iterator(chunk_size=LOTE):
+        lote.append(produto)
+        if len(lote) >= LOTE:
+            total += _gravar(modelo, lote)
+            lote = []
+    if lote:
+        total += _gravar(modelo, lote)
+    return total
+
+
+def _gravar(modelo, produtos):
+    atual = motor()
+    if atual == 'postgresql':
+        from django.contrib.postgres.search import SearchVector
+        for produto in produtos:
+            nome, extra, descricao = documento(produto)
+            produto.busca_documento = (
+                SearchVector(Value(nome), weight='A', config=CONFIG)
+                + SearchVector(Value(extra), weight='B', config=CONFIG)
+                + SearchVector(Value(descricao), weight='D', config=CONFIG)
+            )
+        modelo.objects.bulk_update(produtos, ['busca_documento'])
+    elif atual == 'fts5':
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {TABELA_FTS} (rowid, nome, extra, descricao) VALUES (%s, %s, %s, %s)',
+                [(p.pk, *documento(p)) for p in produtos],
+            )
+    return len(produtos)
+
+
+def remover(produto_ids):
+    if motor() != 'fts5' or not produto_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABELA_FTS} WHERE rowid IN ({",".join("%s" for _ in produto_ids)})',
+            list(produto_ids),
+        )
+
+
+# -------------------------------------
+# Consulta
+# -------------------------------------
+def buscar(texto, cursor=None, por_pagina=48):
+    """
+    Produtos da vitrine (disponíveis e com estoque) que casam com `texto`,
+    do mais ao menos relevante. Devolve {'ids': [...], 'proximo': cursor ou None}.
+    Páginas ficam no cache das listagens, invalidado junto com elas.
+    """
+    from produtos.cards import cache_listagens
+
+    palavras = termos(texto)
+    if not palavras:
+        return {'ids': [], 'proximo': None}
+    posicao = decodificar_cursor(cursor, 2)
+
+    versao = cache_listagens.versao()
+    assinatura = hashlib.md5(f'{" ".join(palavras)}|{cursor or ""}|{por_pagina}'.encode('utf-8')).hexdigest()
+    chave = f'{versao}:busca:{assinatura}'
+
+    def calcular():
+        consulta = {
+            'postgresql': _buscar_postgresql,
+            'fts5': _buscar_fts5,
+            'icontains': _buscar_icontains,
+        }[motor()]
+        linhas = consulta(palavras, posicao, por_pagina + 1)
+        proximo = None
+        if len(linhas) > por_pagina:
+            linhas = linhas[:por_pagina]
+            proximo = codificar_cursor(*linhas[-1])
+        return {'ids': [produto_id for _, produto_id in linhas], 'proximo': proximo}
+
+    return cache_listagens.obter_ou_calcular(chave, calcular)
+
+
+def prefixos(palavras):
+    """Expressão to_tsquery em que todos os termos casam por prefixo: ['bat', 'pai'] -> 'bat:* & pai:*'."""
+    return ' & '.join(f'{palavra}:*' for palavra in palavras)
+
+
+def _buscar_postgresql(palavras, posicao, limite):
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+    from produtos.models import Produto
+
+    consulta = SearchQuery(prefixos(palavras), config=CONFIG, search_type='raw')
+    produtos = (
+        Produto.objects.filter(disponivel=True, tem_estoque=True, busca_documento=consulta)
+        # double precision: o valor volta idêntico no cursor (ts_rank devolve real)
+        .annotate(relevancia=Cast(SearchRank(F('busca_documento'), consulta), FloatField()))
+    )
+    if posicao:
+        relevancia, ultimo_id = posicao
+        produtos = produtos.filter(Q(relevancia__lt=relevancia) | Q(relevancia=relevancia, id__lt=ultimo_id))
+    return list(produtos.order_by('-relevancia', '-id').values_list('relevancia', 'id')[:limite])
+
+
+def _buscar_fts5(palavras, posicao, limite):
+    from produtos.models import Produto
+
+    expressao = ' '.join(f'"{palavra}"*' for palavra in palavras)
+    pesos = ', '.join(str(p) for p in PESOS_FTS)
+    sql = (
+        f'SELECT relevancia, id FROM ('
+        f'  SELECT -bm25({TABELA_FTS}, {pesos}) AS relevancia, p.id AS id'
+        f'  FROM {TABELA_FTS} JOIN {Produto._meta.db_table} p ON p.id = {TABELA_FTS}.rowid'
+        f'  WHERE {TABELA_FTS} MATCH %s AND p.disponivel AND p.tem_estoque'
+        f') '
+    )
+    parametros = [expressao]
+    if posicao:
+        sql += 'WHERE relevancia < %s OR (relevancia = %s AND id < %s) '
+        parametros += [posicao[0], posicao[0], posicao[1]]
+    sql += 'ORDER BY relevancia DESC, id DESC LIMIT %s'
+    parametros.append(limite)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return [tuple(linha) for linha in cursor.fetchall()]
+
+
+def _buscar_icontains(palavras, posicao, limite):
+    from produtos.models import Produto
+
+    produtos = Produto.objects.filter(disponivel=True, tem_estoque=True)
+    for palavra in palavras:
+        produtos = produtos.filter(
+            Q(nome__icontains=palavra) | Q(descricao__icontains=palavra)
+            | Q(categoria__nome__icontains=palavra) | Q(variacoes__cor__icontains=palavra)
+            | Q(variacoes__tamanho__icontains=palavra) | Q(variacoes__outro__icontains=palavra)
+        )
+    if posicao:
+        produtos = produtos.filter(id__lt=posicao[1])
+    ids = produtos.order_by('-id').values_list('id', flat=True).distinct()[:limite]
+    return [(0, produto_id) for produto_id in ids]
+
+
+# -------------------------------------
+# Sinais
+# -------------------------------------
+def _produto_salvo(sender, instance, **kwargs):
+    reindexar([instance.pk])
+
+
+def _produto_removido(sender, instance, **kwargs):
+    remover([instance.pk])
+
+
+def _variacao_alterada(sender, instance, **kwargs):
+    if instance.produto_id:
+        reindexar([instance.produto_id])
+
+
+def _categoria_salva(sender, instance, created, **kwargs):
+    if not created:
+        from produtos.cards import invalidar_listagens
+        reindexar(instance.produtos.values_list('pk', flat=True))
+        invalidar_listagens()
+
+
+def conectar_sinais():
+    from django.db.models.signals import post_save, post_delete
+    from produtos.models import Categoria, Produto, Variacao
+
+    post_save.connect(_produto_salvo, sender=Produto, dispatch_uid='busca_produto_save')
+    post_delete.connect(_produto_removido, sender=Produto, dispatch_uid='busca_produto_delete')
+    post_save.connect(_variacao_alterada, sender=Variacao, dispatch_uid='busca_variacao_save')
+    post_delete.connect(_variacao_alterada, sender=Variacao, dispatch_uid='busca_variacao_delete')
+    post_save.connect(_categoria_salva, sender=Categoria, dispatch_uid='busca_categoria_save')
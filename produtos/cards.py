@@ -0,0 +1,142 @@
+# produtos/cards.py
+"""
+Cache de fragmentos das vitrines.
+
+- Card: HTML de um produto, chaveado por (variante, produto id, versão, promoção
+  ativa). A versão é o `atualizado_em` do produto, que é tocado sempre que um
+  Produto, Variacao, Promocao ou ImagemProduto é salvo/removido; a promoção ativa
+  entra na chave para que início/fim de promoção troque o card sozinho.
+- Esqueleto: ids e cursor seguinte de uma página de listagem (keyset em -id),
+  chaveados pela versão da listagem, que só muda quando o conjunto de produtos
+  visíveis pode mudar (Produto ou estoque de Variacao). O total da listagem é
+  contado uma vez por versão, à parte.
+
+Cards e esqueletos são invalidados de forma independente.
+"""
+import hashlib
+
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from core import imagens
+from core.cache import CacheNamespace
+from core.paginacao import id_do_cursor, paginar_por_id
+from produtos.precos import obter_tabela
+
+cache_cards = CacheNamespace('cards', timeout=60 * 60 * 24)
+cache_listagens = CacheNamespace('listagens', timeout=600, stale_ttl=60)
+
+TEMPLATES_CARD = {
+    'home': 'produtos/partials/card_home.html',
+    'categoria': 'produtos/partials/card_categoria.html',
+}
+
+
+def chave_card(variante, produto_id, versao, promocao_id):
+    return f'{variante}:{produto_id}:{versao.timestamp():.6f}:{promocao_id or 0}'
+
+
+def obter_listagem(nome, queryset, cursor, por_pagina):
+    """
+    Retorna o esqueleto {'ids', 'proximo'} da página que começa depois do cursor.
+    Keyset em -id: qualquer página custa o mesmo que a primeira, e em cache
+    nem isso.
+    """
+    versao = cache_listagens.versao()
+    nome_hash = hashlib.md5(nome.encode('utf-8')).hexdigest()
+    depois_de = id_do_cursor(cursor)
+    chave = f'{versao}:{nome_hash}:{por_pagina}:{depois_de or 0}'
+
+    def montar():
+        ids, proximo = paginar_por_id(queryset, depois_de, por_pagina)
+        return {'ids': ids, 'proximo': proximo}
+
+    return cache_listagens.obter_ou_calcular(chave, montar)
+
+
+def obter_total(nome, queryset):
+    """Total de produtos da listagem: um COUNT(*) por versão da listagem, não por página."""
+    versao = cache_listagens.versao()
+    nome_hash = hashlib.md5(nome.encode('utf-8')).hexdigest()
+    return cache_listagens.obter_ou_calcular(f'{versao}:{nome_hash}:total', queryset.count)
+
+
+def renderizar_cards(ids, variante='home'):
+    """
+    Devolve o HTML dos cards na ordem de `ids`: uma consulta leve pelas
+    versões, um único get_many no cache e renderização só dos que faltam
+    (com os manifestos das imagens deles em outro get_many).
+    """
+    from produtos.models import Produto
+
+    if not ids:
+        return []
+
+    tabela = obter_tabela()
+    versoes = dict(Produto.objects.filter(pk__in=ids).values_list('id', 'atualizado_em'))
+
+    chaves = {}
+    for produto_id in ids:
+        if produto_id not in versoes:
+            continue  # removido depois que o esqueleto foi montado
+        vigente = tabela.get(produto_id)
+        chaves[produto_id] = chave_card(
+            variante, produto_id, versoes[produto_id], vigente.promocao_id if vigente else None
+        )
+
+    em_cache = cache_cards.get_many(list(chaves.values()))
+
+    faltando = [pid for pid, chave in chaves.items() if chave not in em_cache]
+    if faltando:
+        novos = {}
+        produtos = list(Produto.objects.filter(pk__in=faltando))
+        # Manifestos dos derivados de todos os cards num get_many, não 3 gets por card
+        with imagens.precarregar(p.imagem.name for p in produtos if p.imagem and not p.imagem_url_externa):
+            for produto in produtos:
+                produto.preco_vigente = tabela.get(produto)
+                produto.tem_promocao = bool(produto.preco_vigente and produto.preco_vigente.promocao_id)
+                novos[chaves[produto.pk]] = render_to_string(TEMPLATES_CARD[variante], {'produto': produto})
+        cache_cards.set_many(novos)
+        em_cache.update(novos)
+
+    return [mark_safe(em_cache[chaves[pid]]) for pid in ids if chaves.get(pid) in em_cache]
+
+
+def invalidar_listagens(**kwargs):
+    cache_listagens.avancar_versao()
+
+
+def _tocar_produto(sender, instance, **kwargs):
+    """Avança a versão (atualizado_em) do produto dono do objeto alterado."""
+    from produtos.models import Produto
+    if instance.produto_id:
+        Produto.objects.filter(pk=instance.produto_id).update(atualizado_em=timezone.now())
+
+
+def _derivados_publicados(sender, nomes, **kwargs):
+    """Imagens que ganharam derivados: avança a versão dos produtos delas (os cards trocam de URL)."""
+    from produtos.models import ImagemProduto, Produto, Variacao
+
+    ids = set(Produto.objects.filter(imagem__in=nomes).values_list('id', flat=True))
+    ids.update(Variacao.objects.filter(imagem__in=nomes).values_list('produto_id', flat=True))
+    ids.update(ImagemProduto.objects.filter(imagem__in=nomes).values_list('produto_id', flat=True))
+    if ids:
+        Produto.objects.filter(pk__in=ids).update(atualizado_em=timezone.now())
+
+
+def conectar_sinais():
+    from django.db.models.signals import post_save, post_delete
+    from core.tarefas_imagens import derivados_publicados
+    from produtos.models import ImagemProduto, Produto, Promocao, Variacao
+
+    derivados_publicados.connect(_derivados_publicados, dispatch_uid='cards_derivados_publicados')
+
+    for model in (Variacao, Promocao, ImagemProduto):
+        post_save.connect(_tocar_produto, sender=model, dispatch_uid=f'cards_save_{model.__name__}')
+        post_delete.connect(_tocar_produto, sender=model, dispatch_uid=f'cards_delete_{model.__name__}')
+
+    # Só o que muda o conjunto visível (disponibilidade/estoque) invalida os esqueletos
+    for model in (Produto, Variacao):
+        post_save.connect(invalidar_listagens, sender=model, dispatch_uid=f'listagem_save_{model.__name__}')
+        post_delete.connect(invalidar_listagens, sender=model, dispatch_uid=f'listagem_delete_{model.__name__}')
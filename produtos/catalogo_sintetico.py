@@ -0,0 +1,149 @@
+# produtos/catalogo_sintetico.py
+"""
+Catálogo sintético para benchmarks e testes de carga.
+
+Gera categorias, produtos (simples e com variações), promoções vigentes e
+imagens de galeria em lotes de bulk_create, e depois acerta o que o
+bulk_create não dispara: estoque desnormalizado, índice de busca e os caches
+em memória/compartilhados. Tudo leva o prefixo dado no slug, para poder ser
+removido depois sem tocar no catálogo real.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+TIPOS = ["Batom", "Perfume", "Bolsa", "Hidratante", "Máscara", "Base", "Sabonete", "Esmalte",
+         "Carteira", "Colônia", "Sérum", "Shampoo", "Gloss", "Kit"]
+ADJETIVOS = ["Matte", "Cremoso", "Floral", "Doce", "Intenso", "Suave", "Líquido", "Nutritivo",
+             "Amadeirado", "Cítrico", "Vegano", "Clássico", "Glamour"]
+CORES = ["Vermelho", "Rosa", "Nude", "Preto", "Marrom", "Coral", "Vinho", "Lilás", "Dourado", "Bege"]
+TAMANHOS = ["P", "M", "G", "30ml", "50ml", "100ml"]
+PALAVRAS = ["fragrância", "textura", "pele", "cabelo", "longa", "duração", "acabamento", "toque",
+            "aveludado", "brilho", "proteção", "vitamina", "presente", "dia", "noite"]
+
+ESTOQUE = 10 ** 6  # grande o bastante para nenhum checkout do benchmark esgotar o produto
+LOTE = 1000
+
+
+def semear(prefixo='carga', categorias=8, produtos=2000, variacoes=3, fracao_variacoes=0.3,
+           fracao_promocoes=0.2, imagens=2, semente=42):
+    """
+    Cria o catálogo e devolve {'categorias': [slug], 'produtos': [(slug, variacao_id ou None)]},
+    com uma variação de exemplo para os produtos que usam variações.
+    """
+    from produtos.models import Categoria, ImagemProduto, Produto, Promocao, Variacao
+
+    rnd = random.Random(semente)
+    agora = timezone.now()
+
+    cats = Categoria.objects.bulk_create([
+        Categoria(nome=f"{prefixo.title()} {i + 1}", slug=f"{prefixo}-cat-{i + 1}")
+        for i in range(categorias)
+    ])
+
+    criados = []
+    for inicio in range(0, produtos, LOTE):
+        lote = []
+        for i in range(inicio, min(inicio + LOTE, produtos)):
+            usa_variacoes = variacoes > 0 and rnd.random() < fracao_variacoes
+            lote.append(Produto(
+                categoria=rnd.choice(cats),
+                nome=f"{rnd.choice(TIPOS)} {rnd.choice(ADJETIVOS)} {rnd.choice(CORES)} {i + 1}",
+                slug=f"{prefixo}-{i + 1}",
+                descricao=" ".join(rnd.choices(PALAVRAS, k=20)),
+                preco=Decimal(rnd.randint(990, 29990)) / 100,
+                usa_variacoes=usa_variacoes,
+                estoque=0 if usa_variacoes else ESTOQUE,
+            ))
+        criados.extend(Produto.objects.bulk_create(lote, batch_size=LOTE))
+
+    novas_variacoes, novas_promocoes, novas_imagens = [], [], []
+    for produto in criados:
+        if produto.usa_variacoes:
+            for j in range(variacoes):
+                novas_variacoes.append(Variacao(
+                    produto=produto, cor=CORES[j % len(CORES)], tamanho=rnd.choice(TAMANHOS),
+                    estoque=ESTOQUE,
+                ))
+        if rnd.random() < fracao_promocoes:
+            novas_promocoes.append(Promocao(
+                produto=produto, titulo="Oferta", desconto_percentual=Decimal(rnd.randint(5, 40)),
+                data_inicio=agora - timedelta(hours=1), data_fim=agora + timedelta(hours=rnd.randint(2, 72)),
+            ))
+        for j in range(imagens):
+            novas_imagens.append(ImagemProduto(
+                produto=produto, imagem_url_externa=f"https://example.com/{produto.slug}-{j + 1}.jpg", ordem=j + 1,
+            ))
+    Variacao.objects.bulk_create(novas_variacoes, batch_size=LOTE)
+    Promocao.objects.bulk_create(novas_promocoes, batch_size=LOTE)
+    ImagemProduto.objects.bulk_create(novas_imagens, batch_size=LOTE)
+
+    _acertar_derivados([p.pk for p in criados])
+
+    exemplo = _variacao_de_exemplo(prefixo)
+    return {
+        'categorias': [c.slug for c in cats],
+        'produtos': [(p.slug, exemplo.get(p.pk)) for p in criados],
+    }
+
+
+def carregar(prefixo='carga'):
+    """Mesmo formato de semear(), a partir de um catálogo sintético já gravado."""
+    from produtos.models import Categoria, Produto
+
+    exemplo = _variacao_de_exemplo(prefixo)
+    produtos = Produto.objects.filter(slug__startswith=f"{prefixo}-", disponivel=True).values_list('id', 'slug')
+    return {
+        'categorias': list(Categoria.objects.filter(slug__startswith=f"{prefixo}-cat-").values_list('slug', flat=True)),
+        'produtos': [(slug, exemplo.get(pk)) for pk, slug in produtos],
+    }
+
+
+def _variacao_de_exemplo(prefixo):
+    from produtos.models import Variacao
+
+    exemplo = {}
+    variacoes = Variacao.objects.filter(produto__slug__startswith=f"{prefixo}-").order_by('id')
+    for variacao_id, produto_id in variacoes.values_list('id', 'produto_id'):
+        exemplo.setdefault(produto_id, variacao_id)
+    return exemplo
+
+
+def remover(prefixo='carga'):
+    """Apaga o catálogo sintético (produtos, variações, promoções, galeria e categorias)."""
+    from produtos.models import Categoria, Produto
+
+    Produto.objects.filter(slug__startswith=f"{prefixo}-").delete()
+    Categoria.objects.filter(slug__startswith=f"{prefixo}-cat-").delete()
+    invalidar_caches()
+
+
+def _acertar_derivados(produto_ids):
+    from produtos import busca
+    from produtos.estoque import recalcular_estoque
+
+    recalcular_estoque(produto_ids)
+    busca.reindexar(produto_ids)
+    invalidar_caches()
+
+
+def invalidar_caches():
+    """
+    Descarta tudo que pode ter guardado o catálogo sintético: listagens, preços,
+    sugestões, versão da API e layout. Necessário também depois de desfazer a
+    transação do benchmark, senão os caches apontam para produtos que não existem.
+    """
+    from produtos.api import invalidar_catalogo
+    from produtos.cards import invalidar_listagens
+    from produtos.layout import CHAVES_POR_MODELO, cache_layout
+    from produtos.precos import invalidar_tabela
+    from produtos.sugestoes import invalidar_indice
+
+    invalidar_listagens()
+    invalidar_tabela()
+    invalidar_indice()
+    invalidar_catalogo()
+    for chave in CHAVES_POR_MODELO.values():
+        cache_layout.delete(chave)
@@ -1,6 +1,6 @@
-from .models import Categoria
+from .layout import categorias_header as _categorias_header
 
 def categorias_header(request):
     return {
-        'categorias_header': Categoria.objects.filter(show_in_header=True)
+        'categorias_header': _categorias_header()
     }
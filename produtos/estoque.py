@@ -0,0 +1,175 @@
+# produtos/estoque.py
+"""
+Manutenção dos campos desnormalizados Produto.estoque_total / Produto.tem_estoque.
+
+- estoque_total segue Produto.get_estoque_total(): soma das variações quando o
+  produto usa variações, senão o estoque do próprio produto.
+- tem_estoque segue o filtro antigo da vitrine: o produto OU alguma variação
+  tem estoque positivo.
+
+Também concentra a baixa de estoque dos pedidos (reservar_estoque).
+"""
+from django.db import transaction
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+class EstoqueInsuficiente(Exception):
+    """Alguma linha não tinha saldo; `faltando` é uma lista de (descrição, pedido, disponível)."""
+
+    def __init__(self, faltando):
+        self.faltando = faltando
+        detalhes = ', '.join(f'{nome} (pedido {qtd}, disponível {disp})' for nome, qtd, disp in faltando)
+        super().__init__(f'Estoque insuficiente para {detalhes}.')
+
+
+class _SemSaldo(Exception):
+    pass
+
+
+def calcular_estoque(produto):
+    """Retorna (estoque_total, tem_estoque) para uma instância de Produto."""
+    if not produto.pk:
+        return produto.estoque if not produto.usa_variacoes else 0, produto.estoque > 0
+
+    from produtos.models import Variacao
+    dados = Variacao.objects.filter(produto_id=produto.pk).aggregate(
+        soma=Sum('estoque'),
+        com_estoque=Sum(Case(When(estoque__gt=0, then=1), default=0, output_field=IntegerField())),
+    )
+    soma_variacoes = dados['soma'] or 0
+    total = soma_variacoes if produto.usa_variacoes else produto.estoque
+    return total, produto.estoque > 0 or bool(dados['com_estoque'])
+
+
+def _soma_variacoes():
+    from produtos.models import Variacao
+    return Subquery(
+        Variacao.objects.filter(produto=OuterRef('pk'))
+        .values('produto')
+        .annotate(total=Sum('estoque'))
+        .values('total'),
+        output_field=IntegerField(),
+    )
+
+
+def _estoque_total_expr():
+    return Case(
+        When(usa_variacoes=True, then=Coalesce(_soma_variacoes(), Value(0))),
+        default=F('estoque'),
+        output_field=IntegerField(),
+    )
+
+
+def _tem_estoque_q():
+    from produtos.models import Variacao
+    return Q(estoque__gt=0) | Exists(Variacao.objects.filter(produto=OuterRef('pk'), estoque__gt=0))
+
+
+def anotar_estoque_esperado(queryset):
+    """Anota `estoque_total_calc` e `tem_estoque_calc` calculados a partir das tabelas de origem."""
+    return queryset.annotate(
+        estoque_total_calc=_estoque_total_expr(),
+        tem_estoque_calc=_tem_estoque_q(),
+    )
+
+
+def recalcular_estoque(produto_ids=None):
+    """
+    Recalcula os campos desnormalizados em lote (dois UPDATEs),
+    sem passar por Produto.save(). Retorna o número de produtos afetados.
+    """
+    from produtos.models import Produto
+
+    produtos = Produto.objects.all()
+    if produto_ids is not None:
+        produtos = produtos.filter(pk__in=list(produto_ids))
+
+    atualizados = produtos.update(estoque_total=_estoque_total_expr())
+    produtos.update(tem_estoque=Case(When(_tem_estoque_q(), then=Value(True)), default=Value(False)))
+    return atualizados
+
+
+def _quantidade_por_id(quantidades):
+    return Case(
+        *[When(pk=pk, then=Value(qtd)) for pk, qtd in quantidades.items()],
+        output_field=IntegerField(),
+    )
+
+
+def _baixar(model, quantidades):
+    """
+    Um único UPDATE ... SET estoque = estoque - qtd WHERE id IN (...) AND estoque >= qtd.
+    A condição é reavaliada sob o lock da linha, então checkouts concorrentes não vendem a mais.
+    """
+    if not quantidades:
+        return
+    quantidade = _quantidade_por_id(quantidades)
+    baixados = model.objects.filter(pk__in=list(quantidades), estoque__gte=quantidade).update(
+        estoque=F('estoque') - quantidade
+    )
+    if baixados != len(quantidades):
+        raise _SemSaldo
+
+
+def _descrever_faltas(queryset, quantidades):
+    objetos = queryset.in_bulk(list(quantidades))
+    return [
+        (str(obj), quantidades[pk], obj.estoque)
+        for pk, obj in objetos.items()
+        if obj.estoque < quantidades[pk]
+    ]
+
+
+def reservar_estoque(produtos=None, variacoes=None):
+    """
+    Baixa de uma vez o estoque de vários produtos ({produto_id: qtd}) e
+    variações ({variacao_id: qtd}): no máximo um UPDATE condicional por tabela.
+
+    Tudo ou nada: se alguma linha não tem saldo, nada é baixado e sobe
+    EstoqueInsuficiente. Em seguida recalcula os campos desnormalizados e avança
+    o `atualizado_em` dos produtos afetados (o UPDATE em lote não dispara sinais).
+    """
+    from produtos.models import Produto, Variacao
+    from produtos.api import invalidar_catalogo
+    from produtos.cards import invalidar_listagens
+    from produtos.sugestoes import registrar_produtos
+
+    produtos = {pk: qtd for pk, qtd in (produtos or {}).items() if qtd}
+    variacoes = {pk: qtd for pk, qtd in (variacoes or {}).items() if qtd}
+    if not produtos and not variacoes:
+        return
+
+    try:
+        with transaction.atomic():
+            _baixar(Produto, produtos)
+            _baixar(Variacao, variacoes)
+    except _SemSaldo:
+        # Já revertido; só monta a mensagem com o saldo atual
+        raise EstoqueInsuficiente(
+            _descrever_faltas(Produto.objects, produtos)
+            + _descrever_faltas(Variacao.objects.select_related('produto'), variacoes)
+        ) from None
+
+    afetados = set(produtos)
+    if variacoes:
+        afetados.update(Variacao.objects.filter(pk__in=list(variacoes)).values_list('produto_id', flat=True))
+    recalcular_estoque(afetados)
+    Produto.objects.filter(pk__in=afetados).update(atualizado_em=timezone.now())
+    transaction.on_commit(invalidar_listagens)
+    transaction.on_commit(invalidar_catalogo)
+    transaction.on_commit(lambda: registrar_produtos(afetados))
+
+
+def _variacao_alterada(sender, instance, **kwargs):
+    if instance.produto_id:
+        recalcular_estoque([instance.produto_id])
+
+
+def conectar_sinais():
+    from django.db.models.signals import post_save, post_delete
+    from produtos.models import Variacao
+
+    post_save.connect(_variacao_alterada, sender=Variacao, dispatch_uid='estoque_variacao_save')
+    post_delete.connect(_variacao_alterada, sender=Variacao, dispatch_uid='estoque_variacao_delete')
@@ -0,0 +1,55 @@
+# produtos/layout.py
+"""
+Dados de layout (cabeçalho, banners, mensagens do topo) no cache compartilhado.
+Mudam raramente e são lidos em quase toda página; invalidados pelo admin.
+"""
+from core.cache import CacheNamespace
+
+cache_layout = CacheNamespace('layout', timeout=600, stale_ttl=120)
+
+
+def categorias_header():
+    from produtos.models import Categoria
+    return cache_layout.obter_ou_calcular(
+        'categorias_header',
+        lambda: list(Categoria.objects.filter(show_in_header=True)),
+    )
+
+
+def mensagens_topo_ativas():
+    from produtos.models import MensagemTopo
+    return cache_layout.obter_ou_calcular(
+        'mensagens_topo',
+        lambda: list(MensagemTopo.objects.filter(ativo=True).only('texto', 'ordem')),
+    )
+
+
+def banners_ativos():
+    from produtos.models import Banner
+    return cache_layout.obter_ou_calcular(
+        'banners',
+        lambda: list(
+            Banner.objects.filter(ativo=True)
+            .only('titulo', 'imagem', 'imagem_mobile', 'link', 'link_mobile', 'ativo')
+        ),
+    )
+
+
+CHAVES_POR_MODELO = {
+    'Categoria': 'categorias_header',
+    'MensagemTopo': 'mensagens_topo',
+    'Banner': 'banners',
+}
+
+
+def _invalidar(sender, **kwargs):
+    cache_layout.delete(CHAVES_POR_MODELO[sender.__name__])
+
+
+def conectar_sinais():
+    from django.db.models.signals import post_save, post_delete
+    from produtos.models import Banner, Categoria, MensagemTopo
+
+    for model in (Categoria, MensagemTopo, Banner):
+        post_save.connect(_invalidar, sender=model, dispatch_uid=f'layout_save_{model.__name__}')
+        post_delete.connect(_invalidar, sender=model, dispatch_uid=f'layout_delete_{model.__name__}')
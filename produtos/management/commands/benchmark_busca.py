@@ -0,0 +1,144 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from produtos.busca import buscar, motor, reindexar
+from produtos.models import Categoria, Produto
+
+TIPOS = ["Batom", "Perfume", "Bolsa", "Hidratante", "Máscara", "Base", "Sabonete", "Esmalte",
+         "Carteira", "Colônia", "Sérum", "Shampoo", "Condicionador", "Óleo", "Gloss", "Kit"]
+ADJETIVOS = ["Matte", "Cremoso", "Floral", "Doce", "Intenso", "Suave", "Líquido", "Nutritivo",
+             "Hidratante", "Amadeirado", "Cítrico", "Vegano", "Clássico", "Glamour", "Infantil"]
+CORES = ["Vermelho", "Rosa", "Nude", "Preto", "Marrom", "Coral", "Vinho", "Lilás", "Dourado",
+         "Bege", "Azul", "Pêssego"]
+MARCAS = ["Bella", "Aurora", "Jasmim", "Lírio", "Orquídea", "Violeta", "Magnólia", "Camélia"]
+PALAVRAS = ["fragrância", "textura", "pele", "cabelo", "longa", "duração", "acabamento", "toque",
+            "aveludado", "brilho", "proteção", "vitamina", "perfeito", "presente", "dia", "noite"]
+CATEGORIAS = ["Maquiagem", "Perfumaria", "Bolsas", "Cabelos", "Corpo e Banho", "Acessórios"]
+
+CONSULTAS_PADRAO = "batom vermelho,perfume floral,bolsa,hidratante corpo,colonia,kit presente,xyzzy"
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera um catálogo sintético e mede a busca textual (índice) contra o icontains antigo, "
+        "além do autocompletar. "
+        "Tudo roda numa transação desfeita no final, a menos que --manter seja usado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--produtos", type=int, default=50000, help="Tamanho do catálogo gerado")
+        parser.add_argument("--consultas", default=CONSULTAS_PADRAO, help="Termos separados por vírgula")
+        parser.add_argument("--repeticoes", type=int, default=20, help="Execuções de cada consulta")
+        parser.add_argument("--por-pagina", type=int, default=48)
+        parser.add_argument("--semente", type=int, default=42)
+        parser.add_argument("--manter", action="store_true", help="Não desfaz o catálogo gerado")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"🏁 Benchmark de busca: motor {motor()}, {options['produtos']} produtos")
+        with transaction.atomic():
+            self._gerar_catalogo(options["produtos"], random.Random(options["semente"]))
+            self._medir(options)
+            self._medir_sugestoes(options)
+            if not options["manter"]:
+                transaction.set_rollback(True)
+                self.stdout.write("🧹 Catálogo gerado desfeito.")
+
+    def _gerar_catalogo(self, quantidade, rnd):
+        inicio = time.perf_counter()
+        categorias = [
+            Categoria.objects.get_or_create(nome=f"{nome} (benchmark)", slug=f"benchmark-{i}")[0]
+            for i, nome in enumerate(CATEGORIAS)
+        ]
+        base = Produto.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        lote = []
+        for i in range(quantidade):
+            nome = f"{rnd.choice(TIPOS)} {rnd.choice(ADJETIVOS)} {rnd.choice(CORES)} {rnd.choice(MARCAS)}"
+            lote.append(Produto(
+                categoria=rnd.choice(categorias),
+                nome=nome,
+                slug=f"benchmark-{base + i + 1}",
+                descricao=" ".join(rnd.choices(PALAVRAS, k=25)),
+                preco=Decimal(rnd.randint(990, 29990)) / 100,
+                estoque=rnd.randint(0, 20),
+            ))
+            if len(lote) == 2000:
+                self._inserir(lote)
+                lote = []
+        if lote:
+            self._inserir(lote)
+        gerado = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        indexados = reindexar(Produto.objects.filter(slug__startswith="benchmark-").values_list("id", flat=True))
+        self.stdout.write(
+            f"📦 Catálogo gerado em {gerado:.1f}s; {indexados} produto(s) indexado(s) em "
+            f"{time.perf_counter() - inicio:.1f}s"
+        )
+
+    def _inserir(self, produtos):
+        for produto in produtos:
+            # bulk_create não passa pelo save(): preenche o estoque desnormalizado aqui
+            produto.estoque_total = produto.estoque
+            produto.tem_estoque = produto.estoque > 0
+        Produto.objects.bulk_create(produtos)
+
+    def _medir(self, options):
+        self.stdout.write(
+            f"\n{'consulta':<20} {'resultados':>10} {'índice p50':>11} {'p95':>9} {'icontains p50':>14} {'p95':>9}"
+        )
+        for texto in [t.strip() for t in options["consultas"].split(",") if t.strip()]:
+            indice = self._cronometrar(
+                lambda: buscar(texto, por_pagina=options["por_pagina"]), options["repeticoes"], sem_cache=True
+            )
+            # Consulta antiga (home): só o nome, ILIKE '%termo%'
+            antiga = self._cronometrar(
+                lambda: list(
+                    Produto.objects.filter(disponivel=True, tem_estoque=True, nome__icontains=texto)
+                    .order_by("-id").values_list("id", flat=True)[:options["por_pagina"]]
+                ),
+                options["repeticoes"],
+            )
+            resultados = len(buscar(texto, por_pagina=options["por_pagina"])["ids"])
+            self.stdout.write(
+                f"{texto[:20]:<20} {resultados:>10} {indice[0]:>9.2f}ms {indice[1]:>7.2f}ms "
+                f"{antiga[0]:>12.2f}ms {antiga[1]:>7.2f}ms"
+            )
+
+    def _medir_sugestoes(self, options):
+        from produtos import sugestoes
+
+        sugestoes.invalidar_indice()
+        inicio = time.perf_counter()
+        entradas = len(sugestoes.obter_indice())
+        self.stdout.write(
+            f"\n🔤 Índice de sugestões: {entradas} chave(s) em {time.perf_counter() - inicio:.1f}s"
+        )
+        sugestoes.sugerir("a")  # carrega a tabela de preços fora da medição
+
+        self.stdout.write(f"{'prefixo':<20} {'sugestões':>10} {'p50':>9} {'p95':>9}")
+        for texto in [t.strip() for t in options["consultas"].split(",") if t.strip()]:
+            for tamanho in (2, 4, len(texto)):
+                prefixo = texto[:tamanho]
+                tempos = self._cronometrar(lambda: sugestoes.sugerir(prefixo), options["repeticoes"])
+                self.stdout.write(
+                    f"{prefixo[:20]:<20} {len(sugestoes.sugerir(prefixo)):>10} "
+                    f"{tempos[0]:>7.3f}ms {tempos[1]:>7.3f}ms"
+                )
+
+    def _cronometrar(self, funcao, repeticoes, sem_cache=False):
+        from produtos.cards import invalidar_listagens
+
+        tempos = []
+        for _ in range(repeticoes):
+            if sem_cache:
+                invalidar_listagens()  # mede a consulta, não o cache das páginas
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        percentis = statistics.quantiles(tempos, n=20) if len(tempos) > 1 else tempos * 19
+        return statistics.median(tempos), percentis[18]
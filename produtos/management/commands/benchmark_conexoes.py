@@ -0,0 +1,125 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.urls import reverse
+
+MODOS = ("desligado", "persistente", "pool")
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a latência por requisição com e sem reaproveitamento de conexões "
+        "(desligado / persistente / pool) contra o banco configurado em DATABASE_URL"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requisicoes", type=int, default=200, help="Requisições por modo")
+        parser.add_argument(
+            "--url",
+            default=None,
+            help="Caminho a exercitar (padrão: contador do carrinho, /carrinho/get-total/)"
+        )
+        parser.add_argument(
+            "--modos",
+            default="desligado,persistente,pool",
+            help="Modos separados por vírgula: " + ", ".join(MODOS)
+        )
+        parser.add_argument(
+            "--atraso-conexao-ms",
+            type=float,
+            default=0.0,
+            help="Atraso artificial ao abrir cada conexão, para simular TCP+TLS+auth "
+                 "de um Postgres remoto quando o banco local é SQLite"
+        )
+
+    def handle(self, *args, **options):
+        modos = [m.strip() for m in options["modos"].split(",") if m.strip()]
+        invalidos = set(modos) - set(MODOS)
+        if invalidos:
+            raise CommandError(f"Modo(s) desconhecido(s): {', '.join(sorted(invalidos))}")
+
+        url = options["url"] or reverse("carrinho:get_carrinho_total_ajax")
+        atraso = options["atraso_conexao_ms"] / 1000
+        total = options["requisicoes"]
+
+        self.stdout.write(
+            f"🏁 Benchmark de conexões: {connection.vendor}, {total} requisições por modo em {url}"
+            + (f", atraso de conexão {options['atraso_conexao_ms']:.0f} ms" if atraso else "")
+        )
+
+        original_get_new_connection = connection.get_new_connection
+        original_conn_max_age = connection.settings_dict["CONN_MAX_AGE"]
+        original_pool = connection.settings_dict["OPTIONS"].get("pool")
+        abertas = []
+
+        def get_new_connection(conn_params):
+            abertas.append(1)
+            if atraso:
+                time.sleep(atraso)
+            return original_get_new_connection(conn_params)
+
+        connection.get_new_connection = get_new_connection
+        resultados = []
+        try:
+            for modo in modos:
+                if not self._configurar(modo):
+                    continue
+                abertas.clear()
+                client = Client(HTTP_HOST="localhost")
+                client.get(url)  # aquecimento (sessão, caches)
+                close_old_connections()
+                abertas.clear()
+
+                tempos = []
+                for _ in range(total):
+                    inicio = time.perf_counter()
+                    client.get(url)
+                    # O que o Django faz ao final de cada requisição real (request_finished)
+                    close_old_connections()
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+                resultados.append((modo, len(abertas), tempos))
+        finally:
+            connection.get_new_connection = original_get_new_connection
+            connection.settings_dict["CONN_MAX_AGE"] = original_conn_max_age
+            if original_pool is None:
+                connection.settings_dict["OPTIONS"].pop("pool", None)
+            else:
+                connection.settings_dict["OPTIONS"]["pool"] = original_pool
+            connection.close()
+
+        self.stdout.write(f"\n{'modo':<12} {'conexões':>9} {'média':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for modo, conexoes, tempos in resultados:
+            percentis = statistics.quantiles(tempos, n=100) if len(tempos) > 1 else tempos * 99
+            self.stdout.write(
+                f"{modo:<12} {conexoes:>9} {statistics.mean(tempos):>7.2f}ms "
+                f"{percentis[49]:>7.2f}ms {percentis[94]:>7.2f}ms {percentis[98]:>7.2f}ms"
+            )
+
+        if len(resultados) > 1:
+            base = statistics.mean(resultados[0][2])
+            for modo, _, tempos in resultados[1:]:
+                ganho = (1 - statistics.mean(tempos) / base) * 100 if base else 0
+                self.stdout.write(self.style.SUCCESS(f"✅ {modo}: {ganho:.1f}% mais rápido que {resultados[0][0]}"))
+
+    def _configurar(self, modo):
+        """Ajusta a conexão 'default' em tempo de execução para o modo pedido."""
+        connection.close()
+        if connection.vendor == "postgresql" and hasattr(connection, "close_pool"):
+            connection.close_pool()
+        connection.settings_dict["OPTIONS"].pop("pool", None)
+
+        if modo == "desligado":
+            connection.settings_dict["CONN_MAX_AGE"] = 0
+        elif modo == "persistente":
+            connection.settings_dict["CONN_MAX_AGE"] = 600
+        elif modo == "pool":
+            from django.db.backends.postgresql.psycopg_any import is_psycopg3
+            if connection.vendor != "postgresql" or not is_psycopg3:
+                self.stdout.write(self.style.WARNING("⏭️ Modo 'pool' exige PostgreSQL com psycopg 3; ignorado."))
+                return False
+            connection.settings_dict["CONN_MAX_AGE"] = 0
+            connection.settings_dict["OPTIONS"]["pool"] = {"min_size": 1, "max_size": 4}
+        return True
@@ -0,0 +1,93 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.espelho_s3 import EspelhoS3
+from core.s3_local import S3Local
+
+BUCKET = 'benchmark'
+PREFIXO = 'media/produtos/'
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o espelho S3 → disco (sincronizar_produtos_aws) contra um S3 falso local com muitos objetos: "
+        "serial x paralelo, sincronização incremental e o limite de uma listagem sem paginação"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--objetos", type=int, default=20000)
+        parser.add_argument("--tamanho", type=int, default=4096, help="Bytes por objeto")
+        parser.add_argument("--latencia", type=float, default=0.002, help="Segundos por chamada ao S3 falso")
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--pular-serial", action="store_true", help="Não mede o download serial (lento)")
+        parser.add_argument("--semente", type=int, default=42)
+
+    def handle(self, *args, **options):
+        pasta = tempfile.mkdtemp(prefix="benchmark-espelho-")
+        try:
+            cliente = S3Local(os.path.join(pasta, "s3"))
+            self._popular(cliente, options)
+            cliente.latencia = options["latencia"]
+
+            pagina = cliente.list_objects_v2(Bucket=BUCKET, Prefix=PREFIXO)
+            self.stdout.write(
+                f"📋 Uma chamada de list_objects_v2 (o comando antigo) via {pagina['KeyCount']} "
+                f"de {options['objetos']} objetos"
+            )
+
+            cenarios = []
+            if not options["pular_serial"]:
+                cenarios.append(("serial (1 thread)", 1, os.path.join(pasta, "serial")))
+            cenarios.append((f"paralelo ({options['threads']} threads)", options["threads"],
+                             os.path.join(pasta, "paralelo")))
+
+            destino = None
+            for nome, threads, destino in cenarios:
+                self._relatar(nome, self._espelho(cliente, destino, threads).sincronizar())
+
+            # Incremental: nada mudou, só listagem + manifesto
+            self._relatar("incremental (nada mudou)", self._espelho(cliente, destino, options["threads"]).sincronizar())
+
+            # Incremental com 1% alterado e 1% removido
+            rnd = random.Random(options["semente"] + 1)
+            chaves = [f"{PREFIXO}produto-{i}.jpg" for i in range(options["objetos"])]
+            alterar = max(1, options["objetos"] // 100)
+            latencia, cliente.latencia = cliente.latencia, 0
+            for chave in rnd.sample(chaves, alterar * 2)[:alterar]:
+                cliente.put_object(Bucket=BUCKET, Key=chave, Body=rnd.randbytes(options["tamanho"]))
+            for chave in rnd.sample(chaves, alterar):
+                cliente.delete_object(Bucket=BUCKET, Key=chave)
+            cliente.latencia = latencia
+            self._relatar(
+                "incremental (1% alterado, 1% removido, --prune)",
+                self._espelho(cliente, destino, options["threads"]).sincronizar(podar=True),
+            )
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    def _popular(self, cliente, options):
+        inicio = time.perf_counter()
+        rnd = random.Random(options["semente"])
+        for i in range(options["objetos"]):
+            cliente.put_object(Bucket=BUCKET, Key=f"{PREFIXO}produto-{i}.jpg", Body=rnd.randbytes(options["tamanho"]))
+        self.stdout.write(
+            f"🧪 S3 falso com {options['objetos']} objetos de {options['tamanho']} bytes "
+            f"em {time.perf_counter() - inicio:.1f}s; latência simulada de {options['latencia'] * 1000:.0f} ms"
+        )
+
+    def _espelho(self, cliente, destino, threads):
+        return EspelhoS3(destino, prefixo=PREFIXO, threads=threads, cliente=cliente, bucket=BUCKET)
+
+    def _relatar(self, nome, resultado):
+        self.stdout.write(
+            f"  {nome:<48} {resultado.segundos:>7.2f}s  listados={resultado.listados:<6} "
+            f"baixados={resultado.baixados:<6} mantidos={resultado.mantidos:<6} podados={resultado.podados:<5} "
+            f"{resultado.objetos_por_segundo:>7.0f} obj/s  {resultado.mb_por_segundo:>6.1f} MB/s"
+        )
+        if resultado.erros:
+            self.stderr.write(f"    ❌ {len(resultado.erros)} erros, ex.: {resultado.erros[0]}")
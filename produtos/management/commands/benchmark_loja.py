@@ -0,0 +1,366 @@
+import json
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from produtos import catalogo_sintetico
+
+CENARIOS = ("home", "categoria", "detalhe", "adicionar_carrinho", "ver_carrinho", "checkout")
+ADICOES_POR_VISITANTE = 10  # depois disso o agente vira um visitante novo (carrinho vazio)
+METRICAS_LIMITE = ("p50_ms", "p95_ms", "p99_ms", "consultas", "alocacoes_kb")
+
+
+class AgenteCliente:
+    """Visitante em processo, pelo django.test.Client (mede consultas e alocações)."""
+
+    def __init__(self):
+        self.client = Client(HTTP_HOST="localhost")
+
+    def get(self, caminho):
+        return self.client.get(caminho).status_code
+
+    def post(self, caminho, dados):
+        return self.client.post(caminho, dados).status_code
+
+    def entrar(self, usuario):
+        self.client.force_login(usuario)
+
+    def reiniciar(self):
+        self.client.cookies.clear()
+
+
+class AgenteHttp:
+    """Visitante de verdade contra um servidor rodando (requests), com cookies e CSRF."""
+
+    def __init__(self, base):
+        import requests
+
+        self.base = base.rstrip("/")
+        self.sessao = requests.Session()
+
+    def get(self, caminho):
+        return self.sessao.get(self.base + caminho, allow_redirects=False).status_code
+
+    def post(self, caminho, dados):
+        # Páginas com formulário precisam do token CSRF do cookie
+        token = self.sessao.cookies.get("csrftoken")
+        cabecalhos = {"X-CSRFToken": token, "Referer": self.base + caminho} if token else {}
+        return self.sessao.post(self.base + caminho, data=dados, headers=cabecalhos,
+                                allow_redirects=False).status_code
+
+    def entrar(self, usuario):
+        # Mesma sessão que o force_login cria, gravada no banco/cache de sessões
+        client = Client(HTTP_HOST="localhost")
+        client.force_login(usuario)
+        for nome, morsel in client.cookies.items():
+            self.sessao.cookies.set(nome, morsel.value)
+
+    def reiniciar(self):
+        self.sessao.cookies.clear()
+
+
+class Cenarios:
+    """Cada cenário: preparar(agente) fora da medição e executar(agente) medido."""
+
+    def __init__(self, catalogo, usuario, rnd):
+        self.produtos = catalogo["produtos"]
+        self.categorias = catalogo["categorias"]
+        self.usuario = usuario
+        self.rnd = rnd
+        self.adicoes = {}
+
+    def _produto(self):
+        slug, variacao_id = self.rnd.choice(self.produtos)
+        dados = {"produto_slug": slug, "quantidade": 1}
+        if variacao_id:
+            dados["variacao_id"] = variacao_id
+        return dados
+
+    def _adicionar(self, agente):
+        return agente.post(reverse("carrinho:adicionar_ao_carrinho_ajax"), self._produto())
+
+    def preparar(self, nome, agente):
+        if nome == "adicionar_carrinho":
+            self.adicoes[id(agente)] = self.adicoes.get(id(agente), 0) + 1
+            if self.adicoes[id(agente)] % ADICOES_POR_VISITANTE == 0:
+                agente.reiniciar()
+        elif nome == "ver_carrinho":
+            self._adicionar(agente)
+        elif nome == "checkout":
+            self._adicionar(agente)
+            agente.get(reverse("pedidos:checkout"))  # cookie CSRF no modo HTTP
+
+    def executar(self, nome, agente):
+        if nome == "home":
+            return agente.get(reverse("home"))
+        if nome == "categoria":
+            return agente.get(reverse("listar_categoria", args=[self.rnd.choice(self.categorias)]))
+        if nome == "detalhe":
+            return agente.get(reverse("detalhe_produto", args=[self.rnd.choice(self.produtos)[0]]))
+        if nome == "adicionar_carrinho":
+            return self._adicionar(agente)
+        if nome == "ver_carrinho":
+            return agente.get(reverse("carrinho:ver_carrinho"))
+        if nome == "checkout":
+            return agente.post(reverse("pedidos:checkout"), {"nome": "Cliente Carga", "telefone": "41999990000"})
+        raise CommandError(f"Cenário desconhecido: {nome}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Semeia um catálogo sintético e mede a latência (p50/p95/p99), as consultas e as "
+        "alocações por requisição das páginas principais da loja, pelo test client ou por "
+        "HTTP contra um servidor rodando. Falha se algum limite de regressão for excedido."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categorias", type=int, default=8)
+        parser.add_argument("--produtos", type=int, default=2000)
+        parser.add_argument("--variacoes", type=int, default=3, help="Variações por produto que usa variações")
+        parser.add_argument("--fracao-variacoes", type=float, default=0.3)
+        parser.add_argument("--fracao-promocoes", type=float, default=0.2)
+        parser.add_argument("--imagens", type=int, default=2, help="Imagens de galeria por produto")
+        parser.add_argument("--semente", type=int, default=42)
+        parser.add_argument("--cenarios", default=",".join(CENARIOS),
+                            help="Separados por vírgula: " + ", ".join(CENARIOS))
+        parser.add_argument("--requisicoes", type=int, default=50, help="Requisições medidas por cenário")
+        parser.add_argument("--aquecimento", type=int, default=5, help="Requisições descartadas por cenário")
+        parser.add_argument("--amostras-memoria", type=int, default=5,
+                            help="Requisições por cenário repetidas com tracemalloc (fora da medição de tempo)")
+        parser.add_argument("--http", metavar="URL", help="Mede por HTTP contra um servidor já rodando nesta URL")
+        parser.add_argument("--threads", type=int, default=4, help="Visitantes simultâneos no modo --http")
+        parser.add_argument("--sem-semear", action="store_true",
+                            help="Usa um catálogo sintético já gravado (semeado antes com --manter)")
+        parser.add_argument("--manter", action="store_true", help="Não desfaz/remove o catálogo gerado")
+        parser.add_argument("--limites", metavar="ARQUIVO",
+                            help='JSON {"cenario" ou "*": {"p95_ms": 80, "consultas": 10, ...}}')
+        parser.add_argument("--salvar", metavar="ARQUIVO", help="Grava o relatório em JSON (base para --comparar)")
+        parser.add_argument("--comparar", metavar="ARQUIVO", help="Relatório JSON de referência")
+        parser.add_argument("--tolerancia", type=float, default=20.0,
+                            help="Piora aceita em relação a --comparar, em %% (padrão: 20)")
+
+    def handle(self, *args, **options):
+        cenarios = [c.strip() for c in options["cenarios"].split(",") if c.strip()]
+        invalidos = set(cenarios) - set(CENARIOS)
+        if invalidos:
+            raise CommandError(f"Cenário(s) desconhecido(s): {', '.join(sorted(invalidos))}")
+        limites = self._ler_json(options["limites"]) if options["limites"] else {}
+        base = self._ler_json(options["comparar"]) if options["comparar"] else None
+
+        self.stdout.write(
+            f"🏁 Benchmark da loja: {connection.vendor}, "
+            + (f"HTTP em {options['http']} ({options['threads']} threads)" if options["http"] else "test client")
+        )
+        if options["http"]:
+            # O servidor só enxerga dados gravados: aqui não dá para desfazer numa transação
+            relatorio = self._executar_http(cenarios, options)
+        else:
+            with transaction.atomic():
+                relatorio = self._executar_cliente(cenarios, options)
+                if not options["manter"]:
+                    transaction.set_rollback(True)
+            if not options["manter"]:
+                catalogo_sintetico.invalidar_caches()
+                self.stdout.write("🧹 Catálogo gerado desfeito.")
+
+        self._imprimir(relatorio)
+        if options["salvar"]:
+            with open(options["salvar"], "w", encoding="utf-8") as arquivo:
+                json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"💾 Relatório salvo em {options['salvar']}")
+
+        violacoes = self._violacoes(relatorio, limites, base, options["tolerancia"])
+        if violacoes:
+            for violacao in violacoes:
+                self.stderr.write(self.style.ERROR(f"❌ {violacao}"))
+            raise CommandError(f"{len(violacoes)} limite(s) de desempenho excedido(s).")
+        if limites or base:
+            self.stdout.write(self.style.SUCCESS("✅ Dentro dos limites."))
+
+    # -------------------------------------
+    # Preparação
+    # -------------------------------------
+    def _catalogo(self, options):
+        if options["sem_semear"]:
+            catalogo = catalogo_sintetico.carregar()
+        else:
+            inicio = time.perf_counter()
+            catalogo = catalogo_sintetico.semear(
+                categorias=options["categorias"], produtos=options["produtos"], variacoes=options["variacoes"],
+                fracao_variacoes=options["fracao_variacoes"], fracao_promocoes=options["fracao_promocoes"],
+                imagens=options["imagens"], semente=options["semente"],
+            )
+            self.stdout.write(
+                f"📦 {len(catalogo['produtos'])} produto(s) em {len(catalogo['categorias'])} categoria(s) "
+                f"semeados em {time.perf_counter() - inicio:.1f}s"
+            )
+        if not catalogo["produtos"] or not catalogo["categorias"]:
+            raise CommandError("Catálogo sintético vazio (use sem --sem-semear, ou semeie antes com --manter).")
+        return catalogo
+
+    def _usuario(self):
+        from django.contrib.auth import get_user_model
+
+        usuario, criado = get_user_model().objects.get_or_create(
+            email="carga@benchmark.local", defaults={"nome_completo": "Cliente Carga"}
+        )
+        if criado:
+            usuario.set_unusable_password()
+            usuario.save(update_fields=["password"])
+        return usuario
+
+    # -------------------------------------
+    # Execução
+    # -------------------------------------
+    def _executar_cliente(self, cenarios, options):
+        catalogo = self._catalogo(options)
+        roteiro = Cenarios(catalogo, self._usuario(), random.Random(options["semente"]))
+        relatorio = {}
+        for nome in cenarios:
+            agente = AgenteCliente()
+            if nome == "checkout":
+                agente.entrar(roteiro.usuario)
+            for _ in range(options["aquecimento"]):
+                roteiro.preparar(nome, agente)
+                roteiro.executar(nome, agente)
+
+            tempos, consultas, status = [], [], []
+            for _ in range(options["requisicoes"]):
+                roteiro.preparar(nome, agente)
+                with CaptureQueriesContext(connection) as capturadas:
+                    inicio = time.perf_counter()
+                    status.append(roteiro.executar(nome, agente))
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+                consultas.append(len(capturadas))
+
+            alocacoes = []
+            tracemalloc.start()
+            try:
+                for _ in range(options["amostras_memoria"]):
+                    roteiro.preparar(nome, agente)
+                    tracemalloc.reset_peak()
+                    antes = tracemalloc.get_traced_memory()[0]
+                    roteiro.executar(nome, agente)
+                    alocacoes.append((tracemalloc.get_traced_memory()[1] - antes) / 1024)
+            finally:
+                tracemalloc.stop()
+
+            relatorio[nome] = self._resumir(tempos, status, consultas, alocacoes)
+        return relatorio
+
+    def _executar_http(self, cenarios, options):
+        if not options["sem_semear"]:
+            with transaction.atomic():
+                catalogo = self._catalogo(options)
+        else:
+            catalogo = self._catalogo(options)
+        usuario = self._usuario()
+        relatorio = {}
+        try:
+            for nome in cenarios:
+                por_thread = max(options["requisicoes"] // options["threads"], 1)
+                aquecimento = options["aquecimento"]
+                lock = threading.Lock()
+                tempos, status = [], []
+
+                def visitante(indice):
+                    # Cada thread é um visitante, com o próprio roteiro (random não é thread-safe)
+                    roteiro = Cenarios(catalogo, usuario, random.Random(options["semente"] + indice))
+                    agente = AgenteHttp(options["http"])
+                    if nome == "checkout":
+                        agente.entrar(usuario)
+                    locais_t, locais_s = [], []
+                    for i in range(aquecimento + por_thread):
+                        roteiro.preparar(nome, agente)
+                        inicio = time.perf_counter()
+                        codigo = roteiro.executar(nome, agente)
+                        if i >= aquecimento:
+                            locais_t.append((time.perf_counter() - inicio) * 1000)
+                            locais_s.append(codigo)
+                    with lock:
+                        tempos.extend(locais_t)
+                        status.extend(locais_s)
+
+                inicio = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options["threads"]) as executor:
+                    list(executor.map(visitante, range(options["threads"])))
+                duracao = time.perf_counter() - inicio
+                relatorio[nome] = self._resumir(tempos, status)
+                relatorio[nome]["req_s"] = round(len(tempos) / duracao, 1) if duracao else None
+        finally:
+            if not options["manter"] and not options["sem_semear"]:
+                from pedidos.models import Pedido
+
+                Pedido.objects.filter(cliente=usuario).delete()
+                usuario.delete()
+                catalogo_sintetico.remover()
+                self.stdout.write("🧹 Catálogo, pedidos e cliente gerados removidos.")
+        return relatorio
+
+    def _resumir(self, tempos, status, consultas=None, alocacoes=None):
+        percentis = statistics.quantiles(tempos, n=100) if len(tempos) > 1 else tempos * 99
+        return {
+            "requisicoes": len(tempos),
+            "erros": sum(1 for codigo in status if codigo >= 400),
+            "p50_ms": round(percentis[49], 2),
+            "p95_ms": round(percentis[94], 2),
+            "p99_ms": round(percentis[98], 2),
+            "consultas": round(statistics.mean(consultas), 1) if consultas else None,
+            "consultas_max": max(consultas) if consultas else None,
+            "alocacoes_kb": round(statistics.median(alocacoes), 1) if alocacoes else None,
+        }
+
+    # -------------------------------------
+    # Relatório e limites
+    # -------------------------------------
+    def _imprimir(self, relatorio):
+        self.stdout.write(
+            f"\n{'cenário':<20} {'req':>5} {'erros':>6} {'p50':>9} {'p95':>9} {'p99':>9} "
+            f"{'consultas':>10} {'alocações':>11}"
+        )
+        for nome, r in relatorio.items():
+            consultas = f"{r['consultas']:.1f}" if r["consultas"] is not None else "-"
+            alocacoes = f"{r['alocacoes_kb']:.0f} KB" if r["alocacoes_kb"] is not None else "-"
+            self.stdout.write(
+                f"{nome:<20} {r['requisicoes']:>5} {r['erros']:>6} {r['p50_ms']:>7.2f}ms "
+                f"{r['p95_ms']:>7.2f}ms {r['p99_ms']:>7.2f}ms {consultas:>10} {alocacoes:>11}"
+            )
+
+    def _violacoes(self, relatorio, limites, base, tolerancia):
+        violacoes = []
+        for nome, r in relatorio.items():
+            if r["erros"]:
+                violacoes.append(f"{nome}: {r['erros']} resposta(s) com erro (4xx/5xx)")
+            proprios = {**limites.get("*", {}), **limites.get(nome, {})}
+            for metrica, limite in proprios.items():
+                if metrica not in METRICAS_LIMITE:
+                    raise CommandError(f"Métrica desconhecida em --limites: {metrica}")
+                if r.get(metrica) is not None and r[metrica] > limite:
+                    violacoes.append(f"{nome}: {metrica} {r[metrica]} > limite {limite}")
+            referencia = (base or {}).get(nome)
+            if not referencia:
+                continue
+            for metrica in METRICAS_LIMITE:
+                atual, antes = r.get(metrica), referencia.get(metrica)
+                if atual is None or antes is None:
+                    continue
+                teto = antes * (1 + tolerancia / 100)
+                if atual > teto:
+                    violacoes.append(f"{nome}: {metrica} {atual} > {teto:.2f} (referência {antes})")
+        return violacoes
+
+    def _ler_json(self, caminho):
+        try:
+            with open(caminho, encoding="utf-8") as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError) as erro:
+            raise CommandError(f"Não foi possível ler {caminho}: {erro}")
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+
+from core import s3
+from core.cache import metricas
+from core.cache_disco import cache_disco
+
+
+def _mb(valor):
+    return f"{valor / 1024 / 1024:.1f} MB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Mostra o tamanho do cache local de mídia (MEDIA_ROOT), o aproveitamento e as remoções por LRU; "
+        "com --reconciliar/--podar, também faz a manutenção"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reconciliar", action="store_true",
+                            help="Põe no índice os arquivos do disco que não estão nele (espelho, cópias manuais)")
+        parser.add_argument("--podar", action="store_true", help="Aplica o limite de tamanho agora")
+        parser.add_argument("--limite-mb", type=int, default=None,
+                            help="Limite para --podar (padrão: MIDIA_CACHE_LIMITE_MB)")
+
+    def handle(self, *args, **options):
+        if options["reconciliar"]:
+            adicionados, removidos = cache_disco.reconciliar()
+            self.stdout.write(f"🔄 Índice reconciliado: {adicionados} arquivos adicionados, {removidos} removidos.")
+
+        if options["podar"]:
+            limite = options["limite_mb"] * 1024 * 1024 if options["limite_mb"] is not None else None
+            if not s3.bucket():
+                self.stdout.write("⚠️ S3 não configurado: nada é removido do disco (não haveria de onde trazer de volta).")
+            resultado = cache_disco.podar(limite=limite)
+            self.stdout.write(
+                f"🧹 Poda: {resultado.arquivos} arquivos ({_mb(resultado.bytes)}) removidos, "
+                f"{resultado.protegidos} aguardando envio ao S3 mantidos."
+            )
+
+        dados = cache_disco.estatisticas()
+        limite = _mb(dados["limite"]) if dados["limite"] else "sem limite"
+        uso = f" ({dados['bytes'] / dados['limite'] * 100:.0f}%)" if dados["limite"] else ""
+        self.stdout.write(f"💾 Cache de mídia: {dados['arquivos']} arquivos, {_mb(dados['bytes'])} de {limite}{uso}")
+        self.stdout.write(f"   Índice: {cache_disco.caminho_indice}")
+
+        midia = metricas.relatorio().get("midia", {})
+        hits, misses = midia.get("hit", 0), midia.get("miss", 0)
+        taxa = hits / (hits + misses) * 100 if hits + misses else 0
+        self.stdout.write(
+            f"🎯 Acertos no disco: {hits} · faltas: {misses} · aproveitamento={taxa:.1f}% · "
+            f"downloads_s3={midia.get('download', 0)}"
+        )
+        self.stdout.write(
+            f"🗑️ Remoções (LRU): {dados['evicoes']} arquivos, {_mb(dados['bytes_evictados'])} no total · "
+            f"{len(cache_disco.protegidos())} protegidos (envio pendente)"
+        )
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from core.cache import metricas
+
+
+class Command(BaseCommand):
+    help = "Mostra hits/misses do cache compartilhado por namespace (soma de todos os workers)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--zerar",
+            action="store_true",
+            help="Zera os contadores depois de exibir"
+        )
+
+    def handle(self, *args, **options):
+        backend = settings.CACHES["default"]["BACKEND"].rsplit(".", 1)[-1]
+        self.stdout.write(f"📊 Backend de cache: {backend}")
+
+        relatorio = metricas.relatorio()
+        if not relatorio:
+            self.stdout.write("Nenhuma métrica registrada ainda.")
+            return
+
+        for namespace, valores in sorted(relatorio.items()):
+            consultas = valores["hit"] + valores["miss"] + valores["stale"]
+            taxa = (valores["hit"] + valores["stale"]) / consultas * 100 if consultas else 0
+            self.stdout.write(
+                f"  {namespace:<12} hits={valores['hit']:<8} misses={valores['miss']:<8} "
+                f"stale={valores['stale']:<6} recalculos={valores['recalculo']:<6} "
+                f"esperas={valores['espera']:<6} aproveitamento={taxa:.1f}%"
+            )
+            if valores["download"] or valores["ausente"]:
+                # Mídia (core/storages.py): idas ao S3 por falta do arquivo no disco local
+                self.stdout.write(
+                    f"  {'':<12} downloads_s3={valores['download']:<6} ausentes_no_s3={valores['ausente']:<6}"
+                )
+
+        if options["zerar"]:
+            metricas.zerar()
+            self.stdout.write(self.style.SUCCESS("✅ Contadores zerados."))
@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import imagens, tarefas_imagens
+
+# (model, campo) de todas as imagens enviadas pelo admin
+CAMPOS_IMAGEM = (
+    ('produtos.Produto', 'imagem'),
+    ('produtos.Variacao', 'imagem'),
+    ('produtos.ImagemProduto', 'imagem'),
+    ('produtos.Banner', 'imagem'),
+    ('produtos.Banner', 'imagem_mobile'),
+)
+
+
+def nomes_existentes():
+    """Nomes (no storage) de todas as imagens cadastradas, sem repetição."""
+    from django.apps import apps
+
+    nomes = set()
+    for rotulo, campo in CAMPOS_IMAGEM:
+        model = apps.get_model(rotulo)
+        valores = model.objects.exclude(**{f'{campo}__isnull': True}).exclude(**{campo: ''})
+        nomes.update(valores.values_list(campo, flat=True))
+    return sorted(n for n in nomes if imagens.deve_gerar(n))
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera agora os derivados responsivos (thumb/card/zoom) das imagens na fila, num pool de processos; "
+        "com --backfill, enfileira antes todas as imagens já cadastradas. No dia a dia a fila é "
+        "consumida pelo próprio processo web"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backfill", action="store_true",
+                            help="Enfileira as imagens de Produto, Variacao, ImagemProduto e Banner")
+        parser.add_argument("--forcar", action="store_true",
+                            help="Com --backfill: refaz mesmo os derivados que já estão em dia")
+        parser.add_argument("--processos", type=int, default=getattr(settings, "IMAGENS_PROCESSOS", None),
+                            help="Processos no pool (padrão: um por núcleo; 0 roda neste processo)")
+        parser.add_argument("--lote", type=int, default=tarefas_imagens.LOTE, help="Imagens por lote")
+        parser.add_argument("--reprocessar-falhas", action="store_true",
+                            help="Devolve à fila as imagens que esgotaram as tentativas")
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        if options["reprocessar_falhas"]:
+            self.stdout.write(f"🔁 {tarefas_imagens.reprocessar_falhas()} imagens com falha de volta à fila.")
+
+        if options["backfill"]:
+            nomes = nomes_existentes()
+            for nome in nomes:
+                tarefas_imagens.agendar(nome, forcar=options["forcar"])
+            self.stdout.write(f"📥 {len(nomes)} imagens cadastradas enfileiradas.")
+
+        total = {"tarefas": 0, "geradas": 0, "replicadas": 0, "em_dia": 0, "falhas": 0, "segundos": 0.0}
+        with tarefas_imagens.consumidor() as livre:
+            if not livre:
+                self.stdout.write("⏳ Outro processo deste servidor já consome a fila; ele processa o que foi enfileirado.")
+                return
+
+            while True:
+                pendentes = tarefas_imagens.prontas()
+                if not pendentes:
+                    break
+
+                lote = pendentes[:options["lote"]]
+                self.stdout.write(f"🖼️ Processando {len(lote)} de {len(pendentes)} imagens na fila...")
+                resultado = tarefas_imagens.processar(lote, processos=options["processos"], progresso=self._progresso)
+
+                for campo in total:
+                    total[campo] += getattr(resultado, campo)
+                self.stdout.write(
+                    f"   {resultado.geradas} geradas, {resultado.replicadas} replicadas (mesmo conteúdo), "
+                    f"{resultado.em_dia} já em dia, {resultado.ausentes} ausentes, {resultado.falhas} falhas · "
+                    f"{resultado.segundos:.1f}s · {resultado.por_segundo:.1f} img/s"
+                )
+
+        if total["tarefas"]:
+            por_segundo = total["tarefas"] / total["segundos"] if total["segundos"] else 0.0
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {total['tarefas']} imagens: {total['geradas']} geradas, {total['replicadas']} replicadas, "
+                f"{total['em_dia']} já em dia, {total['falhas']} falhas · {por_segundo:.1f} img/s"
+            ))
+        else:
+            self.stdout.write("✅ Nenhuma imagem pendente.")
+
+        adiadas = [t for t in tarefas_imagens.tarefas() if t["falhou"]]
+        if adiadas:
+            self.stderr.write(f"❌ {len(adiadas)} imagens esgotaram as tentativas (--reprocessar-falhas para repetir).")
+
+    def _progresso(self, resultado):
+        if self.verbosity > 1:
+            feitas = resultado.geradas + resultado.replicadas + resultado.falhas
+            self.stdout.write(f"   … {feitas}/{resultado.tarefas}")
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from produtos.estoque import anotar_estoque_esperado, recalcular_estoque
+from produtos.api import invalidar_catalogo
+from produtos.sugestoes import invalidar_indice
+from produtos.models import Produto
+
+
+class Command(BaseCommand):
+    help = "Recalcula em lote Produto.estoque_total / Produto.tem_estoque e relata divergências"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Apenas relata as divergências, sem gravar nada"
+        )
+        parser.add_argument(
+            "--limite",
+            type=int,
+            default=20,
+            help="Quantidade máxima de produtos divergentes listados no relatório"
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        limite = options["limite"]
+
+        self.stdout.write("🔎 Comparando estoque desnormalizado com produtos/variações...")
+
+        divergentes = anotar_estoque_esperado(Produto.objects.all()).filter(
+            ~Q(estoque_total=F("estoque_total_calc")) | ~Q(tem_estoque=F("tem_estoque_calc"))
+        ).order_by("id")
+
+        total = divergentes.count()
+        for p in divergentes.values(
+            "id", "slug", "estoque_total", "estoque_total_calc", "tem_estoque", "tem_estoque_calc"
+        )[:limite]:
+            self.stdout.write(
+                f"⚠️ #{p['id']} {p['slug']}: estoque_total {p['estoque_total']} → {p['estoque_total_calc']}, "
+                f"tem_estoque {p['tem_estoque']} → {p['tem_estoque_calc']}"
+            )
+        if total > limite:
+            self.stdout.write(f"... e mais {total - limite} produto(s).")
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f"🧪 Dry-run: {total} produto(s) divergente(s), nada foi gravado."))
+            return
+
+        with transaction.atomic():
+            atualizados = recalcular_estoque()
+        invalidar_indice()
+        invalidar_catalogo()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Estoque recalculado! {atualizados} produtos processados, {total} estavam divergentes."
+            )
+        )
+
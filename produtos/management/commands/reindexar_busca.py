@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from produtos.busca import motor, reindexar
+from produtos.cards import invalidar_listagens
+
+
+class Command(BaseCommand):
+    help = "Recalcula o índice de busca textual de todos os produtos (tsvector no PostgreSQL, FTS5 no SQLite)"
+
+    def handle(self, *args, **options):
+        atual = motor()
+        if atual == "icontains":
+            self.stdout.write(self.style.WARNING(
+                "⚠️ Banco sem índice de busca (rode as migrações); a busca usa icontains."
+            ))
+            return
+
+        self.stdout.write(f"🔎 Reindexando a busca ({atual})...")
+        inicio = time.perf_counter()
+        with transaction.atomic():
+            total = reindexar()
+        invalidar_listagens()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {total} produto(s) indexado(s) em {time.perf_counter() - inicio:.1f}s."
+        ))
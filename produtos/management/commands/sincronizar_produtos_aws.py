@@ -1,11 +1,17 @@
-from django.core.management.base import BaseCommand
-from django.conf import settings
-import boto3
 import os
-from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import s3
+from core.espelho_s3 import EspelhoS3
+
 
 class Command(BaseCommand):
-    help = "Baixa imagens do S3 e mantém cache local atualizado em /media/produtos/"
+    help = (
+        "Espelha as imagens do S3 no cache local (/media/produtos/ por padrão): listagem paginada, "
+        "downloads em paralelo e comparação por ETag/tamanho com um manifesto local"
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -13,66 +19,50 @@ class Command(BaseCommand):
             action="store_true",
             help="Força re-download de todos os arquivos, ignorando cache local"
         )
+        parser.add_argument("--prefixo", default="media/produtos/", help="Prefixo no bucket")
+        parser.add_argument("--threads", type=int, default=8, help="Downloads em paralelo")
+        parser.add_argument("--prune", action="store_true", help="Apaga arquivos locais que não existem mais no S3")
+        parser.add_argument("--dry-run", action="store_true", help="Só mostra o que seria baixado/apagado")
 
     def handle(self, *args, **options):
-        force = options["force"]
-
-        self.stdout.write("🔄 Iniciando sincronização de imagens S3 → cache local...")
-
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_S3_REGION_NAME,
-        )
-
-        bucket = settings.AWS_STORAGE_BUCKET_NAME
-        prefix = "media/produtos/"
-        local_dir = os.path.join(settings.MEDIA_ROOT, "produtos")
-        print(f"📁 Baixando arquivos de: s3://{bucket}/{prefix}")
-        print(f"📂 Salvando localmente em: {local_dir}")
+        bucket = s3.bucket()
+        if not bucket:
+            raise CommandError("S3 não configurado (AWS_STORAGE_BUCKET_NAME ou AWS_S3_LOCAL).")
 
+        prefixo = options["prefixo"]
+        relativo = prefixo[len("media/"):] if prefixo.startswith("media/") else prefixo
+        local_dir = os.path.join(settings.MEDIA_ROOT, *filter(None, relativo.split("/")))
+        simular = options["dry_run"]
 
-        os.makedirs(local_dir, exist_ok=True)
-        atualizados = 0
-        mantidos = 0
-
-        response = s3.list_objects_v2(Bucket=bucket, Prefix=prefix)
-
-        for obj in response.get("Contents", []):
-            key = obj["Key"]
-            if key.endswith("/"):
-                continue  # pula diretórios virtuais
-
-            filename = os.path.basename(key)
-            local_path = os.path.join(local_dir, filename)
-
-            # Se o modo --force está ativo, baixa tudo novamente
-            if force:
-                s3.download_file(bucket, key, local_path)
-                atualizados += 1
-                self.stdout.write(f"⬇️ (forçado) Atualizado: {filename}")
-                continue
-
-            # Data de modificação no S3 em UTC
-            s3_time = obj["LastModified"].astimezone(timezone.utc)
+        self.stdout.write("🔄 Iniciando sincronização de imagens S3 → cache local...")
+        self.stdout.write(f"📁 Origem: s3://{bucket}/{prefixo}")
+        self.stdout.write(f"📂 Destino: {local_dir} ({options['threads']} threads)")
+        if simular:
+            self.stdout.write("🧪 --dry-run: nada será alterado.")
 
-            # Se o arquivo local já existe, compara timestamps
-            if os.path.exists(local_path):
-                local_mtime = os.path.getmtime(local_path)
-                local_dt = datetime.fromtimestamp(local_mtime, tz=timezone.utc)
+        verbose = options["verbosity"] > 1 or simular
 
-                if s3_time <= local_dt:
-                    mantidos += 1
-                    continue  # já está atualizado
+        def progresso(chave, acao):
+            if verbose:
+                self.stdout.write(f"{'⬇️ ' if acao == 'baixar' else '🗑️ '} {acao}: {chave}")
 
-            # Baixa o arquivo atualizado
-            s3.download_file(bucket, key, local_path)
-            atualizados += 1
-            self.stdout.write(f"⬇️ Atualizado: {filename}")
+        espelho = EspelhoS3(local_dir, prefixo=prefixo, threads=options["threads"])
+        resultado = espelho.sincronizar(
+            forcar=options["force"], podar=options["prune"], simular=simular, progresso=progresso,
+        )
 
+        for chave, erro in resultado.erros:
+            self.stderr.write(f"❌ Erro ao baixar {chave}: {erro}")
         self.stdout.write(
             self.style.SUCCESS(
-                f"✅ Cache sincronizado! {atualizados} arquivos baixados, {mantidos} mantidos."
+                f"✅ Cache sincronizado! {resultado.listados} objetos no S3: "
+                f"{resultado.baixados} {'a baixar' if simular else 'baixados'}, {resultado.mantidos} mantidos, "
+                f"{resultado.podados} {'a apagar' if simular else 'apagados'}, {len(resultado.erros)} erros."
             )
         )
+        self.stdout.write(
+            f"⏱️ {resultado.segundos:.2f}s · {resultado.objetos_por_segundo:.0f} objetos/s · "
+            f"{resultado.bytes_baixados / 1024 / 1024:.1f} MB a {resultado.mb_por_segundo:.1f} MB/s"
+        )
+        if resultado.erros:
+            raise CommandError(f"{len(resultado.erros)} arquivos não foram baixados.")
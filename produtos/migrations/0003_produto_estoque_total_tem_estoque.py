@@ -0,0 +1,55 @@
+# Generated by Django 5.2.7 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+def preencher_estoque(apps, schema_editor):
+    Produto = apps.get_model('produtos', 'Produto')
+    Variacao = apps.get_model('produtos', 'Variacao')
+    from django.db.models import Case, Exists, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+    from django.db.models.functions import Coalesce
+
+    soma_variacoes = Subquery(
+        Variacao.objects.filter(produto=OuterRef('pk'))
+        .values('produto')
+        .annotate(total=Sum('estoque'))
+        .values('total'),
+        output_field=IntegerField(),
+    )
+    Produto.objects.update(estoque_total=Case(
+        When(usa_variacoes=True, then=Coalesce(soma_variacoes, Value(0))),
+        default=F('estoque'),
+        output_field=IntegerField(),
+    ))
+    Produto.objects.update(tem_estoque=Case(
+        When(
+            Q(estoque__gt=0) | Exists(Variacao.objects.filter(produto=OuterRef('pk'), estoque__gt=0)),
+            then=Value(True),
+        ),
+        default=Value(False),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0002_categoria_show_in_header'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='estoque_total',
+            field=models.IntegerField(default=0, editable=False, help_text='Estoque do produto ou soma das variações (se usa variações).'),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='tem_estoque',
+            field=models.BooleanField(default=False, editable=False, help_text='Verdadeiro se o produto ou alguma variação tem estoque.'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['disponivel', 'tem_estoque', '-id'], name='produto_vitrine_idx'),
+        ),
+        migrations.RunPython(preencher_estoque, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.7 on 2026-10-17 10:00
+
+import unicodedata
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Congelados aqui: a migração não depende de produtos.busca, que pode mudar depois
+TABELA_FTS = 'produtos_busca_fts'
+CONFIG = 'portuguese'
+LOTE = 500
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.lower().split())
+
+
+def _documentos(Produto):
+    """(id, nome, extra, descricao) normalizados de todos os produtos."""
+    produtos = Produto.objects.select_related('categoria').prefetch_related('variacoes').order_by('pk')
+    for produto in produtos.iterator(chunk_size=LOTE):
+        extras = [produto.categoria.nome if produto.categoria_id else '']
+        for variacao in produto.variacoes.all():
+            extras.extend(v for v in (variacao.cor, variacao.tamanho, variacao.outro) if v)
+        yield produto.pk, _normalizar(produto.nome), _normalizar(' '.join(extras)), _normalizar(produto.descricao)
+
+
+def criar_indice_busca(apps, schema_editor):
+    # O índice depende do banco, por isso não está em Produto.Meta.indexes:
+    # GIN sobre o tsvector no PostgreSQL, tabela FTS5 no SQLite.
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX produto_busca_gin ON produtos_produto USING gin (busca_documento)'
+        )
+        sql = (
+            'UPDATE produtos_produto SET busca_documento = '
+            "setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, %s), 'B') || "
+            "setweight(to_tsvector(%s::regconfig, %s), 'D') "
+            'WHERE id = %s'
+        )
+        linhas = ((CONFIG, nome, CONFIG, extra, CONFIG, descricao, pk)
+                  for pk, nome, extra, descricao in _documentos(apps.get_model('produtos', 'Produto')))
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {TABELA_FTS} USING fts5("
+            f"nome, extra, descricao, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        sql = f'INSERT INTO {TABELA_FTS} (rowid, nome, extra, descricao) VALUES (%s, %s, %s, %s)'
+        linhas = _documentos(apps.get_model('produtos', 'Produto'))
+    else:
+        return
+
+    with connection.cursor() as cursor:
+        lote = []
+        for linha in linhas:
+            lote.append(linha)
+            if len(lote) >= LOTE:
+                cursor.executemany(sql, lote)
+                lote = []
+        if lote:
+            cursor.executemany(sql, lote)
+
+
+def remover_indice_busca(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS produto_busca_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABELA_FTS}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0003_produto_estoque_total_tem_estoque'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='busca_documento',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(criar_indice_busca, remover_indice_busca),
+    ]
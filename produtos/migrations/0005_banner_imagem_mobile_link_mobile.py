@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produtos', '0004_produto_busca_documento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='banner',
+            name='imagem_mobile',
+            field=models.ImageField(blank=True, help_text='Versão otimizada para celular', null=True, upload_to='banners/mobile/'),
+        ),
+        migrations.AddField(
+            model_name='banner',
+            name='link_mobile',
+            field=models.URLField(blank=True, help_text='Link opcional apenas para o banner mobile', null=True),
+        ),
+        migrations.AlterField(
+            model_name='banner',
+            name='imagem',
+            field=models.ImageField(blank=True, null=True, upload_to='banners/'),
+        ),
+        migrations.AlterField(
+            model_name='banner',
+            name='link',
+            field=models.URLField(blank=True, help_text='Link opcional para o banner (versão desktop)', null=True),
+        ),
+    ]
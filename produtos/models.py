@@ -2,11 +2,21 @@ from django.db import models
 from django.templatetags.static import static
 from django.utils import timezone
 from django.conf import settings
-from django.core.files.storage import default_storage
+from django.contrib.postgres.search import SearchVectorField
 from decimal import Decimal
-import boto3
 import os
 
+from core import imagens
+
+
+def _url_imagem(arquivo, size=None):
+    """URL do derivado `size` (thumb, card, zoom) da imagem, ou do original se ainda não há."""
+    if size:
+        derivado = imagens.url(arquivo.name, size)
+        if derivado:
+            return derivado
+    return arquivo.url
+
 
 # ======================
 # CATEGORIA
@@ -80,57 +90,77 @@ class Produto(models.Model):
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
 
+    # 📦 Estoque desnormalizado (mantido por produtos.estoque)
+    estoque_total = models.IntegerField(
+        default=0,
+        editable=False,
+        help_text="Estoque do produto ou soma das variações (se usa variações)."
+    )
+    tem_estoque = models.BooleanField(
+        default=False,
+        editable=False,
+        help_text="Verdadeiro se o produto ou alguma variação tem estoque."
+    )
+
+    # 🔎 Documento de busca (tsvector no PostgreSQL; mantido por produtos.busca)
+    busca_documento = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['disponivel', 'tem_estoque', '-id'], name='produto_vitrine_idx'),
+        ]
+
     def save(self, *args, **kwargs):
-        # Sua lógica existente de renomeação/busca no S3 (mantida)
-        if self.imagem and hasattr(self.imagem, "name"):
+        from produtos.estoque import calcular_estoque
+        self.estoque_total, self.tem_estoque = calcular_estoque(self)
+
+        # Renomeia só a imagem recém-enviada (ainda não gravada no storage);
+        # as já gravadas mantêm o nome e o save não toca no storage
+        if self.imagem and hasattr(self.imagem, "name") and not self.imagem._committed:
             ext = os.path.splitext(self.imagem.name)[1].lower()
             novo_nome = f"{self.slug}{ext}"
             caminho_final = f"produtos/{novo_nome}"
 
+            # O storage acrescenta o hash do conteúdo (produtos/<slug>.<hash>.<ext>):
+            # a imagem nova ganha URL nova e a anterior, ainda referenciada por
+            # páginas em cache, continua no ar
             if self.imagem.name != novo_nome:
-                if default_storage.exists(caminho_final):
-                    default_storage.delete(caminho_final)
                 self.imagem.name = novo_nome
                 print(f"🖼️ Imagem renomeada automaticamente para: {caminho_final}")
 
         elif not self.imagem:
-            # Tenta buscar no S3 (mantida)
-            s3 = boto3.client(
-                's3',
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=settings.AWS_S3_REGION_NAME,
-            )
-            bucket = settings.AWS_STORAGE_BUCKET_NAME
-            possible_keys = [
-                f"media/produtos/{self.slug}.jpg",
-                f"media/produtos/{self.slug}.png",
-                f"media/produtos/{self.slug}.jpeg",
-            ]
-            for key in possible_keys:
-                try:
-                    s3.head_object(Bucket=bucket, Key=key)
-                    self.imagem.name = key.replace("media/", "")
+            # Vincula media/produtos/<slug>.<ext> se existir no S3: consulta ao
+            # índice em memória das chaves (core/indice_s3.py), sem ida à rede
+            from core.indice_s3 import indice_produtos
+            for ext in (".jpg", ".png", ".jpeg"):
+                key = f"media/produtos/{self.slug}{ext}"
+                if indice_produtos.contem(key):
+                    self.imagem.name = key.replace("media/", "", 1)
                     print(f"📸 Imagem encontrada e vinculada automaticamente: {key}")
                     break
-                except s3.exceptions.ClientError:
-                    continue
 
         super().save(*args, **kwargs)
         
     # 🎯 NOVO MÉTODO CENTRAL: Define qual URL de imagem principal usar
-    def get_imagem_url(self):
+    def get_imagem_url(self, size=None):
         """
         Retorna a URL da imagem principal. Prioriza: 1. URL Externa, 2. Imagem S3, 3. Placeholder.
+        Com `size` ('thumb', 'card', 'zoom'), a versão reduzida da imagem S3 (core/imagens.py).
         """
         if self.imagem_url_externa:
             return self.imagem_url_externa
         if self.imagem:
-            return self.imagem.url
+            return _url_imagem(self.imagem, size)
         
         # Retorna o placeholder estático
         return static('img/placeholder.png')
 
+    def get_imagem_srcset(self, formato='webp'):
+        """srcset com os derivados da imagem principal; '' para URL externa ou sem derivados."""
+        if self.imagem_url_externa or not self.imagem:
+            return ''
+        return imagens.srcset(self.imagem.name, formato)
+
 
     def valor_parcela_3x(self):
         """Retorna o valor da parcela em 3x com ajuste de 0.8872."""
@@ -141,7 +171,19 @@ class Produto(models.Model):
     def __str__(self):
         return self.nome
 
+    def get_preco_vigente(self):
+        """Preço e promoção ativa vindos da tabela materializada (produtos.precos)."""
+        from produtos.precos import obter_tabela
+        if not self.pk:
+            return None
+        return obter_tabela().get(self)
+
     def get_preco_final(self):
+        vigente = self.get_preco_vigente()
+        if vigente is not None:
+            return vigente.preco_final
+
+        # Fallback: instância com preço ainda não salvo
         preco = Decimal(self.preco)
         promo_ativa = None
         for promo in self.promocoes.all():
@@ -158,6 +200,9 @@ class Produto(models.Model):
 
     def get_estoque_total(self):
         if self.usa_variacoes:
+            # Evita consulta extra quando as variações não foram pré-carregadas
+            if 'variacoes' not in getattr(self, '_prefetched_objects_cache', {}):
+                return self.estoque_total
             return sum(v.estoque for v in self.variacoes.all())
         return self.estoque
 
@@ -282,7 +327,7 @@ class Variacao(models.Model):
             variacoes.append(self.outro)
         return f"{self.produto.nome} - {' / '.join(variacoes) or 'Única'}"
 
-    def get_imagem_url(self):
+    def get_imagem_url(self, size=None):
         """
         Retorna a URL da imagem da variação, priorizando a URL externa.
         Ordem de prioridade:
@@ -297,15 +342,22 @@ class Variacao(models.Model):
 
         # 2️⃣ Imagem local
         if self.imagem and hasattr(self.imagem, "url"):
-            return self.imagem.url
+            return _url_imagem(self.imagem, size)
 
         # 3️⃣ Imagem do produto (fallback)
         if hasattr(self.produto, "imagem") and self.produto.imagem:
-            return self.produto.imagem.url
+            return _url_imagem(self.produto.imagem, size)
 
         # 4️⃣ Imagem placeholder
         return static("img/placeholder.png")
 
+    def get_imagem_srcset(self, formato='webp'):
+        if self.imagem_url_externa:
+            return ''
+        if self.imagem:
+            return imagens.srcset(self.imagem.name, formato)
+        return self.produto.get_imagem_srcset(formato) if self.produto_id else ''
+
     def save(self, *args, **kwargs):
         """
         Renomeia automaticamente a imagem local e mantém compatibilidade com URLs externas.
@@ -324,14 +376,13 @@ class Variacao(models.Model):
             if self.produto else f"variacao-{self.pk}"
         )
 
-        # CASO 1: imagem local enviada manualmente
-        if self.imagem and hasattr(self.imagem, "name"):
+        # CASO 1: imagem local recém-enviada (o storage acrescenta o hash do
+        # conteúdo ao nome; imagens já gravadas mantêm o nome)
+        if self.imagem and hasattr(self.imagem, "name") and not self.imagem._committed:
             ext = os.path.splitext(self.imagem.name)[1].lower()
             novo_nome = f"media/produtos/variacoes/{base_name}{ext}"
 
             if self.imagem.name != novo_nome:
-                if default_storage.exists(novo_nome):
-                    default_storage.delete(novo_nome)
                 self.imagem.name = novo_nome
                 print(f"🎨 Imagem de variação renomeada automaticamente: {novo_nome}")
 
@@ -381,7 +432,7 @@ class ImagemProduto(models.Model):
     def __str__(self):
         return f"Imagem de {self.produto.nome} - Ordem {self.ordem}"
 
-    def get_imagem_url(self):
+    def get_imagem_url(self, size=None):
         """
         Retorna a URL da imagem, priorizando externa > local > placeholder.
         Evita erro se não houver arquivo associado.
@@ -391,12 +442,17 @@ class ImagemProduto(models.Model):
 
         if self.imagem and getattr(self.imagem, 'name', None):
             try:
-                return self.imagem.url
+                return _url_imagem(self.imagem, size)
             except ValueError:
                 pass
 
         return static('img/placeholder.png')
 
+    def get_imagem_srcset(self, formato='webp'):
+        if self.imagem_url_externa or not getattr(self.imagem, 'name', None):
+            return ''
+        return imagens.srcset(self.imagem.name, formato)
+
 
 
 
@@ -0,0 +1,160 @@
+# produtos/precos.py
+"""
+Motor de preços vigentes.
+
+Materializa, em uma tabela em memória indexada pelo id do produto, o preço
+final de cada produto e a promoção ativa (com início e fim). A tabela é
+reconstruída quando um Produto/Promocao é salvo ou removido e quando o relógio
+cruza a próxima fronteira de promoção (início ou fim de alguma promoção).
+"""
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from django.utils import timezone
+
+from core.cache import CacheNamespace
+
+cache_precos = CacheNamespace('precos')
+
+# Por quanto tempo (s) a versão lida do cache compartilhado vale neste processo:
+# get_preco_final roda por card, e cada leitura seria uma ida ao Redis
+VERSAO_TTL = 2
+
+PrecoVigente = namedtuple(
+    'PrecoVigente',
+    ['preco_base', 'preco_final', 'promocao_id', 'titulo', 'data_inicio', 'data_fim'],
+)
+
+
+class TabelaPrecos:
+    """Tabela imutável {produto_id: PrecoVigente} válida até `valido_ate`."""
+
+    def __init__(self, precos, valido_ate, versao):
+        self.precos = precos
+        self.valido_ate = valido_ate
+        self.versao = versao
+
+    def get(self, produto):
+        """
+        Retorna o PrecoVigente do produto (instância ou id).
+        Se a instância tiver um preço diferente do materializado (ex.: edição
+        ainda não salva), devolve None para o chamador recalcular.
+        """
+        produto_id = getattr(produto, 'pk', produto)
+        entrada = self.precos.get(produto_id)
+        if entrada is None:
+            return None
+        preco = getattr(produto, 'preco', None)
+        if preco is not None and Decimal(preco) != entrada.preco_base:
+            return None
+        return entrada
+
+    def expirada(self, agora):
+        return self.valido_ate is not None and agora >= self.valido_ate
+
+    def __len__(self):
+        return len(self.precos)
+
+
+def construir_tabela(agora=None):
+    """Monta a tabela com duas consultas: preços dos produtos e promoções relevantes."""
+    from produtos.models import Produto, Promocao
+    from django.db.models import Q
+
+    agora = agora or timezone.now()
+
+    promocoes = (
+        Promocao.objects.filter(ativo=True)
+        .filter(Q(data_fim__isnull=True) | Q(data_fim__gte=agora))
+        .order_by('-data_inicio')
+        .values_list(
+            'id', 'produto_id', 'titulo', 'desconto_percentual',
+            'valor_desconto', 'data_inicio', 'data_fim',
+        )
+    )
+
+    ativas = {}
+    fronteiras = []
+    for promo_id, produto_id, titulo, percentual, valor, inicio, fim in promocoes:
+        if inicio > agora:
+            # Promoção futura: o início dela é uma fronteira
+            fronteiras.append(inicio)
+            continue
+        if fim:
+            # O instante imediatamente após o fim também é fronteira
+            fronteiras.append(fim)
+        # Mesma regra de Produto.get_preco_final: a mais recente vigente vence
+        ativas.setdefault(produto_id, Promocao(
+            id=promo_id, produto_id=produto_id, titulo=titulo,
+            desconto_percentual=percentual, valor_desconto=valor,
+            data_inicio=inicio, data_fim=fim,
+        ))
+
+    precos = {}
+    for produto_id, preco in Produto.objects.values_list('id', 'preco').iterator():
+        preco = Decimal(preco)
+        promo = ativas.get(produto_id)
+        if promo:
+            precos[produto_id] = PrecoVigente(
+                preco, promo.aplicar_desconto(preco), promo.id,
+                promo.titulo, promo.data_inicio, promo.data_fim,
+            )
+        else:
+            precos[produto_id] = PrecoVigente(preco, preco, None, None, None, None)
+
+    return precos, min(fronteiras) if fronteiras else None
+
+
+_lock = threading.Lock()
+_tabela = None
+_versao = (None, 0.0)  # (versão, quando foi lida - monotonic)
+
+
+def _versao_atual():
+    """Versão da tabela no cache compartilhado, relida no máximo a cada VERSAO_TTL segundos."""
+    global _versao
+    versao, lida_em = _versao
+    if versao is None or time.monotonic() - lida_em >= VERSAO_TTL:
+        versao = cache_precos.versao()
+        _versao = (versao, time.monotonic())
+    return versao
+
+
+def obter_tabela():
+    """
+    Retorna a tabela de preços atual, reconstruindo-a se foi invalidada
+    (neste processo na hora; em outro, via versão no cache, em até
+    VERSAO_TTL segundos) ou se uma promoção começou/terminou desde a última
+    montagem.
+    """
+    global _tabela
+    agora = timezone.now()
+    versao = _versao_atual()
+    tabela = _tabela
+    if tabela is not None and tabela.versao == versao and not tabela.expirada(agora):
+        return tabela
+
+    with _lock:
+        tabela = _tabela
+        if tabela is None or tabela.versao != versao or tabela.expirada(agora):
+            precos, valido_ate = construir_tabela(agora)
+            tabela = _tabela = TabelaPrecos(precos, valido_ate, versao)
+    return tabela
+
+
+def invalidar_tabela(**kwargs):
+    """Descarta a tabela local e avisa os demais processos incrementando a versão."""
+    global _tabela, _versao
+    _tabela = None
+    _versao = (cache_precos.avancar_versao(), time.monotonic())
+
+
+def conectar_sinais():
+    from django.db.models.signals import post_save, post_delete
+    from produtos.models import Produto, Promocao
+
+    for model in (Produto, Promocao):
+        post_save.connect(invalidar_tabela, sender=model, dispatch_uid=f'precos_save_{model.__name__}')
+        post_delete.connect(invalidar_tabela, sender=model, dispatch_uid=f'precos_delete_{model.__name__}')
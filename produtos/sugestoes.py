@@ -0,0 +1,282 @@
+# produtos/sugestoes.py
+"""
+Sugestões de busca (autocompletar) servidas de um índice em memória.
+
+O índice é uma lista ordenada de chaves normalizadas (sem acentos, minúsculas):
+para cada produto da vitrine e cada categoria, o nome a partir de cada uma das
+primeiras palavras ('batom vermelho paixao', 'vermelho paixao', 'paixao').
+Um prefixo vira um bisect + uma varredura curta, sem SQL; o preço vem da
+tabela de preços vigentes (produtos.precos), também em memória.
+
+Cada processo monta o seu índice (na inicialização, via aquecer(), ou no
+primeiro uso). Alterações em Produto/Variacao/Categoria avançam a versão no
+cache compartilhado e deixam lá a lista dos objetos alterados; ao notar a
+versão nova, cada processo recarrega só esses objetos. Se o histórico não
+estiver completo (expirou, muitas versões), reconstrói tudo.
+"""
+import logging
+import threading
+from bisect import bisect_left
+
+from django.db import DatabaseError, transaction
+
+from core.cache import CacheNamespace
+from produtos.busca import normalizar
+
+logger = logging.getLogger(__name__)
+
+cache_sugestoes = CacheNamespace('sugestoes', timeout=60 * 60)
+
+LIMITE = 10              # sugestões por resposta
+PALAVRAS_INDEXADAS = 6   # posições de início indexadas por nome
+VARREDURA_MAXIMA = 400   # chaves examinadas por prefixo
+HISTORICO_MAXIMO = 200   # versões atrasadas que ainda valem atualização incremental
+
+PRODUTO = 'produto'
+CATEGORIA = 'categoria'
+
+
+class IndiceSugestoes:
+    """
+    Índice imutável: `chaves` ordenadas, `alvos[i]` = (tipo, id, posição da palavra)
+    da chave i, e os dados de exibição de cada produto/categoria.
+    Atualizações devolvem um novo índice; quem já leu o antigo segue com ele.
+    """
+
+    def __init__(self, produtos, categorias, versao):
+        self.produtos = produtos        # {id: (nome, slug, imagem)}
+        self.categorias = categorias    # {id: (nome, slug)}
+        self.versao = versao
+        entradas = sorted(
+            [e for pk, dados in produtos.items() for e in _entradas(PRODUTO, pk, dados[0])]
+            + [e for pk, dados in categorias.items() for e in _entradas(CATEGORIA, pk, dados[0])]
+        )
+        self.chaves = [chave for chave, _ in entradas]
+        self.alvos = [alvo for _, alvo in entradas]
+
+    def atualizar(self, produtos, categorias, removidos, versao):
+        """
+        Novo índice com os produtos/categorias dados substituídos (ou incluídos)
+        e os de `removidos` ({(tipo, id)}) fora.
+        """
+        novo = IndiceSugestoes.__new__(IndiceSugestoes)
+        novo.produtos = dict(self.produtos)
+        novo.categorias = dict(self.categorias)
+        novo.versao = versao
+
+        trocados = set(removidos) | {(PRODUTO, pk) for pk in produtos} | {(CATEGORIA, pk) for pk in categorias}
+        for tipo, pk in trocados:
+            (novo.produtos if tipo == PRODUTO else novo.categorias).pop(pk, None)
+        novo.produtos.update(produtos)
+        novo.categorias.update(categorias)
+
+        entradas = [
+            (chave, alvo) for chave, alvo in zip(self.chaves, self.alvos)
+            if (alvo[0], alvo[1]) not in trocados
+        ]
+        for tipo, dados in ((PRODUTO, produtos), (CATEGORIA, categorias)):
+            for pk, (nome, *_) in dados.items():
+                entradas.extend(_entradas(tipo, pk, nome))
+        # Quase ordenada: o timsort intercala as novas em tempo linear
+        entradas.sort()
+        novo.chaves = [chave for chave, _ in entradas]
+        novo.alvos = [alvo for _, alvo in entradas]
+        return novo
+
+    def sugerir(self, texto, limite=LIMITE):
+        """
+        [(tipo, id)] das melhores sugestões para o prefixo `texto`: primeiro o
+        que começa pelo prefixo, depois o que tem uma palavra começando por ele;
+        categorias antes de produtos e nomes curtos antes de longos.
+        """
+        prefixo = normalizar(texto)
+        if not prefixo:
+            return []
+        melhores = {}
+        inicio = bisect_left(self.chaves, prefixo)
+        for i in range(inicio, min(inicio + VARREDURA_MAXIMA, len(self.chaves))):
+            chave = self.chaves[i]
+            if not chave.startswith(prefixo):
+                break
+            tipo, pk, posicao = self.alvos[i]
+            alvo = (tipo, pk)
+            if posicao < melhores.get(alvo, (PALAVRAS_INDEXADAS,))[0]:
+                nome = (self.produtos if tipo == PRODUTO else self.categorias)[pk][0]
+                melhores[alvo] = (posicao, tipo != CATEGORIA, len(nome), nome)
+        return sorted(melhores, key=melhores.get)[:limite]
+
+    def __len__(self):
+        return len(self.chaves)
+
+
+def _entradas(tipo, pk, nome):
+    palavras = normalizar(nome).split()
+    return [
+        (' '.join(palavras[posicao:]), (tipo, pk, posicao))
+        for posicao in range(min(len(palavras), PALAVRAS_INDEXADAS))
+    ]
+
+
+# -------------------------------------
+# Carga a partir do banco
+# -------------------------------------
+def _carregar_produtos(ids=None):
+    from produtos.models import Produto
+
+    produtos = Produto.objects.filter(disponivel=True, tem_estoque=True).only(
+        'id', 'nome', 'slug', 'imagem', 'imagem_url_externa'
+    )
+    if ids is not None:
+        produtos = produtos.filter(pk__in=ids)
+    return {p.pk: (p.nome, p.slug, p.get_imagem_url()) for p in produtos.iterator(chunk_size=2000)}
+
+
+def _carregar_categorias(ids=None):
+    from produtos.models import Categoria
+
+    categorias = Categoria.objects.all()
+    if ids is not None:
+        categorias = categorias.filter(pk__in=ids)
+    return {pk: (nome, slug) for pk, nome, slug in categorias.values_list('id', 'nome', 'slug')}
+
+
+def construir_indice(versao):
+    return IndiceSugestoes(_carregar_produtos(), _carregar_categorias(), versao)
+
+
+_lock = threading.Lock()
+_indice = None
+
+
+def obter_indice():
+    """
+    Índice deste processo, em dia com a versão do cache compartilhado: aplica
+    as alterações registradas desde a versão local ou, se faltar histórico,
+    reconstrói tudo. Quando nada mudou custa uma leitura de cache.
+    """
+    global _indice
+    versao = cache_sugestoes.versao()
+    indice = _indice
+    if indice is not None and indice.versao == versao:
+        return indice
+
+    with _lock:
+        indice = _indice
+        if indice is not None and indice.versao == versao:
+            return indice
+        alteracoes = _alteracoes_desde(indice.versao, versao) if indice is not None else None
+        if alteracoes is None:
+            indice = construir_indice(versao)
+        else:
+            produto_ids = {pk for tipo, pk in alteracoes if tipo == PRODUTO}
+            categoria_ids = {pk for tipo, pk in alteracoes if tipo == CATEGORIA}
+            produtos = _carregar_produtos(produto_ids) if produto_ids else {}
+            categorias = _carregar_categorias(categoria_ids) if categoria_ids else {}
+            indice = indice.atualizar(produtos, categorias, alteracoes, versao)
+        _indice = indice
+    return indice
+
+
+def _alteracoes_desde(local, atual):
+    """{(tipo, id)} alterados entre as versões, ou None se o histórico não cobre o intervalo."""
+    if atual < local or atual - local > HISTORICO_MAXIMO:
+        return None
+    versoes = [f'alteracoes:{v}' for v in range(local + 1, atual + 1)]
+    registros = cache_sugestoes.get_many(versoes)
+    if len(registros) != len(versoes):
+        return None
+    return {tuple(alvo) for alvos in registros.values() for alvo in alvos}
+
+
+def aquecer():
+    """Monta o índice na inicialização do processo; sem banco pronto, fica para o primeiro uso."""
+    try:
+        return len(obter_indice())
+    except DatabaseError:
+        logger.warning('Índice de sugestões não montado na inicialização', exc_info=True)
+        return 0
+
+
+def registrar_alteracoes(alvos):
+    """Anota [(tipo, id)] alterados numa nova versão, para todos os processos."""
+    alvos = sorted(set(alvos))
+    if not alvos:
+        return
+    versao = cache_sugestoes.avancar_versao()
+    cache_sugestoes.set(f'alteracoes:{versao}', alvos)
+
+
+def invalidar_indice(**kwargs):
+    """Versão nova sem histórico: todos os processos reconstroem o índice inteiro."""
+    global _indice
+    _indice = None
+    cache_sugestoes.avancar_versao()
+
+
+def registrar_produtos(produto_ids):
+    registrar_alteracoes((PRODUTO, pk) for pk in produto_ids)
+
+
+# -------------------------------------
+# Consulta
+# -------------------------------------
+def sugerir(texto, limite=LIMITE):
+    """Lista de dicionários prontos para o JSON do autocompletar."""
+    from django.urls import reverse
+    from produtos.precos import obter_tabela
+
+    indice = obter_indice()
+    tabela = None
+    resultado = []
+    for tipo, pk in indice.sugerir(texto, limite):
+        if tipo == CATEGORIA:
+            nome, slug = indice.categorias[pk]
+            resultado.append({
+                'tipo': CATEGORIA,
+                'nome': nome,
+                'slug': slug,
+                'url': reverse('listar_categoria', args=[slug]),
+            })
+            continue
+        nome, slug, imagem = indice.produtos[pk]
+        tabela = tabela or obter_tabela()
+        vigente = tabela.get(pk)
+        resultado.append({
+            'tipo': PRODUTO,
+            'nome': nome,
+            'slug': slug,
+            'url': reverse('detalhe_produto', args=[slug]),
+            'preco': f'{vigente.preco_final:.2f}' if vigente else None,
+            'imagem': imagem,
+        })
+    return resultado
+
+
+# -------------------------------------
+# Sinais
+# -------------------------------------
+def _produto_alterado(sender, instance, **kwargs):
+    alvo = [(PRODUTO, instance.pk)]
+    transaction.on_commit(lambda: registrar_alteracoes(alvo))
+
+
+def _variacao_alterada(sender, instance, **kwargs):
+    # A variação muda o estoque do produto, que decide se ele aparece
+    if instance.produto_id:
+        alvo = [(PRODUTO, instance.produto_id)]
+        transaction.on_commit(lambda: registrar_alteracoes(alvo))
+
+
+def _categoria_alterada(sender, instance, **kwargs):
+    alvo = [(CATEGORIA, instance.pk)]
+    transaction.on_commit(lambda: registrar_alteracoes(alvo))
+
+
+def conectar_sinais():
+    from django.db.models.signals import post_save, post_delete
+    from produtos.models import Categoria, Produto, Variacao
+
+    for model, receptor in ((Produto, _produto_alterado), (Variacao, _variacao_alterada),
+                            (Categoria, _categoria_alterada)):
+        post_save.connect(receptor, sender=model, dispatch_uid=f'sugestoes_save_{model.__name__}')
+        post_delete.connect(receptor, sender=model, dispatch_uid=f'sugestoes_delete_{model.__name__}')
@@ -0,0 +1,23 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def imagem_url(objeto, tamanho):
+    """
+    URL da imagem de um Produto/Variacao/ImagemProduto no tamanho pedido
+    ('thumb', 'card', 'zoom'); cai no original enquanto não há derivados.
+    Uso: {{ produto|imagem_url:'card' }}
+    """
+    return objeto.get_imagem_url(size=tamanho)
+
+
+@register.filter
+def imagem_srcset(objeto, formato='webp'):
+    """
+    srcset com todas as larguras dos derivados ('' se não há).
+    Uso: <source type="image/webp" srcset="{{ produto|imagem_srcset }}">
+         <img srcset="{{ produto|imagem_srcset:'jpg' }}" ...>
+    """
+    return objeto.get_imagem_srcset(formato)
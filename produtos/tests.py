@@ -1,3 +1,444 @@
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.paginacao import codificar_cursor
+from produtos import busca, cards, precos, sugestoes
+from produtos.estoque import EstoqueInsuficiente, recalcular_estoque, reservar_estoque
+from produtos.models import Categoria, Produto, Promocao, Variacao
+
+
+def criar_produto(categoria, slug, preco='100.00', **kwargs):
+    # bulk_create pula o Produto.save(): sem recálculo de estoque nem vínculo de imagem pelo índice do S3
+    return Produto.objects.bulk_create([Produto(
+        categoria=categoria, nome=slug, slug=slug, descricao='', preco=Decimal(preco), **kwargs
+    )])[0]
+
+
+class TabelaPrecosTests(TestCase):
+    def setUp(self):
+        precos.invalidar_tabela()
+        self.categoria = Categoria.objects.create(nome='Perfumes', slug='perfumes')
+        self.produto = criar_produto(self.categoria, 'perfume-a')
+
+    def test_sem_promocao_preco_final_igual_ao_preco(self):
+        vigente = precos.obter_tabela().get(self.produto)
+        self.assertEqual(vigente.preco_final, Decimal('100.00'))
+        self.assertIsNone(vigente.promocao_id)
+
+    def test_promocao_vigente_aplica_desconto_e_invalida_no_save(self):
+        tabela = precos.obter_tabela()
+        promo = Promocao.objects.create(
+            produto=self.produto, titulo='Black Friday', desconto_percentual=Decimal('10'),
+            data_inicio=timezone.now() - timedelta(hours=1),
+            data_fim=timezone.now() + timedelta(hours=1),
+        )
+        self.assertIsNot(precos.obter_tabela(), tabela)
+        vigente = precos.obter_tabela().get(self.produto)
+        self.assertEqual(vigente.preco_final, Decimal('90.00'))
+        self.assertEqual(vigente.promocao_id, promo.id)
+        self.assertEqual(self.produto.get_preco_final(), Decimal('90.00'))
+
+    def test_promocao_futura_define_proxima_fronteira(self):
+        inicio = timezone.now() + timedelta(days=1)
+        Promocao.objects.create(
+            produto=self.produto, titulo='Amanhã', valor_desconto=Decimal('5'), data_inicio=inicio,
+        )
+        tabela = precos.obter_tabela()
+        self.assertEqual(tabela.valido_ate, inicio)
+        self.assertEqual(tabela.get(self.produto).preco_final, Decimal('100.00'))
+
+        precos_amanha, _ = precos.construir_tabela(agora=inicio + timedelta(minutes=1))
+        self.assertEqual(precos_amanha[self.produto.id].preco_final, Decimal('95.00'))
+
+    def test_preco_nao_salvo_usa_calculo_direto(self):
+        self.produto.preco = Decimal('50.00')
+        self.assertIsNone(precos.obter_tabela().get(self.produto))
+        self.assertEqual(self.produto.get_preco_final(), Decimal('50.00'))
+
+    def test_versao_compartilhada_lida_no_maximo_uma_vez_por_intervalo(self):
+        precos.obter_tabela()
+        with mock.patch.object(precos.cache_precos, 'versao', wraps=precos.cache_precos.versao) as versao:
+            for _ in range(48):
+                precos.obter_tabela()
+            self.assertEqual(versao.call_count, 0)
+
+            # Outro processo invalidou: visto depois de VERSAO_TTL
+            precos.cache_precos.avancar_versao()
+            with mock.patch('produtos.precos.time.monotonic', return_value=time.monotonic() + precos.VERSAO_TTL):
+                tabela = precos.obter_tabela()
+            self.assertEqual(versao.call_count, 1)
+            self.assertEqual(tabela.versao, precos.cache_precos.versao())
+
+    def test_listagem_consulta_tabela_sem_queries_por_produto(self):
+        for i in range(5):
+            criar_produto(self.categoria, f'perfume-{i}')
+        tabela = precos.obter_tabela()
+        produtos = list(Produto.objects.all())
+        with self.assertNumQueries(0):
+            for p in produtos:
+                tabela.get(p).preco_final
+
+
+class EstoqueDesnormalizadoTests(TestCase):
+    def setUp(self):
+        self.categoria = Categoria.objects.create(nome='Bolsas', slug='bolsas')
+        self.produto = criar_produto(self.categoria, 'bolsa', usa_variacoes=True)
+
+    def test_variacao_salva_atualiza_produto(self):
+        variacao = Variacao.objects.create(produto=self.produto, cor='Rosa', estoque=3)
+        Variacao.objects.create(produto=self.produto, cor='Preta', estoque=2)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_total, 5)
+        self.assertTrue(self.produto.tem_estoque)
+
+        variacao.delete()
+        Variacao.objects.filter(produto=self.produto).update(estoque=0)
+        recalcular_estoque([self.produto.pk])
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_total, 0)
+        self.assertFalse(self.produto.tem_estoque)
+
+    def test_comando_relata_e_corrige_divergencias(self):
+        Variacao.objects.bulk_create([Variacao(produto=self.produto, cor='Azul', estoque=4)])
+        saida = StringIO()
+        call_command('recalcular_estoque', '--dry-run', stdout=saida)
+        self.assertIn('1 produto(s) divergente(s)', saida.getvalue())
+        self.produto.refresh_from_db()
+        self.assertFalse(self.produto.tem_estoque)
+
+        call_command('recalcular_estoque', stdout=StringIO())
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_total, 4)
+        self.assertTrue(self.produto.tem_estoque)
+
+
+class ReservaEstoqueTests(TestCase):
+    def setUp(self):
+        self.categoria = Categoria.objects.create(nome='Bolsas', slug='bolsas')
+        self.simples = criar_produto(self.categoria, 'carteira', estoque=5, estoque_total=5, tem_estoque=True)
+        self.com_variacao = criar_produto(self.categoria, 'bolsa', usa_variacoes=True)
+        self.variacao = Variacao.objects.create(produto=self.com_variacao, cor='Rosa', estoque=2)
+
+    def test_baixa_em_lote_e_recalcula_desnormalizados(self):
+        antes = Produto.objects.get(pk=self.com_variacao.pk).atualizado_em
+        reservar_estoque(produtos={self.simples.pk: 5}, variacoes={self.variacao.pk: 1})
+
+        self.simples.refresh_from_db()
+        self.com_variacao.refresh_from_db()
+        self.assertEqual((self.simples.estoque, self.simples.estoque_total, self.simples.tem_estoque), (0, 0, False))
+        self.assertEqual(Variacao.objects.get(pk=self.variacao.pk).estoque, 1)
+        self.assertEqual(self.com_variacao.estoque_total, 1)
+        self.assertGreater(self.com_variacao.atualizado_em, antes)
+
+    def test_falta_em_uma_linha_desfaz_todas(self):
+        with self.assertRaises(EstoqueInsuficiente) as erro:
+            reservar_estoque(produtos={self.simples.pk: 1}, variacoes={self.variacao.pk: 3})
+        self.assertEqual(erro.exception.faltando[0][1:], (3, 2))
+        self.simples.refresh_from_db()
+        self.assertEqual(self.simples.estoque, 5)
+        self.assertEqual(Variacao.objects.get(pk=self.variacao.pk).estoque, 2)
+
+    def test_descricao_das_faltas_nao_consulta_por_variacao(self):
+        outra = Variacao.objects.create(produto=self.com_variacao, cor='Preta', estoque=0)
+        # savepoint, UPDATE, rollback, release + um SELECT das faltas já com o produto
+        with self.assertNumQueries(5):
+            with self.assertRaises(EstoqueInsuficiente) as erro:
+                reservar_estoque(variacoes={self.variacao.pk: 3, outra.pk: 1})
+        self.assertEqual(sorted(d for d, _, _ in erro.exception.faltando), ['bolsa - Preta', 'bolsa - Rosa'])
+
+
+class CardsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.categoria = Categoria.objects.create(nome='Maquiagem', slug='maquiagem')
+        self.produtos = [criar_produto(self.categoria, f'batom-{i}', estoque=3) for i in range(3)]
+        self.ids = [p.id for p in reversed(self.produtos)]
+
+    def test_cards_em_cache_nao_renderizam_de_novo(self):
+        primeira = cards.renderizar_cards(self.ids)
+        self.assertEqual(len(primeira), 3)
+        # versões (1 consulta) + nada mais: todos os cards vêm de um único get_many
+        with self.assertNumQueries(1):
+            segunda = cards.renderizar_cards(self.ids)
+        self.assertEqual(primeira, segunda)
+
+    def test_promocao_troca_apenas_o_card_do_produto(self):
+        cards.renderizar_cards(self.ids)
+        alvo = self.produtos[0]
+        Promocao.objects.create(
+            produto=alvo, titulo='Relâmpago', desconto_percentual=Decimal('50'),
+            data_inicio=timezone.now() - timedelta(minutes=1),
+        )
+        html = cards.renderizar_cards([alvo.id])[0]
+        self.assertIn('promo-ativo', html)
+        self.assertIn('R$ 50,00', html)
+
+    def test_esqueleto_invalidado_quando_estoque_muda(self):
+        url = reverse('listar_categoria', args=[self.categoria.slug])
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'batom-2')
+
+        novo = criar_produto(self.categoria, 'batom-novo')
+        Variacao.objects.create(produto=novo, cor='Vermelho', estoque=1)
+        self.assertContains(self.client.get(url), 'batom-novo')
+
+
+class PaginacaoPorCursorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.categoria = Categoria.objects.create(nome='Maquiagem', slug='maquiagem')
+        self.ids = [
+            criar_produto(self.categoria, f'batom-{i}', estoque=1, tem_estoque=True).pk for i in range(5)
+        ][::-1]
+        self.produtos = Produto.objects.filter(categoria=self.categoria)
+
+    def test_paginas_seguem_o_cursor_sem_offset(self):
+        primeira = cards.obter_listagem('teste', self.produtos, None, 2)
+        self.assertEqual(primeira['ids'], self.ids[:2])
+        segunda = cards.obter_listagem('teste', self.produtos, primeira['proximo'], 2)
+        self.assertEqual(segunda['ids'], self.ids[2:4])
+        ultima = cards.obter_listagem('teste', self.produtos, segunda['proximo'], 2)
+        self.assertEqual(ultima['ids'], self.ids[4:])
+        self.assertIsNone(ultima['proximo'])
+
+    def test_cursor_adulterado_volta_ao_inicio(self):
+        for cursor in ('lixo', codificar_cursor('1'), codificar_cursor(1, 2)):
+            self.assertEqual(cards.obter_listagem('teste', self.produtos, cursor, 2)['ids'], self.ids[:2])
+
+    def test_total_contado_uma_vez_por_versao(self):
+        self.assertEqual(cards.obter_total('teste', self.produtos), 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(cards.obter_total('teste', self.produtos), 5)
+
+    def test_rolagem_infinita_devolve_proxima_pagina_de_cards(self):
+        url = reverse('mais_produtos')
+        dados = self.client.get(url, {'lista': 'categoria', 'categoria': 'maquiagem'}).json()
+        self.assertEqual(len(dados['cards']), 5)
+        self.assertIsNone(dados['proximo'])
+        self.assertIn('batom-4', dados['cards'][0])
+        self.assertEqual(self.client.get(url, {'lista': 'outra'}).status_code, 400)
+
+
+class ApiCatalogoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        precos.invalidar_tabela()
+        self.categoria = Categoria.objects.create(nome='Bolsas', slug='bolsas')
+        self.bolsa = criar_produto(self.categoria, 'bolsa-tiracolo', preco='80.00', usa_variacoes=True)
+        Variacao.objects.create(produto=self.bolsa, cor='Lilás', estoque=2)
+
+    def test_lista_projeta_campos_e_preco_vigente(self):
+        Promocao.objects.create(
+            produto=self.bolsa, titulo='Relâmpago', desconto_percentual=Decimal('25'),
+            data_inicio=timezone.now() - timedelta(minutes=1),
+        )
+        dados = self.client.get(reverse('api_produtos')).json()
+        self.assertIsNone(dados['proximo'])
+        item = dados['produtos'][0]
+        self.assertEqual((item['slug'], item['categoria'], item['estoque']), ('bolsa-tiracolo', 'bolsas', 2))
+        self.assertEqual((item['preco'], item['preco_original'], item['promocao']), ('60.00', '80.00', 'Relâmpago'))
+
+    def test_if_none_match_devolve_304_sem_consultas(self):
+        url = reverse('api_produto', args=['bolsa-tiracolo'])
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.json()['variacoes'][0]['cor'], 'Lilás')
+        etag = resposta['ETag']
+        self.assertTrue(etag.startswith('"'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Variacao.objects.create(produto=self.bolsa, cor='Preta', estoque=1)
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_categoria_pagina_por_cursor_e_404(self):
+        criar_produto(self.categoria, 'bolsa-nova')
+        url = reverse('api_categoria_produtos', args=['bolsas'])
+        primeira = self.client.get(url, {'limite': 1}).json()
+        self.assertEqual([p['slug'] for p in primeira['produtos']], ['bolsa-nova'])
+        segunda = self.client.get(url, {'limite': 1, 'cursor': primeira['proximo']}).json()
+        self.assertEqual([p['slug'] for p in segunda['produtos']], ['bolsa-tiracolo'])
+        self.assertEqual(self.client.get(reverse('api_categoria_produtos', args=['nada'])).status_code, 404)
+
+
+class DetalheCondicionalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.categoria = Categoria.objects.create(nome='Perfumes', slug='perfumes')
+        self.produto = criar_produto(self.categoria, 'perfume-floral', estoque=3, tem_estoque=True)
+        self.url = reverse('detalhe_produto', args=['perfume-floral'])
+
+    def test_if_none_match_devolve_304_com_uma_consulta(self):
+        self.client.get(self.url)  # recebe o cookie CSRF, que entra na ETag
+        resposta = self.client.get(self.url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('Last-Modified', resposta)
+        with self.assertNumQueries(1):
+            repetida = self.client.get(self.url, HTTP_IF_NONE_MATCH=resposta['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+
+    def test_variacao_alterada_muda_a_etag(self):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Variacao.objects.create(produto=self.produto, cor='Rosa', estoque=1)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_inicio_e_fim_de_promocao_contam_como_modificacao(self):
+        from produtos.validadores import marca_produto
+
+        inicio = timezone.now() + timedelta(hours=1)
+        fim = inicio + timedelta(hours=1)
+        Promocao.objects.bulk_create([Promocao(
+            produto=self.produto, titulo='Noite', desconto_percentual=Decimal('10'),
+            data_inicio=inicio, data_fim=fim,
+        )])
+        atualizado_em = Produto.objects.get(pk=self.produto.pk).atualizado_em
+        self.assertEqual(marca_produto('perfume-floral', agora=inicio - timedelta(seconds=1)), atualizado_em)
+        self.assertEqual(marca_produto('perfume-floral', agora=inicio), inicio)
+        self.assertEqual(marca_produto('perfume-floral', agora=fim + timedelta(seconds=1)), fim)
+
+    def test_produto_inexistente_continua_404(self):
+        self.assertEqual(self.client.get(reverse('detalhe_produto', args=['nada'])).status_code, 404)
+
+
+class BuscaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.maquiagem = Categoria.objects.create(nome='Maquiagem', slug='maquiagem')
+        self.bolsas = Categoria.objects.create(nome='Bolsas', slug='bolsas')
+        opcoes = {'estoque': 5, 'estoque_total': 5, 'tem_estoque': True}
+        self.batom = criar_produto(self.maquiagem, 'batom-paixao', **opcoes)
+        Produto.objects.filter(pk=self.batom.pk).update(nome='Batom Matte Paixão', descricao='Acabamento aveludado')
+        self.bolsa = criar_produto(self.bolsas, 'bolsa-tiracolo', usa_variacoes=True)
+        Produto.objects.filter(pk=self.bolsa.pk).update(nome='Bolsa Tiracolo')
+        busca.reindexar()
+
+    def test_motor_do_sqlite_e_fts5(self):
+        self.assertEqual(busca.motor(), 'fts5')
+
+    def test_ignora_acentos_e_busca_em_descricao_e_categoria(self):
+        self.assertEqual(busca.buscar('PAIXAO')['ids'], [self.batom.pk])
+        self.assertEqual(busca.buscar('aveludado')['ids'], [self.batom.pk])
+        self.assertEqual(busca.buscar('maquiagem')['ids'], [self.batom.pk])
+        self.assertEqual(busca.buscar('paixão inexistente')['ids'], [])
+
+    def test_termo_parcial_casa_por_prefixo(self):
+        self.assertEqual(busca.buscar('bat')['ids'], [self.batom.pk])
+        self.assertEqual(busca.buscar('bat pai')['ids'], [self.batom.pk])
+        # O PostgreSQL recebe a mesma busca por prefixo, em sintaxe to_tsquery
+        self.assertEqual(busca.prefixos(busca.termos('Bat Paixão')), 'bat:* & paixao:*')
+
+    def test_variacao_salva_entra_no_indice(self):
+        # Sem estoque o produto não aparece na vitrine; a variação traz estoque e a cor
+        self.assertEqual(busca.buscar('lilás')['ids'], [])
+        Variacao.objects.create(produto=self.bolsa, cor='Lilás', estoque=2)
+        self.assertEqual(busca.buscar('lilas')['ids'], [self.bolsa.pk])
+
+    def test_paginacao_por_cursor_percorre_tudo_sem_repetir(self):
+        ids = {
+            criar_produto(self.maquiagem, f'batom-{i}', estoque=1, estoque_total=1, tem_estoque=True).pk
+            for i in range(5)
+        }
+        busca.reindexar()
+        vistos, cursor = [], None
+        while True:
+            pagina = busca.buscar('batom', cursor=cursor, por_pagina=2)
+            vistos.extend(pagina['ids'])
+            cursor = pagina['proximo']
+            if not cursor:
+                break
+        self.assertEqual(len(vistos), 6)
+        self.assertEqual(set(vistos), ids | {self.batom.pk})
+
+
+class SugestoesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        precos.invalidar_tabela()
+        sugestoes.invalidar_indice()
+        self.maquiagem = Categoria.objects.create(nome='Maquiagem', slug='maquiagem')
+        opcoes = {'estoque': 5, 'estoque_total': 5, 'tem_estoque': True}
+        self.paixao = criar_produto(self.maquiagem, 'batom-paixao', **opcoes)
+        self.vermelho = criar_produto(self.maquiagem, 'batom-vermelho', preco='39.90', **opcoes)
+        self.esgotado = criar_produto(self.maquiagem, 'batom-esgotado')
+        Produto.objects.filter(pk=self.paixao.pk).update(nome='Batom Matte Paixão')
+        Produto.objects.filter(pk=self.vermelho.pk).update(nome='Batom Vermelho')
+        Produto.objects.filter(pk=self.esgotado.pk).update(nome='Batom Esgotado')
+
+    def slugs(self, texto):
+        return [s['slug'] for s in sugestoes.sugerir(texto)]
+
+    def test_prefixo_no_inicio_ou_em_qualquer_palavra_sem_acentos(self):
+        self.assertEqual(self.slugs('BAT'), ['batom-vermelho', 'batom-paixao'])
+        self.assertEqual(self.slugs('paixa'), ['batom-paixao'])
+        self.assertEqual(self.slugs('matte pai'), ['batom-paixao'])
+        self.assertEqual(self.slugs('maq'), ['maquiagem'])
+        self.assertEqual(self.slugs('xyz'), [])
+
+    def test_endpoint_devolve_preco_e_url_sem_consultas(self):
+        url = reverse('sugestoes')
+        self.client.get(url, {'q': 'verm'})
+        with self.assertNumQueries(0):
+            resposta = self.client.get(url, {'q': 'verm'})
+        item = resposta.json()['sugestoes'][0]
+        self.assertEqual(item['preco'], '39.90')
+        self.assertEqual(item['url'], reverse('detalhe_produto', args=['batom-vermelho']))
+        self.assertIn('max-age=60', resposta['Cache-Control'])
+
+    def test_alteracao_atualiza_so_o_produto(self):
+        self.assertNotIn('batom-esgotado', self.slugs('bat'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Variacao.objects.create(produto=self.esgotado, cor='Nude', estoque=2)
+        # Um produto recarregado: uma consulta, sem reconstruir categorias e demais produtos
+        with self.assertNumQueries(1):
+            self.assertIn('batom-esgotado', self.slugs('esgot'))
+
+    def test_historico_perdido_reconstroi_tudo(self):
+        antigo = sugestoes.obter_indice()
+        sugestoes.registrar_produtos([self.paixao.pk])
+        sugestoes.registrar_produtos([self.vermelho.pk])
+        cache.clear()
+        cache.set(sugestoes.cache_sugestoes.chave('versao'), antigo.versao + 2)
+        self.assertIsNot(sugestoes.obter_indice(), antigo)
+        self.assertEqual(len(sugestoes.obter_indice()), len(antigo))
+
+
+class BenchmarkLojaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def executar(self, **opcoes):
+        saida = StringIO()
+        call_command(
+            'benchmark_loja', categorias=2, produtos=12, requisicoes=3, aquecimento=1, amostras_memoria=1,
+            stdout=saida, stderr=StringIO(), **opcoes
+        )
+        return saida.getvalue()
+
+    def test_todos_os_cenarios_sem_erros_e_catalogo_desfeito(self):
+        saida = self.executar()
+        for cenario in ('home', 'categoria', 'detalhe', 'adicionar_carrinho', 'ver_carrinho', 'checkout'):
+            self.assertIn(cenario, saida)
+        self.assertFalse(Produto.objects.filter(slug__startswith='carga-').exists())
 
-# Create your tests here.
+    def test_limite_excedido_falha(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as arquivo:
+            json.dump({'detalhe': {'consultas': 0}}, arquivo)
+        self.addCleanup(os.remove, arquivo.name)
+        with self.assertRaises(CommandError):
+            self.executar(cenarios='detalhe', limites=arquivo.name)
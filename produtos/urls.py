@@ -1,8 +1,15 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home, name='home'),
+    path('sugestoes/', views.sugestoes, name='sugestoes'),
+    path('vitrine/mais/', views.mais_produtos, name='mais_produtos'),
     path('produto/<slug:slug>/', views.detalhe_produto, name='detalhe_produto'),
     path('categoria/<slug:categoria_slug>/', views.listar_por_categoria, name='listar_categoria'),
+
+    # API de catálogo (JSON, somente leitura, com ETag)
+    path('api/produtos/', api.listar_produtos, name='api_produtos'),
+    path('api/produtos/<slug:slug>/', api.detalhe_produto, name='api_produto'),
+    path('api/categorias/<slug:slug>/produtos/', api.listar_produtos_categoria, name='api_categoria_produtos'),
 ]
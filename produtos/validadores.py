@@ -0,0 +1,60 @@
+# produtos/validadores.py
+"""
+Validadores HTTP (Last-Modified / ETag) da página de detalhe do produto.
+
+A marca de modificação sai de uma única consulta: o maior entre
+Produto.atualizado_em (tocado também quando uma Variacao, Promocao ou
+ImagemProduto do produto é salva/removida e em cada baixa de estoque) e os
+inícios/fins das promoções ativas que já passaram. Assim o começo ou o fim de
+uma promoção conta como modificação, sem ninguém salvar nada.
+
+O restante da página depende só dos cookies do visitante (sessão, CSRF,
+carrinho, mensagens), que entram na ETag: um 304 nunca devolve a página de
+outro estado de login ou com um token CSRF antigo.
+"""
+import hashlib
+
+from django.db.models import Max, Q
+from django.utils import timezone
+
+
+def marca_produto(slug, agora=None):
+    """Instante da última modificação visível do produto, ou None se ele não está disponível."""
+    from produtos.models import Produto
+
+    agora = agora or timezone.now()
+    promocao_ativa = Q(promocoes__ativo=True)
+    linha = (
+        Produto.objects.filter(slug=slug, disponivel=True)
+        .annotate(
+            ultimo_inicio=Max('promocoes__data_inicio', filter=promocao_ativa & Q(promocoes__data_inicio__lte=agora)),
+            ultimo_fim=Max('promocoes__data_fim', filter=promocao_ativa & Q(promocoes__data_fim__lte=agora)),
+        )
+        .values_list('atualizado_em', 'ultimo_inicio', 'ultimo_fim')
+        .first()
+    )
+    if linha is None:
+        return None
+    return max(instante for instante in linha if instante is not None)
+
+
+def _marca(request, slug):
+    # condition() pede Last-Modified e ETag separadamente: uma consulta por requisição
+    marcas = getattr(request, '_marcas_produto', None)
+    if marcas is None:
+        marcas = request._marcas_produto = {}
+    if slug not in marcas:
+        marcas[slug] = marca_produto(slug)
+    return marcas[slug]
+
+
+def ultima_modificacao(request, slug):
+    return _marca(request, slug)
+
+
+def etag_detalhe(request, slug):
+    marca = _marca(request, slug)
+    if marca is None:
+        return None
+    cookies = request.META.get('HTTP_COOKIE', '')
+    return hashlib.md5(f'{marca.isoformat()}|{cookies}'.encode('utf-8')).hexdigest()
@@ -1,92 +1,144 @@
 # produtos/views.py
-from produtos.models import Produto, Variacao, Banner, MensagemTopo
 from django.shortcuts import render
 from produtos.models import Produto
-from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Q, Exists, OuterRef
-from produtos.models import Produto, Variacao
 from decimal import Decimal
 from produtos.models import Produto, Categoria
-from django.utils import timezone
 import json
 from collections import defaultdict
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
+from produtos.validadores import etag_detalhe, ultima_modificacao
+from produtos.cards import obter_listagem, obter_total, renderizar_cards
+from produtos.busca import buscar
+from produtos.sugestoes import sugerir
+from django.http import JsonResponse
+from django.urls import reverse
+from urllib.parse import urlencode
+from django.utils.cache import patch_cache_control
+from produtos.layout import banners_ativos, mensagens_topo_ativas
+from core.consultas import orcamento_consultas
 
-@cache_page(600)
-def home(request):
-    query = request.GET.get('q', '')
+# 📜 Listagens paginadas por cursor (keyset em -id): a página 50 custa o mesmo
+# que a primeira. A home, a categoria e a rolagem infinita usam as mesmas páginas.
+POR_PAGINA_HOME = 200
+POR_PAGINA_BUSCA = 48
+POR_PAGINA_CATEGORIA = 20
+
+
+def _produtos_home():
+    # 📦 tem_estoque é mantido por produtos.estoque: a vitrine vira uma
+    # varredura no índice (disponivel, tem_estoque, -id), sem subconsulta por linha.
+    return Produto.objects.filter(disponivel=True, tem_estoque=True)
 
-    # 🛑 OTIMIZAÇÃO CRÍTICA (N+1 Solution)
-    # prefetch_related carrega promoções e variações em poucas consultas eficientes,
-    # em vez de uma consulta separada para CADA produto no loop.
-    produtos_list = Produto.objects.filter(
-        disponivel=True
-    ).filter(
-        Q(estoque__gt=0) | Exists(
-            Variacao.objects.filter(produto=OuterRef('pk'), estoque__gt=0)
-        )
-    ).prefetch_related('promocoes', 'variacoes') # <-- 2. A CHAVE DA VELOCIDADE
 
+def _produtos_categoria(categoria_slug):
+    return Produto.objects.filter(categoria__slug=categoria_slug, disponivel=True)
+
+
+def _pagina_home(query, cursor):
     if query:
-        produtos_list = produtos_list.filter(nome__icontains=query)
+        # 🔎 Busca textual indexada (nome, descrição, categoria, variações)
+        return buscar(query, cursor=cursor, por_pagina=POR_PAGINA_BUSCA)
+    return obter_listagem('home:', _produtos_home(), cursor, POR_PAGINA_HOME)
+
+
+def _pagina_categoria(categoria_slug, cursor):
+    return obter_listagem(
+        f'categoria:{categoria_slug}', _produtos_categoria(categoria_slug), cursor, POR_PAGINA_CATEGORIA
+    )
+
+
+def _links_mais(proximo_cursor, filtros_pagina, filtros_json):
+    """Links da próxima página: HTML (sem JS) e JSON da rolagem infinita."""
+    if not proximo_cursor:
+        return {}
+    filtros_pagina = {k: v for k, v in filtros_pagina.items() if v}
+    filtros_json = {k: v for k, v in filtros_json.items() if v}
+    return {
+        'url_pagina': '?' + urlencode({**filtros_pagina, 'cursor': proximo_cursor}),
+        'url_json': reverse('mais_produtos') + '?' + urlencode(filtros_json),
+    }
+
+
+# 🧩 home e categoria não usam mais cache_page: o esqueleto da listagem (ids)
+# e os cards de produto ficam em cache separadamente (ver produtos/cards.py).
+@orcamento_consultas(15)
+def home(request):
+    query = request.GET.get('q', '')
 
-    produtos_list = produtos_list.order_by('-id')
-    paginator = Paginator(produtos_list, 200)
-    page = request.GET.get('page')
-    produtos = paginator.get_page(page)
+    pagina = _pagina_home(query, request.GET.get('cursor'))
 
-    # O loop abaixo agora é RÁPIDO porque as promoções já foram pré-carregadas
-    agora = timezone.now()
-    for p in produtos:
-        # Acessar p.promocoes.all() é rápido aqui
-        p.tem_promocao = any(
-            promo.esta_vigente() for promo in p.promocoes.all()
-        )
+    # 💰 Cards prontos do cache (preço/promoção vêm da tabela de preços vigentes)
+    cards = renderizar_cards(pagina['ids'], variante='home')
 
-    # 💡 Otimização Adicional: Use .only() para Banners/Mensagens, carregando apenas campos essenciais
-    mensagens_topo = MensagemTopo.objects.filter(ativo=True).only('texto', 'ordem')
-    banners = Banner.objects.filter(ativo=True).only('titulo', 'imagem', 'imagem_mobile', 'link', 'link_mobile')
+    # 💡 Banners/Mensagens vêm do cache compartilhado (produtos/layout.py)
+    mensagens_topo = mensagens_topo_ativas()
+    banners = banners_ativos()
 
 
     return render(request, 'produtos/home.html', {
-        'produtos': produtos,
+        'cards': cards,
         'query': query,
+        'proximo_cursor': pagina['proximo'],
+        **_links_mais(pagina['proximo'], {'q': query}, {'lista': 'home', 'q': query}),
         'titulo': 'Doce & Bella E-commerce',
         # envia os dados para o template:
         'mensagens_topo': mensagens_topo,
         'banners': banners,
     })
 
+
+# --------------------------------------------------------------------------------------
+# 📜 Rolagem infinita: próxima página de cards em JSON
+# --------------------------------------------------------------------------------------
+@orcamento_consultas(8)
+def mais_produtos(request):
+    lista = request.GET.get('lista')
+    cursor = request.GET.get('cursor')
+    if lista == 'home':
+        pagina = _pagina_home(request.GET.get('q', ''), cursor)
+        variante = 'home'
+    elif lista == 'categoria' and request.GET.get('categoria'):
+        pagina = _pagina_categoria(request.GET['categoria'], cursor)
+        variante = 'categoria'
+    else:
+        return JsonResponse({'status': 'erro', 'mensagem': 'Listagem inválida.'}, status=400)
+
+    return JsonResponse({
+        'cards': [str(card) for card in renderizar_cards(pagina['ids'], variante=variante)],
+        'proximo': pagina['proximo'],
+    })
+
+# --------------------------------------------------------------------------------------
+# 🔎 Autocompletar: índice de prefixos em memória (produtos/sugestoes.py), sem SQL
+# --------------------------------------------------------------------------------------
+@orcamento_consultas(5)
+def sugestoes(request):
+    resposta = JsonResponse({'sugestoes': sugerir(request.GET.get('q', ''))})
+    # Igual para todos os visitantes: o navegador pode reaproveitar por um minuto
+    patch_cache_control(resposta, public=True, max_age=60)
+    return resposta
+
+
 # --------------------------------------------------------------------------------------
 # 🎯 OTIMIZAÇÃO 1: Listar por Categoria (N+1 Resolvido + Cache)
 # --------------------------------------------------------------------------------------
-@cache_page(600) # Cacheia a página de categoria por 10 minutos
+@orcamento_consultas(15)
 def listar_por_categoria(request, categoria_slug):
     # select_related para a categoria é RÁPIDO porque só há uma
     categoria = get_object_or_404(Categoria, slug=categoria_slug)
     
-    # 🛑 OTIMIZAÇÃO CRÍTICA AQUI: Adicionar prefetch_related para resolver N+1
-    produtos_list = Produto.objects.filter(
-        categoria=categoria, 
-        disponivel=True
-    ).prefetch_related('promocoes', 'variacoes').order_by('-id')
-
-    # Mantendo a paginação para listas grandes
-    paginator = Paginator(produtos_list, 20) # 20 itens por página é um bom padrão
-    page = request.GET.get('page')
-    produtos = paginator.get_page(page)
-
-    # O loop de promoção também é rápido agora
-    agora = timezone.now()
-    for p in produtos:
-        p.tem_promocao = any(
-            promo.esta_vigente() for promo in p.promocoes.all()
-        )
-    
+    # 🛑 Estoque e preço vêm de campos/tabelas materializados: sem prefetch por produto
+    # Páginas de 20 itens por cursor; o total é contado uma vez por versão da listagem
+    pagina = _pagina_categoria(categoria.slug, request.GET.get('cursor'))
+    cards = renderizar_cards(pagina['ids'], variante='categoria')
+
     return render(request, 'produtos/listar_categoria.html', {
         'categoria': categoria,
-        'produtos': produtos,
+        'cards': cards,
+        'total': obter_total(f'categoria:{categoria.slug}', _produtos_categoria(categoria.slug)),
+        'proximo_cursor': pagina['proximo'],
+        **_links_mais(pagina['proximo'], {}, {'lista': 'categoria', 'categoria': categoria.slug}),
         'titulo': f'{categoria.nome} | Doce & Bella'
     })
 
@@ -94,11 +146,15 @@ def listar_por_categoria(request, categoria_slug):
 # --------------------------------------------------------------------------------------
 # 🎯 OTIMIZAÇÃO 2: Detalhe do Produto (N+1 Resolvido + Cache)
 # --------------------------------------------------------------------------------------
-@cache_page(600)  # Cacheia a página de detalhes por 600 segundos (10 minutos)
+# 🕒 GET condicional: se nada mudou desde a última visita (produto, variações,
+# promoções, galeria, fronteiras de promoção e cookies do visitante), 304 com
+# uma única consulta, antes de qualquer renderização (produtos/validadores.py).
+@orcamento_consultas(15)
+@condition(etag_func=etag_detalhe, last_modified_func=ultima_modificacao)
 def detalhe_produto(request, slug):
     # 🛑 OTIMIZAÇÃO PRINCIPAL: select_related para Categoria e prefetch_related para Variações e Promoções
     produto = get_object_or_404(
-        Produto.objects.select_related('categoria').prefetch_related('variacoes', 'promocoes', 'galeria_imagens'),
+        Produto.objects.select_related('categoria').prefetch_related('variacoes', 'galeria_imagens'),
         slug=slug,
         disponivel=True
     )
@@ -136,28 +192,19 @@ def detalhe_produto(request, slug):
     valor_final = preco / Decimal('0.8872')
     valor_parcela = valor_final / Decimal('3')
 
-    # 4. PROMOÇÃO ATIVA (RÁPIDO)
-    promo_ativa = None
-    for promo in produto.promocoes.all():  # RÁPIDO!
-        if promo.esta_vigente():
-            promo_ativa = promo
-            break
+    # 4. PROMOÇÃO ATIVA (tabela de preços vigentes)
+    preco_vigente = produto.get_preco_vigente()
+    promo_ativa = preco_vigente if preco_vigente and preco_vigente.promocao_id else None
 
     # 5. PRODUTOS RELACIONADOS (SINTAXE CORRIGIDA E OTIMIZADA)
 
-    # Define o filtro de estoque dinâmico
-    estoque_disponivel_q = Q(estoque__gt=0) | Exists(
-        Variacao.objects.filter(produto=OuterRef('pk'), estoque__gt=0)
-    )
-
-    # ✅ CORREÇÃO: Q object vem antes dos argumentos nomeados
     produtos_relacionados = Produto.objects.filter(
-        estoque_disponivel_q,
         categoria=produto.categoria,
         disponivel=True,
+        tem_estoque=True,
     ).exclude(
         id=produto.id
-    ).order_by('?')[:4].prefetch_related('promocoes', 'variacoes')  # <-- OTIMIZAÇÃO
+    ).order_by('?')[:4]
 
     # Contexto
     context = {
@@ -175,7 +222,10 @@ def detalhe_produto(request, slug):
         'titulo': f'{produto.nome} | Doce & Bella',
     }
 
-    return render(request, 'produtos/detalhe_produto.html', context)
+    resposta = render(request, 'produtos/detalhe_produto.html', context)
+    # O navegador guarda a página, mas revalida sempre (barato: 304)
+    patch_cache_control(resposta, private=True, no_cache=True)
+    return resposta
 
 
 